@@ -0,0 +1,77 @@
+import asyncio
+import os
+from contextlib import asynccontextmanager
+
+# How often a waiting turn checks whether its client has gone away
+DISCONNECT_POLL_SECONDS = float(os.environ.get("AGENT_DISCONNECT_POLL", "0.5"))
+
+
+class AdmissionRejected(Exception):
+    """Raised when the admission queue is full and a request must be shed."""
+
+    def __init__(self, retry_after: int):
+        super().__init__(f"Server busy, retry after {retry_after}s")
+        self.retry_after = retry_after
+
+
+class TurnCancelled(Exception):
+    """The turn was cancelled by the client or preempted by a newer turn in the same session."""
+
+
+class AdmissionLimiter:
+    """
+    Bound the number of agent turns running concurrently on this worker.
+
+    Up to ``max_concurrency`` turns run at once and up to ``max_queue`` more
+    wait for a slot. Anything beyond that is rejected immediately with
+    AdmissionRejected so the caller can answer 503 instead of piling up.
+    """
+
+    def __init__(self, max_concurrency: int, max_queue: int, retry_after: int = 2):
+        self.max_concurrency = max_concurrency
+        self.max_queue = max_queue
+        self.retry_after = retry_after
+        self._semaphore = asyncio.Semaphore(max_concurrency)
+        self._in_flight = 0
+        self._waiting = 0
+
+    async def acquire(self):
+        if self._semaphore.locked():
+            if self._waiting >= self.max_queue:
+                raise AdmissionRejected(self.retry_after)
+            self._waiting += 1
+            try:
+                await self._semaphore.acquire()
+            finally:
+                self._waiting -= 1
+        else:
+            await self._semaphore.acquire()
+        self._in_flight += 1
+
+    def release(self):
+        self._in_flight -= 1
+        self._semaphore.release()
+
+    @asynccontextmanager
+    async def slot(self):
+        await self.acquire()
+        try:
+            yield
+        finally:
+            self.release()
+
+    def stats(self) -> dict:
+        return {
+            "in_flight": self._in_flight,
+            "waiting": self._waiting,
+            "max_concurrency": self.max_concurrency,
+            "max_queue": self.max_queue,
+        }
+
+    @classmethod
+    def from_env(cls, prefix: str = "AGENT") -> "AdmissionLimiter":
+        return cls(
+            max_concurrency=int(os.environ.get(f"{prefix}_MAX_CONCURRENCY", "8")),
+            max_queue=int(os.environ.get(f"{prefix}_MAX_QUEUE", "32")),
+            retry_after=int(os.environ.get(f"{prefix}_RETRY_AFTER", "2")),
+        )
@@ -1,45 +1,118 @@
+import asyncio
 import os
 import logging
+import time
+from typing import AsyncIterator, Awaitable, Callable, Dict, Any, Optional
 from google.adk import Agent, Runner
-from google.adk.sessions import InMemorySessionService
-from google.adk.models import Gemini
-from tools.rfam_db import execute_sql_query
-from tools.search_tool import perform_google_search
+from google.adk.agents.invocation_context import new_invocation_context_id
+from google.adk.agents.run_config import RunConfig, StreamingMode
+from google.adk.events import Event
+from google.adk.models import BaseLlm, Gemini
+from admission import DISCONNECT_POLL_SECONDS, AdmissionLimiter, TurnCancelled
+from metrics import TURN_SECONDS, model_call_timer
+from router import router
+from session_backends import session_service_from_env
+from sessions import history_window_callback
+from tools.rfam_db import execute_sql_query_async
+from tools.search_tool import perform_google_search_async, perform_google_searches
 
 # Configure logging
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
-class VoiceAgent:
+APP_NAME = "voice_bot_app"
+END_CONVERSATION_TOKEN = "[END_CONVERSATION]"
+
+
+def _event_text(event) -> str:
+    """
+    Extract the model-authored text carried by an ADK event, if any.
+    """
+    author = getattr(event, 'author', None)
+    content = getattr(event, 'content', None)
+    if not content or not author or author == 'user':
+        return ""
+    parts = getattr(content, 'parts', None) or []
+    return "".join(part.text for part in parts if getattr(part, 'text', None))
+
+
+class _EndTokenFilter:
+    """
+    Strip END_CONVERSATION_TOKEN from a stream of text deltas.
+
+    The token may be split across deltas, so any trailing text that could be
+    the start of the token is held back until the next delta (or flush).
+    """
+
     def __init__(self):
+        self.pending = ""
+        self.seen = False
+
+    def feed(self, text: str) -> str:
+        self.pending += text
+        if END_CONVERSATION_TOKEN in self.pending:
+            self.seen = True
+            self.pending = self.pending.replace(END_CONVERSATION_TOKEN, "")
+        for keep in range(min(len(END_CONVERSATION_TOKEN) - 1, len(self.pending)), 0, -1):
+            if END_CONVERSATION_TOKEN.startswith(self.pending[-keep:]):
+                out, self.pending = self.pending[:-keep], self.pending[-keep:]
+                return out
+        out, self.pending = self.pending, ""
+        return out
+
+    def flush(self) -> str:
+        out, self.pending = self.pending, ""
+        return out
+
+class VoiceAgent:
+    def __init__(self, model: Optional[BaseLlm] = None):
+        # model overrides Gemini, e.g. with the scripted model in bench/fakes.py
+        self.model = model
         self.api_key = os.environ.get("GOOGLE_API_KEY")
         if not self.api_key:
             logger.warning("GOOGLE_API_KEY not set. Agent will fail to run.")
 
         # Initialize Session Service (no app_name argument)
-        # We keep this global to persist sessions across requests
-        self.session_service = InMemorySessionService()
+        # We keep this global to persist sessions across requests; idle and
+        # least recently used sessions are evicted (see sessions.py). With
+        # SESSION_BACKEND=sqlite/redis they are shared between workers.
+        self.session_service = session_service_from_env()
 
-    def process_message(self, user_id: str, session_id: str, message: str) -> str:
+        # Model, agent and runner are built once and shared by every async
+        # turn. They must only be driven from the server's event loop (via
+        # run_async); the sync process_message builds its own runner.
+        self.runner = self._build_runner()
+        self.limiter = AdmissionLimiter.from_env()
+        # session_id -> task running that session's current turn
+        self._turns: Dict[str, asyncio.Task] = {}
+
+    def warm(self):
         """
-        Process a text message and return the text response.
+        Create the model's API client ahead of the first turn (blocking; call
+        from a worker thread).
         """
-        logger.info(f"Processing message: {message}")
-        
-        # Initialize Model, Agent, and Runner for EACH request
-        # This ensures we get a fresh HTTP client and event loop context
-        # preventing "Event loop is closed" errors
-        model = Gemini(model="gemini-2.0-flash-exp")
-        
+        model = self.runner.agent.model
+        if isinstance(model, Gemini) and self.api_key:
+            model.api_client
+
+    def _build_runner(self) -> Runner:
+        """
+        Build the Gemini model, agent and runner.
+        """
+        model = self.model or Gemini(model="gemini-2.0-flash-exp")
+
         agent = Agent(
             name="google_search_voice_bot",
             model=model,
-            tools=[perform_google_search, execute_sql_query],
+            tools=[perform_google_search_async, perform_google_searches, execute_sql_query_async],
+            # Send only recent turns, with older tool outputs collapsed
+            before_model_callback=[history_window_callback, model_call_timer.before_model],
+            after_model_callback=model_call_timer.after_model,
             instruction="""You are a helpful voice assistant with access to the Rfam public database and Google Search.
             
             Your capabilities:
-            1. **Google Search**: Use `perform_google_search` for general knowledge questions or current events.
-            2. **Rfam Database**: Use `execute_sql_query` to answer questions about RNA families.
+            1. **Google Search**: Use `perform_google_search_async` for general knowledge questions or current events. When you need several lookups, use `perform_google_searches` with all the queries at once.
+            2. **Rfam Database**: Use `execute_sql_query_async` to answer questions about RNA families.
             
             **Rfam Database Schema:**
             - **family** table:
@@ -66,7 +139,7 @@ class VoiceAgent:
             - When a user asks a question about RNA families, convert it into a valid MySQL query.
             - Use `LIKE` for text searches (e.g., `WHERE description LIKE '%keyword%'`).
             - Always limit results if not counting (e.g., `LIMIT 5`).
-            - Execute the query using `execute_sql_query`.
+            - Execute the query using `execute_sql_query_async`.
             - Summarize the results in natural language.
             
             Keep your spoken responses concise (under 20 words if possible) unless listing results.
@@ -79,23 +152,275 @@ class VoiceAgent:
             """
         )
         
-        runner = Runner(
+        return Runner(
             agent=agent,
-            app_name="voice_bot_app",
+            app_name=APP_NAME,
             session_service=self.session_service
         )
+
+    async def _ensure_session_async(self, user_id: str, session_id: str):
+        session = await self.session_service.get_session(app_name=APP_NAME, user_id=user_id, session_id=session_id)
+        if not session:
+            await self.session_service.create_session(app_name=APP_NAME, user_id=user_id, session_id=session_id)
+            logger.info(f"Created new session: {session_id}")
+
+    async def _fast_path(self, user_id: str, session_id: str, message: str) -> Optional[str]:
+        """
+        Answer closers and direct family lookups without the model (see router.py).
+
+        Returns:
+            The reply (closers include the end token), or None to run the agent.
+        """
+        started = time.perf_counter()
+        route = await asyncio.to_thread(router.classify, message)
+        router.record(message, route, time.perf_counter() - started)
+        if route.reply is None:
+            return None
+
+        # Keep the session history complete so follow-up turns have context
+        from google.genai.types import Content, Part
+        session = await self.session_service.get_session(app_name=APP_NAME, user_id=user_id, session_id=session_id)
+        invocation_id = new_invocation_context_id()
+        for author, role, text in (("user", "user", message), (self.runner.agent.name, "model", route.reply)):
+            event = Event(invocation_id=invocation_id, author=author, content=Content(role=role, parts=[Part(text=text)]))
+            await self.session_service.append_event(session, event)
+        return route.reply
+
+    async def stream_message(self, user_id: str, session_id: str, message: str) -> AsyncIterator[Dict[str, Any]]:
+        """
+        Process a text message and yield response frames as ADK events arrive.
+
+        Frames are dicts with a ``type`` key:
+            - ``text``: ``{"type": "text", "delta": str}`` incremental reply text.
+            - ``tool_start``: ``{"type": "tool_start", "name": str}`` a tool call was issued.
+            - ``tool_end``: ``{"type": "tool_end", "name": str}`` a tool call returned.
+            - ``done``: ``{"type": "done", "session_id": str, "response": str, "end_conversation": bool}``
+              always sent last, with the full reply stripped of the end token.
+            - ``error``: ``{"type": "error", "message": str}`` sent before ``done`` on failure.
+        """
+        logger.debug(f"Streaming message: {message}")
+        started = time.perf_counter()
+        outcome = "ok"
+        route = "agent"
+        accumulated_text = ""
+        end_filter = _EndTokenFilter()
+
+        try:
+            await self._ensure_session_async(user_id, session_id)
+
+            reply = await self._fast_path(user_id, session_id, message)
+            if reply is not None:
+                route = "fast"
+                accumulated_text = reply
+                delta = end_filter.feed(reply)
+                if delta:
+                    yield {"type": "text", "delta": delta}
+            else:
+                from google.genai.types import Content, Part
+                msg = Content(role="user", parts=[Part(text=message)])
+                run_config = RunConfig(streaming_mode=StreamingMode.SSE)
+
+                # With SSE streaming the model emits partial events carrying text
+                # deltas, followed by one non-partial event repeating the aggregated
+                # text. Only fall back to the aggregated text if nothing streamed.
+                streamed = False
+                async for event in self.runner.run_async(user_id=user_id, session_id=session_id, new_message=msg, run_config=run_config):
+                    text = _event_text(event)
+                    if getattr(event, 'partial', False):
+                        if text:
+                            streamed = True
+                            accumulated_text += text
+                            delta = end_filter.feed(text)
+                            if delta:
+                                yield {"type": "text", "delta": delta}
+                        continue
+
+                    if text and not streamed:
+                        accumulated_text += text
+                        delta = end_filter.feed(text)
+                        if delta:
+                            yield {"type": "text", "delta": delta}
+                    streamed = False
+
+                    for call in event.get_function_calls():
+                        yield {"type": "tool_start", "name": call.name}
+                    for result in event.get_function_responses():
+                        yield {"type": "tool_end", "name": result.name}
+
+        except asyncio.CancelledError:
+            TURN_SECONDS.observe(time.perf_counter() - started, mode="stream", route=route, outcome="cancelled")
+            raise
+        except Exception as e:
+            logger.error(f"Error streaming agent: {e}", exc_info=True)
+            outcome = "error"
+            yield {"type": "error", "message": str(e)}
+
+        tail = end_filter.flush()
+        if tail:
+            yield {"type": "text", "delta": tail}
+
+        end_conversation = end_filter.seen
+        TURN_SECONDS.observe(time.perf_counter() - started, mode="stream", route=route, outcome=outcome)
+        yield {
+            "type": "done",
+            "session_id": session_id,
+            "response": accumulated_text.replace(END_CONVERSATION_TOKEN, "").strip(),
+            "end_conversation": end_conversation,
+        }
+
+    def _claim_turn(self, session_id: str, task: asyncio.Task):
+        # A session has one turn at a time; a newer turn preempts the older one
+        previous = self._turns.get(session_id)
+        if previous is not None and not previous.done():
+            logger.info(f"Preempting running turn in session {session_id}")
+            previous.cancel()
+        self._turns[session_id] = task
+
+    def _release_turn(self, session_id: str, task: asyncio.Task):
+        if self._turns.get(session_id) is task:
+            del self._turns[session_id]
+
+    def cancel_turn(self, session_id: str) -> bool:
+        """
+        Cancel the session's running turn: the agent run, its pending tool calls
+        and any in-flight model request.
+
+        Returns:
+            True if a turn was running.
+        """
+        task = self._turns.get(session_id)
+        if task is None or task.done():
+            return False
+        task.cancel()
+        return True
+
+    async def run_turn(self, user_id: str, session_id: str, message: str) -> str:
+        """
+        process_message_async as the session's current turn.
+
+        Cancelling the caller (e.g. on client disconnect) cancels the turn.
+
+        Raises:
+            TurnCancelled: If cancel_turn or a newer turn in the session stopped it.
+        """
+        task = asyncio.create_task(self.process_message_async(user_id, session_id, message))
+        self._claim_turn(session_id, task)
+        try:
+            await asyncio.wait({task})
+        finally:
+            if not task.done():
+                task.cancel()
+            self._release_turn(session_id, task)
+        if task.cancelled():
+            raise TurnCancelled()
+        return task.result()
+
+    async def stream_turn(self, user_id: str, session_id: str, message: str,
+                          is_disconnected: Optional[Callable[[], Awaitable[bool]]] = None) -> AsyncIterator[Dict[str, Any]]:
+        """
+        stream_message as the session's current turn.
+
+        Yields the same frames, except that a turn stopped by cancel_turn or a
+        newer turn in the session ends with ``{"type": "cancelled"}`` instead of
+        ``done``. Closing the iterator, or ``is_disconnected`` returning True
+        while the turn is between frames, cancels the turn.
+        """
+        queue: asyncio.Queue = asyncio.Queue()
+
+        async def produce():
+            async for frame in self.stream_message(user_id, session_id, message):
+                queue.put_nowait(frame)
+
+        task = asyncio.create_task(produce())
+        task.add_done_callback(lambda _: queue.put_nowait(None))
+        self._claim_turn(session_id, task)
+        try:
+            while True:
+                try:
+                    frame = await asyncio.wait_for(queue.get(), DISCONNECT_POLL_SECONDS)
+                except asyncio.TimeoutError:
+                    if is_disconnected is not None and await is_disconnected():
+                        logger.info(f"Client disconnected, cancelling turn in session {session_id}")
+                        return
+                    continue
+                if frame is None:
+                    break
+                yield frame
+            if task.cancelled():
+                yield {"type": "cancelled", "session_id": session_id}
+        finally:
+            if not task.done():
+                task.cancel()
+            self._release_turn(session_id, task)
+
+    async def process_message_async(self, user_id: str, session_id: str, message: str) -> str:
+        """
+        Process a text message on the shared runner and return the text response.
+
+        Unlike process_message this never blocks the event loop, so many
+        conversations can be in flight on one worker.
+        """
+        logger.debug(f"Processing message: {message}")
+        started = time.perf_counter()
+        outcome = "error"
+        route = "agent"
+        accumulated_text = ""
+
+        try:
+            await self._ensure_session_async(user_id, session_id)
+
+            reply = await self._fast_path(user_id, session_id, message)
+            if reply is not None:
+                route = "fast"
+                outcome = "ok"
+                return reply
+
+            from google.genai.types import Content, Part
+            msg = Content(role="user", parts=[Part(text=message)])
+
+            async for event in self.runner.run_async(user_id=user_id, session_id=session_id, new_message=msg):
+                accumulated_text += _event_text(event)
+            outcome = "ok"
+
+            if accumulated_text.strip():
+                return accumulated_text
+
+            logger.warning("No response found in any location")
+            return "I processed the request but have no response."
+
+        except asyncio.CancelledError:
+            outcome = "cancelled"
+            raise
+        except Exception as e:
+            logger.error(f"Error running agent: {e}", exc_info=True)
+            return f"Error: {str(e)}"
+
+        finally:
+            TURN_SECONDS.observe(time.perf_counter() - started, mode="chat", route=route, outcome=outcome)
+
+    def process_message(self, user_id: str, session_id: str, message: str) -> str:
+        """
+        Process a text message and return the text response.
+
+        Blocking variant kept for scripts. Runner.run drives the agent on a
+        private event loop, so a fresh model/runner is built for each call to
+        avoid "Event loop is closed" errors from the shared HTTP client.
+        """
+        logger.debug(f"Processing message: {message}")
+        
+        runner = self._build_runner()
         
         accumulated_text = ""
         
         try:
             # Ensure a session exists; create if absent
             try:
-                session = self.session_service.get_session_sync(app_name="voice_bot_app", user_id=user_id, session_id=session_id)
+                session = self.session_service.get_session_sync(app_name=APP_NAME, user_id=user_id, session_id=session_id)
             except Exception:
                 session = None
             if not session:
                 try:
-                    self.session_service.create_session_sync(app_name="voice_bot_app", user_id=user_id, session_id=session_id)
+                    self.session_service.create_session_sync(app_name=APP_NAME, user_id=user_id, session_id=session_id)
                     logger.info(f"Created new session: {session_id}")
                 except Exception as e:
                     logger.error(f"Failed to create session: {e}")
@@ -104,14 +429,19 @@ class VoiceAgent:
             from google.genai.types import Content, Part
             msg = Content(role="user", parts=[Part(text=message)])
             
+            # Per-event logging is only formatted when debug logging is on
+            debug = logger.isEnabledFor(logging.DEBUG)
+
             # Iterate through events to execute the agent
             for event in runner.run(user_id=user_id, session_id=session_id, new_message=msg):
                 event_author = getattr(event, 'author', None)
-                logger.info(f"Event type: {type(event).__name__}, author: {event_author}")
+                if debug:
+                    logger.debug(f"Event type: {type(event).__name__}, author: {event_author}")
                 
                 # Try to capture text from ModelResponse events
                 if hasattr(event, 'text') and event.text:
-                    logger.info(f"Captured text from event.text: {event.text}")
+                    if debug:
+                        logger.debug(f"Captured text from event.text: {event.text}")
                     accumulated_text += event.text
                 
                 # Check for content attribute
@@ -121,11 +451,13 @@ class VoiceAgent:
                         if hasattr(event.content, 'parts'):
                             for part in event.content.parts:
                                 if hasattr(part, 'text') and part.text:
-                                    logger.info(f"Captured text from event.content.parts (author={event_author}): {part.text}")
+                                    if debug:
+                                        logger.debug(f"Captured text from event.content.parts (author={event_author}): {part.text}")
                                     accumulated_text += part.text
                         # Sometimes content itself has text
                         elif hasattr(event.content, 'text') and event.content.text:
-                            logger.info(f"Captured text from event.content.text (author={event_author}): {event.content.text}")
+                            if debug:
+                                logger.debug(f"Captured text from event.content.text (author={event_author}): {event.content.text}")
                             accumulated_text += event.content.text
                 
                 # Check for message attribute (some events use this)
@@ -134,25 +466,27 @@ class VoiceAgent:
                         if hasattr(event.message.content, 'parts'):
                             for part in event.message.content.parts:
                                 if hasattr(part, 'text') and part.text:
-                                    logger.info(f"Captured text from event.message.content.parts: {part.text}")
+                                    if debug:
+                                        logger.debug(f"Captured text from event.message.content.parts: {part.text}")
                                     accumulated_text += part.text
                 
                 # Also check if it's a tool call or error
                 if hasattr(event, 'tool_calls') and event.tool_calls:
-                    logger.info(f"Tool calls: {event.tool_calls}")
+                    if debug:
+                        logger.debug(f"Tool calls: {event.tool_calls}")
                 if hasattr(event, 'error'):
                     logger.error(f"Event error: {event.error}")
 
             # If we captured text during streaming/events, return it
             if accumulated_text.strip():
-                logger.info(f"Returning accumulated text: {accumulated_text}")
+                logger.debug(f"Returning accumulated text: {accumulated_text}")
                 return accumulated_text
 
             # Fallback: Check session events
-            logger.info("No text accumulated, checking session events...")
-            session = self.session_service.get_session_sync(app_name="voice_bot_app", user_id=user_id, session_id=session_id)
+            logger.debug("No text accumulated, checking session events...")
+            session = self.session_service.get_session_sync(app_name=APP_NAME, user_id=user_id, session_id=session_id)
             if session and session.events:
-                logger.info(f"Session has {len(session.events)} events")
+                logger.debug(f"Session has {len(session.events)} events")
                 
                 # Find the index of the last user message
                 last_user_msg_index = -1
@@ -162,7 +496,7 @@ class VoiceAgent:
                     if event_role == 'user' or event_author == 'user':
                         last_user_msg_index = i
                 
-                logger.info(f"Last user message index: {last_user_msg_index}")
+                logger.debug(f"Last user message index: {last_user_msg_index}")
 
                 # Look for model response ONLY after the last user message
                 # We iterate from the end, but stop if we reach the user message
@@ -170,7 +504,7 @@ class VoiceAgent:
                     event = session.events[i]
                     event_role = getattr(event, 'role', 'N/A')
                     event_author = getattr(event, 'author', 'N/A')
-                    logger.info(f"Checking event {i}: type={type(event).__name__}, role={event_role}, author={event_author}")
+                    logger.debug(f"Checking event {i}: type={type(event).__name__}, role={event_role}, author={event_author}")
                     
                     # Skip user messages (though we shouldn't see them if logic is correct)
                     if event_role == 'user' or event_author == 'user':
@@ -178,25 +512,25 @@ class VoiceAgent:
                     
                     # Try to extract content from model events
                     if hasattr(event, 'content'):
-                        logger.info(f"Event has content attribute: {type(event.content)}")
+                        logger.debug(f"Event has content attribute: {type(event.content)}")
                         if hasattr(event.content, 'parts'):
                             parts_text = []
                             for part in event.content.parts:
                                 if hasattr(part, 'text') and part.text:
                                     parts_text.append(part.text)
-                                    logger.info(f"Found text in part: {part.text[:50]}...")
+                                    logger.debug(f"Found text in part: {part.text[:50]}...")
                             if parts_text:
                                 response = " ".join(parts_text)
-                                logger.info(f"Returning from session events (parts): {response}")
+                                logger.debug(f"Returning from session events (parts): {response}")
                                 return response
                         elif hasattr(event.content, 'text') and event.content.text:
-                            logger.info(f"Returning from session events (content.text): {event.content.text}")
+                            logger.debug(f"Returning from session events (content.text): {event.content.text}")
                             return event.content.text
                         else:
                             # Try converting content to string
                             content_str = str(event.content)
                             if content_str and content_str != "":
-                                logger.info(f"Returning content as string: {content_str[:100]}...")
+                                logger.debug(f"Returning content as string: {content_str[:100]}...")
                                 return content_str
             
             logger.warning("No response found in any location")
@@ -1,174 +1,530 @@
-from fastapi import FastAPI, Request, HTTPException
-from fastapi.responses import HTMLResponse, JSONResponse, Response
+from fastapi import FastAPI, Request, HTTPException, WebSocket, WebSocketDisconnect
+from fastapi.responses import HTMLResponse, JSONResponse, PlainTextResponse, Response, StreamingResponse
 from fastapi.staticfiles import StaticFiles
 from fastapi.templating import Jinja2Templates
 from pydantic import BaseModel
 import uuid
 import os
-from agent import voice_agent
-from google.cloud import texttospeech
+import json
+import asyncio
+from admission import DISCONNECT_POLL_SECONDS, AdmissionRejected, TurnCancelled
+from metrics import registry as metrics_registry
+from router import router
+from tts.pipeline import split_text, synthesize_chunks
+from tts.cache import TTSCache, make_key
+from tts.formats import AUDIO_FORMATS, DEFAULT_FORMAT, negotiate_format, parse_range
+from tts.lipsync import ENVELOPE_RATE, EnvelopeUnavailable, envelope_for, envelope_key
+from tts.providers import providers
+from tts.routing import ProviderRouter
+from tools.rfam_db import result_cache as rfam_result_cache, mirror as rfam_mirror, warm_up as rfam_warm_up
+from warmup import WARMUP_FORMATS, WARMUP_PHRASES, Warmup
+from static_assets import StaticAsset, avatar_url, load_avatar
 import base64
-import requests
-from openai import OpenAI
+from contextlib import asynccontextmanager
+from starlette.background import BackgroundTask
 
-app = FastAPI()
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    # Serve straight away and warm up in the background; /ready reports when it's done.
+    # Shared TTS clients are created once (by warmup or on first use) and closed on shutdown.
+    warmup_task = asyncio.create_task(warmup.run([
+        ("agent", _warm_agent),
+        ("rfam", lambda: asyncio.to_thread(rfam_warm_up)),
+        ("tts", _warm_tts),
+        ("assets", lambda: asyncio.to_thread(_static_assets)),
+    ]))
+    yield
+    warmup_task.cancel()
+    await providers.aclose()
+
+app = FastAPI(lifespan=lifespan)
 
 # Mount static files if needed (we'll just use templates for now)
 # app.mount("/static", StaticFiles(directory="static"), name="static")
 
 templates = Jinja2Templates(directory="templates")
 
+tts_cache = TTSCache.from_env()
+tts_router = ProviderRouter(providers)
+warmup = Warmup()
+
+_voice_agent = None
+_voice_agent_lock = asyncio.Lock()
+
+async def get_voice_agent():
+    """The shared VoiceAgent. agent.py (and with it google.adk) is imported on first use, off the event loop."""
+    global _voice_agent
+    if _voice_agent is None:
+        async with _voice_agent_lock:
+            if _voice_agent is None:
+                _voice_agent = await asyncio.to_thread(_load_voice_agent)
+    return _voice_agent
+
+def _load_voice_agent():
+    from agent import voice_agent
+    return voice_agent
+
 from typing import Optional
 
 class ChatRequest(BaseModel):
     message: str
     session_id: Optional[str] = None
 
+class CancelRequest(BaseModel):
+    session_id: str
+
 class TTSRequest(BaseModel):
     text: str
     language_code: str = "en-GB"
     voice_name: str = "en-GB-Chirp3-HD-Algenib"
     provider: str = "google" # google, openai, elevenlabs
+    format: Optional[str] = None # mp3 (default), opus, wav
+    bitrate: Optional[int] = None # preferred kbps, best effort per provider
+    envelope: bool = False # also return the lip-sync envelope (see tts/lipsync.py)
+
+_assets = None
+
+def _static_assets() -> dict:
+    """The page (rendered once) and the local avatar, compressed once; built on first use."""
+    global _assets
+    if _assets is None:
+        avatar = load_avatar()
+        page = templates.get_template("index.html").render(avatar_url=avatar_url(avatar))
+        _assets = {"page": StaticAsset(page.encode("utf-8"), "text/html; charset=utf-8"), "avatar": avatar}
+    return _assets
 
 @app.get("/", response_class=HTMLResponse)
 async def read_root(request: Request):
-    return templates.TemplateResponse("index.html", {"request": request})
+    """The page, pre-rendered and compressed, revalidated by ETag"""
+    assets = _assets or await asyncio.to_thread(_static_assets)
+    return assets["page"].response(request)
+
+@app.get("/assets/avatar.{digest}.glb")
+async def avatar_asset(request: Request, digest: str):
+    """The local avatar model; the URL carries its content hash, so browsers cache it as immutable"""
+    avatar = (_assets or await asyncio.to_thread(_static_assets))["avatar"]
+    if avatar is None or digest != avatar.digest:
+        raise HTTPException(status_code=404, detail="Not found")
+    return avatar.response(request)
 
 @app.post("/chat")
-async def chat(request: ChatRequest):
+async def chat(request: ChatRequest, http_request: Request):
     user_id = "web_user"
     session_id = request.session_id or str(uuid.uuid4())
     
     if not request.message:
         raise HTTPException(status_code=400, detail="Message is empty")
 
-    response_text = voice_agent.process_message(user_id, session_id, request.message)
+    voice_agent = await get_voice_agent()
+    try:
+        async with voice_agent.limiter.slot():
+            response_text = await _cancel_on_disconnect(
+                http_request, voice_agent.run_turn(user_id, session_id, request.message)
+            )
+    except AdmissionRejected as e:
+        raise _busy(e)
+    except TurnCancelled:
+        raise HTTPException(status_code=409, detail="Turn was cancelled")
+    except _ClientGone:
+        return Response(status_code=499)
     
     return JSONResponse(content={
         "response": response_text,
         "session_id": session_id
     })
 
+@app.post("/chat/cancel")
+async def chat_cancel(request: CancelRequest):
+    """Cancel the session's running turn (agent run, tool queries and model call)"""
+    voice_agent = await get_voice_agent()
+    return {"cancelled": voice_agent.cancel_turn(request.session_id)}
+
+class _ClientGone(Exception):
+    """The HTTP client disconnected before its response was ready."""
+
+async def _cancel_on_disconnect(http_request: Request, awaitable):
+    """Await awaitable, cancelling it and raising _ClientGone if the client disconnects first."""
+    task = asyncio.ensure_future(awaitable)
+    try:
+        while True:
+            done, _ = await asyncio.wait({task}, timeout=DISCONNECT_POLL_SECONDS)
+            if done:
+                return task.result()
+            if await http_request.is_disconnected():
+                raise _ClientGone()
+    finally:
+        if not task.done():
+            task.cancel()
+
+def _busy(e: AdmissionRejected) -> HTTPException:
+    return HTTPException(status_code=503, detail=str(e), headers={"Retry-After": str(e.retry_after)})
+
+def _sse_frame(frame: dict) -> str:
+    return f"event: {frame['type']}\ndata: {json.dumps(frame)}\n\n"
+
+@app.post("/chat/stream")
+async def chat_stream(request: ChatRequest, http_request: Request):
+    """Stream the agent reply as Server-Sent Events (text deltas, tool start/end, done)"""
+    user_id = "web_user"
+    session_id = request.session_id or str(uuid.uuid4())
+
+    if not request.message:
+        raise HTTPException(status_code=400, detail="Message is empty")
+
+    # Take the slot before responding so a full queue still yields a 503;
+    # it is released once the stream has been fully sent.
+    voice_agent = await get_voice_agent()
+    try:
+        await voice_agent.limiter.acquire()
+    except AdmissionRejected as e:
+        raise _busy(e)
+
+    async def event_stream():
+        try:
+            async for frame in voice_agent.stream_turn(user_id, session_id, request.message,
+                                                       is_disconnected=http_request.is_disconnected):
+                yield _sse_frame(frame)
+        finally:
+            voice_agent.limiter.release()
+
+    return StreamingResponse(
+        event_stream(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
+
+@app.websocket("/ws/chat")
+async def chat_websocket(websocket: WebSocket):
+    """
+    Stream agent replies over a WebSocket.
+
+    The client sends ``{"message": str, "session_id": str | null}`` per turn and
+    receives the same frames as ``/chat/stream`` as JSON messages. Sending
+    ``{"type": "cancel"}`` cancels the running turn, and a new message while a
+    turn is running replaces it (barge-in); either way the old turn ends with a
+    ``cancelled`` frame. Disconnecting cancels the running turn.
+    """
+    await websocket.accept()
+    voice_agent = await get_voice_agent()
+    user_id = "web_user"
+    session_id = None
+    turn = None
+
+    async def run_turn(session_id: str, message: str):
+        try:
+            async with voice_agent.limiter.slot():
+                async for frame in voice_agent.stream_turn(user_id, session_id, message):
+                    await websocket.send_json(frame)
+        except AdmissionRejected as e:
+            await websocket.send_json({"type": "error", "message": str(e), "retry_after": e.retry_after})
+        except WebSocketDisconnect:
+            pass
+
+    async def cancel_running():
+        if turn is not None and not turn.done():
+            turn.cancel()
+            await websocket.send_json({"type": "cancelled", "session_id": session_id})
+
+    try:
+        while True:
+            data = await websocket.receive_json()
+            if data.get("type") == "cancel":
+                await cancel_running()
+                continue
+            message = data.get("message")
+            if not message:
+                await websocket.send_json({"type": "error", "message": "Message is empty"})
+                continue
+            await cancel_running()
+            session_id = data.get("session_id") or session_id or str(uuid.uuid4())
+            turn = asyncio.create_task(run_turn(session_id, message))
+    except WebSocketDisconnect:
+        pass
+    finally:
+        if turn is not None and not turn.done():
+            turn.cancel()
+
 @app.post("/tts")
-async def text_to_speech(request: TTSRequest):
-    """Convert text to speech using Google Cloud Text-to-Speech API"""
+async def text_to_speech(request: TTSRequest, http_request: Request):
+    """Convert text to speech using the requested provider (Google Cloud TTS by default)"""
+    _validate_format(request)
     try:
-        if request.provider == "openai":
-            return await generate_openai_tts(request)
-        elif request.provider == "elevenlabs":
-            return await generate_elevenlabs_tts(request)
-        else:
-            return await generate_google_tts(request)
-        
+        audio_content = await _cancel_on_disconnect(http_request, synthesize_audio(request))
+    except _ClientGone:
+        return Response(status_code=499)
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"TTS Error: {str(e)}")
 
-async def generate_google_tts(request: TTSRequest):
-    # Initialize the Text-to-Speech client
-    client = texttospeech.TextToSpeechClient()
-    
-    # Set the text input
-    synthesis_input = texttospeech.SynthesisInput(text=request.text)
-    
-    # Build the voice request
-    voice = texttospeech.VoiceSelectionParams(
-        language_code=request.language_code,
-        name=request.voice_name
-    )
-    
-    # Select the audio format
-    audio_config = texttospeech.AudioConfig(
-        audio_encoding=texttospeech.AudioEncoding.MP3
-    )
-    
-    # Perform the text-to-speech request
-    response = client.synthesize_speech(
-        input=synthesis_input,
-        voice=voice,
-        audio_config=audio_config
-    )
-    
     # Return the audio content as base64 for easy embedding
-    audio_base64 = base64.b64encode(response.audio_content).decode('utf-8')
-    
-    return JSONResponse(content={
-        "audio": audio_base64,
-        "format": "mp3"
-    })
-
-async def generate_openai_tts(request: TTSRequest):
-    api_key = os.environ.get("OPENAI_API_KEY")
-    if not api_key:
-         raise HTTPException(status_code=500, detail="OPENAI_API_KEY not set")
-         
-    client = OpenAI(api_key=api_key)
-    
-    # Map Google voice names to OpenAI equivalents or use defaults
-    voice_map = {
-        "alloy": "alloy",
-        "echo": "echo",
-        "fable": "fable",
-        "onyx": "onyx",
-        "nova": "nova",
-        "shimmer": "shimmer"
+    content = {
+        "audio": base64.b64encode(audio_content).decode('utf-8'),
+        "format": request.format or DEFAULT_FORMAT
     }
-    
-    # Default to 'alloy' if voice not found or if it's a Google voice name
-    openai_voice = voice_map.get(request.voice_name, "alloy")
-    
-    response = client.audio.speech.create(
-        model="tts-1-hd",
-        voice=openai_voice,
-        input=request.text
-    )
-    
-    # Get binary content
-    audio_content = response.content
-    audio_base64 = base64.b64encode(audio_content).decode('utf-8')
-    
-    return JSONResponse(content={
-        "audio": audio_base64,
-        "format": "mp3"
-    })
+    if request.envelope:
+        content.update(await _envelope_fields(request, audio_content))
+    return JSONResponse(content=content)
 
-async def generate_elevenlabs_tts(request: TTSRequest):
-    api_key = os.environ.get("ELEVENLABS_API_KEY")
-    if not api_key:
-         raise HTTPException(status_code=500, detail="ELEVENLABS_API_KEY not set")
+@app.get("/tts/audio")
+async def text_to_speech_audio_get(
+    http_request: Request,
+    text: str,
+    language_code: str = "en-GB",
+    voice_name: str = "en-GB-Chirp3-HD-Algenib",
+    provider: str = "google",
+    format: Optional[str] = None,
+    bitrate: Optional[int] = None,
+):
+    """Binary audio for use directly as an <audio> src (supports Range once cached)"""
+    request = TTSRequest(text=text, language_code=language_code, voice_name=voice_name,
+                         provider=provider, format=format, bitrate=bitrate)
+    return await _audio_response(http_request, request)
 
-    # Use a default voice ID if a specific one isn't provided or needed
-    # Custom voice ID: 8fcyCHOzlKDlxh1InJSf
-    voice_id = "8fcyCHOzlKDlxh1InJSf" 
-    
-    url = f"https://api.elevenlabs.io/v1/text-to-speech/{voice_id}"
-    
-    headers = {
-        "Accept": "audio/mpeg",
-        "Content-Type": "application/json",
-        "xi-api-key": api_key
-    }
-    
-    data = {
-        "text": request.text,
-        "model_id": "eleven_multilingual_v2",
-        "voice_settings": {
-            "stability": 0.5,
-            "similarity_boost": 0.5
-        }
-    }
-    
-    response = requests.post(url, json=data, headers=headers)
-    
-    if response.status_code != 200:
-        raise HTTPException(status_code=response.status_code, detail=f"ElevenLabs Error: {response.text}")
-        
-    audio_base64 = base64.b64encode(response.content).decode('utf-8')
-    
-    return JSONResponse(content={
-        "audio": audio_base64,
-        "format": "mp3"
-    })
-        
+@app.get("/tts/envelope")
+async def text_to_speech_envelope(
+    http_request: Request,
+    text: str,
+    language_code: str = "en-GB",
+    voice_name: str = "en-GB-Chirp3-HD-Algenib",
+    provider: str = "google",
+    format: Optional[str] = None,
+    bitrate: Optional[int] = None,
+):
+    """
+    Lip-sync envelope for the clip /tts/audio serves with the same parameters:
+    one byte of mouth openness (0-255) per 1/X-Envelope-Rate seconds of audio
+    """
+    request = TTSRequest(text=text, language_code=language_code, voice_name=voice_name,
+                         provider=provider, format=format, bitrate=bitrate)
+    _validate_format(request)
+    request = request.model_copy(update={"format": request.format or DEFAULT_FORMAT})
+    headers = {"ETag": f'"{envelope_key(_cache_key(request))}"', "X-Envelope-Rate": str(ENVELOPE_RATE)}
+    if http_request.headers.get("if-none-match") == headers["ETag"]:
+        return Response(status_code=304, headers=headers)
+    try:
+        envelope = await _cancel_on_disconnect(http_request, synthesize_envelope(request))
+    except _ClientGone:
+        return Response(status_code=499)
+    except EnvelopeUnavailable as e:
+        raise HTTPException(status_code=501, detail=f"Envelope unavailable: {str(e)}")
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"TTS Error: {str(e)}")
+    return Response(envelope, media_type="application/octet-stream", headers=headers)
+
+@app.post("/tts/audio")
+async def text_to_speech_audio(http_request: Request, request: TTSRequest):
+    """Binary audio (no base64); format is taken from the body or negotiated from Accept"""
+    return await _audio_response(http_request, request)
+
+async def _audio_response(http_request: Request, request: TTSRequest) -> Response:
+    try:
+        audio_format = negotiate_format(request.format, http_request.headers.get("accept"))
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    request = request.model_copy(update={"format": audio_format})
+    media_type = AUDIO_FORMATS[audio_format]
+    key = _cache_key(request)
+    headers = {"Accept-Ranges": "bytes", "ETag": f'"{key}"', "Vary": "Accept"}
+
+    # Fully cached (or about to be): serve the whole clip with length and range support.
+    audio_content = await tts_cache.get(key)
+    if audio_content is None and tts_cache.is_pending(key):
+        audio_content = await synthesize_audio(request)
+    if audio_content is not None:
+        if http_request.headers.get("if-none-match") == headers["ETag"]:
+            return Response(status_code=304, headers=headers)
+        try:
+            byte_range = parse_range(http_request.headers.get("range"), len(audio_content))
+        except ValueError:
+            return Response(status_code=416, headers={"Content-Range": f"bytes */{len(audio_content)}"})
+        if byte_range:
+            start, end = byte_range
+            headers["Content-Range"] = f"bytes {start}-{end}/{len(audio_content)}"
+            return Response(audio_content[start:end + 1], status_code=206, media_type=media_type, headers=headers)
+        return Response(audio_content, media_type=media_type, headers=headers)
+
+    # Miss: relay provider chunks as they arrive and cache the clip once complete.
+    # Requests for the same clip meanwhile (e.g. its envelope) wait for this relay.
+    tts_cache.begin_fill(key)
+    try:
+        chunks, served_by = await tts_router.stream(request.provider, request.text, request.voice_name,
+                                                    request.language_code, audio_format, request.bitrate)
+    except Exception as e:
+        tts_cache.end_fill(key, None)
+        raise HTTPException(status_code=500, detail=f"TTS Error: {str(e)}")
+    except asyncio.CancelledError:
+        tts_cache.end_fill(key, None)
+        raise
+
+    # A fallback provider's voice answers this request but isn't cached as the requested one
+    primary = served_by == providers.get(request.provider).name
+    if not primary:
+        del headers["ETag"]
+    headers["X-TTS-Provider"] = served_by
+
+    async def relay():
+        received = []
+        audio = None
+        try:
+            async for chunk in chunks:
+                received.append(chunk)
+                yield chunk
+            audio = b"".join(received)
+            tts_cache.record_miss(len(audio))
+            if primary:
+                await tts_cache.put(key, audio)
+        finally:
+            await chunks.aclose()
+            tts_cache.end_fill(key, audio)
+
+    del headers["Accept-Ranges"]
+    # Releases waiters even if the client left before the body was started
+    return StreamingResponse(relay(), media_type=media_type, headers=headers,
+                             background=BackgroundTask(tts_cache.end_fill, key, None))
+
+@app.post("/tts/stream")
+async def text_to_speech_stream(request: TTSRequest):
+    """
+    Split the text into sentences, synthesize them concurrently and stream the
+    audio segments in order as newline-delimited JSON.
+
+    Each line is ``{"index": int, "text": str, "audio": base64, "format": str}``;
+    a provider failure ends the stream with ``{"error": str}``.
+    """
+    _validate_format(request)
+    chunks = split_text(request.text)
+
+    async def synthesize_chunk(chunk: str) -> bytes:
+        return await synthesize_audio(request.model_copy(update={"text": chunk}))
+
+    async def segment_stream():
+        try:
+            async for index, chunk, audio_content in synthesize_chunks(chunks, synthesize_chunk):
+                segment = {
+                    "index": index,
+                    "text": chunk,
+                    "audio": base64.b64encode(audio_content).decode('utf-8'),
+                    "format": request.format or DEFAULT_FORMAT
+                }
+                if request.envelope:
+                    segment.update(await _envelope_fields(request.model_copy(update={"text": chunk}), audio_content))
+                yield json.dumps(segment) + "\n"
+        except Exception as e:
+            yield json.dumps({"error": f"TTS Error: {str(e)}"}) + "\n"
+
+    return StreamingResponse(segment_stream(), media_type="application/x-ndjson")
+
+@app.get("/tts/cache")
+async def tts_cache_stats():
+    """Hit/miss/byte counters for the TTS audio cache"""
+    return tts_cache.stats()
+
+def _validate_format(request: TTSRequest):
+    try:
+        negotiate_format(request.format, None)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+def _cache_key(request: TTSRequest) -> str:
+    provider = providers.get(request.provider)
+    return make_key(provider.name, request.voice_name, request.language_code, provider.model, request.text,
+                    request.format or DEFAULT_FORMAT, request.bitrate)
+
+@app.get("/tts/providers")
+async def tts_provider_stats():
+    """Routing mode, circuit breaker state and hedge thresholds per TTS provider"""
+    return tts_router.stats()
+
+@app.get("/rfam/cache")
+async def rfam_cache_stats():
+    """Hit/miss counters and remote DB time saved by the Rfam query cache"""
+    return rfam_result_cache.stats()
+
+@app.get("/ready")
+async def ready():
+    """Readiness probe: 503 until startup warmup has finished, with the outcome of each step"""
+    return JSONResponse(content=warmup.stats(), status_code=200 if warmup.ready else 503)
+
+async def _warm_agent():
+    voice_agent = await get_voice_agent()
+    await asyncio.to_thread(voice_agent.warm)
+
+async def _warm_tts():
+    await providers.start()
+    # Prime the cache (memory, and disk across restarts) with the phrases spoken most often
+    for phrase in WARMUP_PHRASES:
+        for audio_format in WARMUP_FORMATS:
+            request = TTSRequest(text=phrase, format=audio_format)
+            try:
+                await synthesize_envelope(request)
+            except EnvelopeUnavailable:
+                await synthesize_audio(request)
+
+@app.get("/metrics", response_class=PlainTextResponse)
+async def metrics():
+    """Latency histograms for turns, model calls, tools and TTS in Prometheus text format"""
+    return PlainTextResponse(metrics_registry.render(), media_type="text/plain; version=0.0.4")
+
+@app.get("/router")
+async def router_stats():
+    """Fast-path routing counts and the most recent decisions, for tuning the patterns"""
+    return router.stats()
+
+@app.get("/sessions")
+async def session_stats():
+    """Live session count and expiry/eviction/compaction counters"""
+    voice_agent = await get_voice_agent()
+    return voice_agent.session_service.stats()
+
+@app.get("/rfam/mirror")
+async def rfam_mirror_stats():
+    """Snapshot version/timestamp and local vs remote query counts for the Rfam mirror"""
+    return rfam_mirror.stats()
+
+async def synthesize_audio(request: TTSRequest) -> bytes:
+    """
+    Synthesize request.text with request.provider (or a fallback, see tts/routing.py)
+    and return the audio bytes, served from cache when possible
+    """
+    served_by = {}
+
+    async def produce() -> bytes:
+        audio, served_by["provider"] = await tts_router.synthesize(
+            request.provider, request.text, request.voice_name, request.language_code,
+            request.format or DEFAULT_FORMAT, request.bitrate
+        )
+        return audio
+
+    # Fallback audio isn't the requested voice, so only the primary's is cached
+    primary = providers.get(request.provider).name
+    return await tts_cache.get_or_create(_cache_key(request), produce,
+                                         cacheable=lambda _: served_by.get("provider") == primary)
+
+
+async def synthesize_envelope(request: TTSRequest, audio_content: Optional[bytes] = None) -> bytes:
+    """
+    Lip-sync envelope of request's clip, computed once and cached next to the audio.
+
+    Raises:
+        EnvelopeUnavailable: If the clip can't be decoded here.
+    """
+    audio_format = request.format or DEFAULT_FORMAT
+    audio_key = _cache_key(request)
+
+    async def produce() -> bytes:
+        audio = audio_content if audio_content is not None else await synthesize_audio(request)
+        return await asyncio.to_thread(envelope_for, audio, audio_format)
+
+    # Only kept alongside cached audio, so a fallback provider's clip doesn't leave its envelope behind
+    return await tts_cache.get_or_create(envelope_key(audio_key), produce,
+                                         cacheable=lambda _: tts_cache.contains(audio_key))
+
+async def _envelope_fields(request: TTSRequest, audio_content: bytes) -> dict:
+    # The envelope is optional for JSON clients; the avatar falls back to its analyser without one
+    try:
+        envelope = await synthesize_envelope(request, audio_content)
+    except EnvelopeUnavailable:
+        return {"envelope": None, "envelope_rate": ENVELOPE_RATE}
+    return {"envelope": base64.b64encode(envelope).decode('utf-8'), "envelope_rate": ENVELOPE_RATE}
 
 
 if __name__ == "__main__":
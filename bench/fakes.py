@@ -0,0 +1,207 @@
+"""
+Deterministic local stand-ins for the paid/remote services, for benchmarking.
+
+install_fakes() swaps them into the running app:
+
+*   ScriptedLlm replaces Gemini. It answers from rules on the user's message,
+    calling the Rfam or search tool first when the message asks for it.
+*   FakeTTSProvider replaces every TTS provider and returns fixed MP3 frames.
+*   A generated SQLite database is mounted as the Rfam mirror, so SQL tool
+    calls run real (local) queries.
+*   Web searches return canned results.
+"""
+import asyncio
+import os
+import re
+import sqlite3
+import time
+from typing import AsyncGenerator, Optional
+
+from google.adk.models import BaseLlm
+from google.adk.models.llm_request import LlmRequest
+from google.adk.models.llm_response import LlmResponse
+from google.genai.types import Content, FunctionCall, Part
+
+from tts.providers import TTSProvider
+
+# One silent MPEG-1 Layer III frame (128 kbps, 44.1 kHz), ~26 ms of audio
+SILENT_MP3_FRAME = bytes.fromhex("fffb9064") + bytes(413)
+
+_ACCESSION = re.compile(r"\bRF\d{5}\b", re.IGNORECASE)
+
+
+class ScriptedLlm(BaseLlm):
+    """
+    A model that follows a fixed script instead of calling Gemini.
+
+    * Mentions of an Rfam accession (RF00005) or "family" trigger
+      ``execute_sql_query_async``; "search", "who" or "news" trigger
+      ``perform_google_search_async``. Once the tool responds, the model
+      answers with the first line of its result.
+    * Anything else gets a short canned reply.
+
+    Replies are streamed word by word when the runner asks for streaming.
+
+    Attributes:
+        first_token_latency: Seconds before the first response chunk.
+        token_latency: Seconds between streamed words.
+    """
+
+    model: str = "scripted"
+    first_token_latency: float = 0.3
+    token_latency: float = 0.01
+
+    async def generate_content_async(self, llm_request: LlmRequest,
+                                     stream: bool = False) -> AsyncGenerator[LlmResponse, None]:
+        await asyncio.sleep(self.first_token_latency)
+        last = llm_request.contents[-1] if llm_request.contents else None
+        parts = last.parts or [] if last else []
+
+        results = [part.function_response for part in parts if part.function_response]
+        if results:
+            result = str((results[0].response or {}).get("result", ""))
+            summary = result.splitlines()[1] if result.count("\n") else result
+            async for response in self._reply(f"Here is what I found: {summary[:200]}. Is there anything else?", stream):
+                yield response
+            return
+
+        message = " ".join(part.text for part in parts if part.text)
+        call = self._tool_call(message)
+        if call is not None:
+            yield LlmResponse(content=Content(role="model", parts=[Part(function_call=call)]))
+            return
+        async for response in self._reply("I can look up RNA families or search the web. What would you like?", stream):
+            yield response
+
+    @staticmethod
+    def _tool_call(message: str) -> Optional[FunctionCall]:
+        accession = _ACCESSION.search(message)
+        if accession:
+            return FunctionCall(name="execute_sql_query_async", args={
+                "query": f"SELECT rfam_acc, rfam_id, type, description FROM family "
+                         f"WHERE rfam_acc = '{accession.group(0).upper()}'"
+            })
+        lowered = message.lower()
+        if "family" in lowered:
+            word = lowered.split()[-1].strip("?.!")
+            return FunctionCall(name="execute_sql_query_async", args={
+                "query": f"SELECT rfam_acc, rfam_id, description FROM family WHERE description LIKE '%{word}%' LIMIT 5"
+            })
+        if any(word in lowered for word in ("search", "who", "news")):
+            return FunctionCall(name="perform_google_search_async", args={"query": message})
+        return None
+
+    async def _reply(self, text: str, stream: bool) -> AsyncGenerator[LlmResponse, None]:
+        if stream:
+            words = text.split(" ")
+            for index, word in enumerate(words):
+                if index:
+                    await asyncio.sleep(self.token_latency)
+                delta = word if index == 0 else f" {word}"
+                yield LlmResponse(content=Content(role="model", parts=[Part(text=delta)]), partial=True)
+        yield LlmResponse(content=Content(role="model", parts=[Part(text=text)]), turn_complete=True)
+
+
+class FakeTTSProvider(TTSProvider):
+    """Returns silent MP3 frames, roughly one per 4 characters of text, after a fixed latency."""
+
+    model = "fake"
+
+    def __init__(self, name: str, latency: float = 0.2, chunks: int = 4):
+        self.name = name
+        self.latency = latency
+        self.chunks = chunks
+        super().__init__()
+
+    def _create_client(self):
+        return object()
+
+    def _audio(self, text: str) -> bytes:
+        return SILENT_MP3_FRAME * max(1, len(text) // 4)
+
+    async def _synthesize(self, text, voice_name, language_code, audio_format, bitrate) -> bytes:
+        await asyncio.sleep(self.latency)
+        return self._audio(text)
+
+    async def _stream(self, text, voice_name, language_code, audio_format, bitrate):
+        audio = self._audio(text)
+        size = -(-len(audio) // self.chunks)
+        for offset in range(0, len(audio), size):
+            await asyncio.sleep(self.latency / self.chunks)
+            yield audio[offset:offset + size]
+
+
+def build_fake_rfam(path: str, families: int = 4000):
+    """
+    Write a SQLite database shaped like an Rfam mirror (see tools/rfam_mirror.py)
+    with ``families`` synthetic families RF00001, RF00002, ...
+    """
+    if os.path.exists(path):
+        os.remove(path)
+    connection = sqlite3.connect(path)
+    types = ["Gene; rRNA;", "Gene; tRNA;", "Cis-reg;", "Gene; snRNA;", "Gene; miRNA;"]
+    with connection:
+        connection.executescript("""
+            CREATE TABLE _mirror_meta (key TEXT PRIMARY KEY, value TEXT);
+            CREATE TABLE family (rfam_acc TEXT COLLATE NOCASE, rfam_id TEXT COLLATE NOCASE,
+                                 description TEXT COLLATE NOCASE, type TEXT COLLATE NOCASE,
+                                 number_of_species INTEGER, author TEXT COLLATE NOCASE);
+            CREATE TABLE clan (clan_acc TEXT COLLATE NOCASE, id TEXT COLLATE NOCASE, description TEXT COLLATE NOCASE);
+            CREATE TABLE taxonomy (ncbi_id INTEGER, species TEXT COLLATE NOCASE, tax_string TEXT COLLATE NOCASE);
+            CREATE TABLE rfamseq (rfamseq_acc TEXT COLLATE NOCASE, ncbi_id INTEGER, description TEXT COLLATE NOCASE,
+                                  mol_type TEXT COLLATE NOCASE);
+        """)
+        connection.executemany("INSERT INTO family VALUES (?, ?, ?, ?, ?, ?)", (
+            (f"RF{i:05d}", f"fam_{i}", f"Synthetic RNA family {i} ({types[i % len(types)].split(';')[-2].strip()})",
+             types[i % len(types)], i % 997, "bench")
+            for i in range(1, families + 1)
+        ))
+        connection.executemany("INSERT INTO clan VALUES (?, ?, ?)",
+                               ((f"CL{i:05d}", f"clan_{i}", f"Synthetic clan {i}") for i in range(1, families // 20 + 1)))
+        connection.executemany("INSERT INTO taxonomy VALUES (?, ?, ?)",
+                               ((i, f"Species {i}", f"Root; Genus{i % 50};") for i in range(1, 1001)))
+        connection.executemany("INSERT INTO rfamseq VALUES (?, ?, ?, ?)",
+                               ((f"SEQ{i:07d}", i % 1000 + 1, f"Sequence {i}", "genomic DNA") for i in range(1, 20001)))
+        for table, column in (("family", "rfam_acc"), ("family", "rfam_id"), ("clan", "clan_acc"),
+                              ("taxonomy", "ncbi_id"), ("rfamseq", "rfamseq_acc")):
+            # Indexes inherit the column's NOCASE collation
+            connection.execute(f'CREATE INDEX "ix_{table}_{column}" ON "{table}" ("{column}")')
+        connection.executemany("INSERT INTO _mirror_meta VALUES (?, ?)", [
+            ("rfam_release", "bench"),
+            ("snapshot_at", time.strftime("%Y-%m-%dT%H:%M:%S")),
+            ("tables", "family,clan,taxonomy,rfamseq"),
+            ("partial_tables", ""),
+        ])
+    connection.close()
+
+
+def install_fakes(rfam_path: str, model_latency: float = 0.3, token_latency: float = 0.01,
+                  tts_latency: float = 0.2, search_latency: float = 0.1, families: int = 4000):
+    """
+    Point the app's agent, TTS providers, Rfam tool and search tool at local fakes.
+
+    Must run before the first request. Result caches are left enabled, as in production.
+    """
+    import agent
+    from tools import rfam_db, search_tool
+    from tools.rfam_mirror import RfamMirror
+    from tts.providers import providers
+
+    build_fake_rfam(rfam_path, families)
+    rfam_db.mirror = RfamMirror(rfam_path)
+    # Skip remote schema introspection; validate against the fake mirror
+    rfam_db._catalog = rfam_db.mirror.catalog()
+
+    def canned_search(query: str):
+        time.sleep(search_latency)
+        results = [f"- Result {i} for {query}: canned snippet {i}. (https://example.org/{i})" for i in range(1, 6)]
+        return "Top Web Search Results:\n" + "\n".join(results), len(results)
+
+    search_tool._search = canned_search
+
+    for name in list(providers.names()):
+        providers.register(FakeTTSProvider(name, tts_latency))
+
+    voice_agent = agent.voice_agent
+    voice_agent.model = ScriptedLlm(first_token_latency=model_latency, token_latency=token_latency)
+    voice_agent.runner = voice_agent._build_runner()
@@ -0,0 +1,218 @@
+"""
+Load generator for the chat and TTS endpoints.
+
+By default the app runs in this process with every paid/remote service
+replaced by the fakes in bench/fakes.py, so results are deterministic and
+need no API keys::
+
+    python -m bench.load --requests 500 --concurrency 32
+
+It reports throughput, p50/p99 latency per endpoint and the process's peak
+RSS. ``--json`` writes the same report for CI, and ``--max-p99-ms`` /
+``--min-rps`` make the run exit non-zero when a threshold is missed.
+``--url`` drives an already running server instead (no fakes; RSS is then
+only this client's).
+"""
+import argparse
+import asyncio
+import json
+import logging
+import os
+import random
+import resource
+import sys
+import tempfile
+import time
+import uuid
+from typing import Dict, List
+
+import httpx
+
+from metrics import percentile
+
+CHAT_MESSAGES = [
+    "What is RF{acc:05d}?",
+    "Tell me about the family with {word}",
+    "Search the news about RNA vaccines",
+    "Who discovered ribozymes?",
+    "Hello there",
+]
+FAMILY_WORDS = ["rRNA", "tRNA", "snRNA", "miRNA", "Cis-reg"]
+TTS_SENTENCES = [
+    "Here is what I found about that RNA family.",
+    "The family has members in many species.",
+    "Is there anything else I can help you with?",
+    "Okay, goodbye! If you need any more help, just press the button.",
+]
+
+
+def _peak_rss_mb() -> float:
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # kilobytes on Linux, bytes on macOS
+    return peak / (1024 * 1024) if sys.platform == "darwin" else peak / 1024
+
+
+class Workload:
+    """Generates request bodies; ``unique`` controls how often texts repeat (cache hit rate)."""
+
+    def __init__(self, seed: int, unique: float, families: int):
+        self.random = random.Random(seed)
+        self.unique = unique
+        self.families = families
+
+    def chat_message(self) -> str:
+        template = self.random.choice(CHAT_MESSAGES)
+        spread = max(1, int(self.families * self.unique))
+        return template.format(acc=self.random.randint(1, spread), word=self.random.choice(FAMILY_WORDS))
+
+    def tts_text(self) -> str:
+        sentence = self.random.choice(TTS_SENTENCES)
+        if self.random.random() < self.unique:
+            sentence += f" Reference {self.random.randint(1, 10 ** 6)}."
+        return sentence
+
+
+async def _virtual_user(client: httpx.AsyncClient, endpoint: str, workload: Workload, turns: int,
+                        queue: asyncio.Queue, latencies: Dict[str, List[float]], errors: Dict[str, int]):
+    session_id = None
+    turn = 0
+    while True:
+        try:
+            queue.get_nowait()
+        except asyncio.QueueEmpty:
+            return
+        kind = endpoint if endpoint != "mixed" else workload.random.choice(["chat", "tts"])
+        if kind == "chat":
+            if turn % turns == 0:
+                session_id = str(uuid.uuid4())
+            turn += 1
+            path, body = "/chat", {"message": workload.chat_message(), "session_id": session_id}
+        else:
+            path, body = "/tts", {"text": workload.tts_text()}
+
+        started = time.perf_counter()
+        try:
+            response = await client.post(path, json=body)
+            ok = response.status_code == 200
+        except httpx.HTTPError:
+            ok = False
+        if ok:
+            latencies[kind].append(time.perf_counter() - started)
+        else:
+            errors[kind] += 1
+
+
+async def run(args) -> dict:
+    if args.url:
+        transport = None
+        base_url = args.url
+    else:
+        from bench.fakes import install_fakes
+        import app as app_module
+
+        install_fakes(args.rfam_path, args.model_latency, args.token_latency, args.tts_latency,
+                      args.search_latency, args.families)
+        # The app configures INFO logging on import; per-request lines would dominate the run
+        logging.getLogger().setLevel(args.log_level)
+        transport = httpx.ASGITransport(app=app_module.app)
+        base_url = "http://bench"
+
+    workload = Workload(args.seed, args.unique, args.families)
+    queue = asyncio.Queue()
+    for _ in range(args.requests):
+        queue.put_nowait(None)
+    latencies = {"chat": [], "tts": []}
+    errors = {"chat": 0, "tts": 0}
+
+    limits = httpx.Limits(max_connections=args.concurrency, max_keepalive_connections=args.concurrency)
+    async with httpx.AsyncClient(transport=transport, base_url=base_url, timeout=args.timeout, limits=limits) as client:
+        started = time.perf_counter()
+        await asyncio.gather(*(
+            _virtual_user(client, args.endpoint, workload, args.turns, queue, latencies, errors)
+            for _ in range(args.concurrency)
+        ))
+        elapsed = time.perf_counter() - started
+
+    report = {
+        "requests": args.requests,
+        "concurrency": args.concurrency,
+        "seconds": round(elapsed, 3),
+        "throughput_rps": round(sum(len(v) for v in latencies.values()) / elapsed, 2),
+        "peak_rss_mb": round(_peak_rss_mb(), 1),
+        "endpoints": {},
+    }
+    for kind, samples in latencies.items():
+        if not samples and not errors[kind]:
+            continue
+        report["endpoints"][kind] = {
+            "ok": len(samples),
+            "errors": errors[kind],
+            "throughput_rps": round(len(samples) / elapsed, 2),
+            "p50_ms": round(percentile(samples, 0.5) * 1000, 1),
+            "p99_ms": round(percentile(samples, 0.99) * 1000, 1),
+        }
+    return report
+
+
+def _print_report(report: dict):
+    print(f"{report['requests']} requests at concurrency {report['concurrency']} in {report['seconds']}s: "
+          f"{report['throughput_rps']} req/s, peak RSS {report['peak_rss_mb']} MB")
+    for kind, stats in report["endpoints"].items():
+        print(f"  /{kind:<5} ok={stats['ok']:<6} errors={stats['errors']:<5} {stats['throughput_rps']:>8} req/s  "
+              f"p50={stats['p50_ms']} ms  p99={stats['p99_ms']} ms")
+
+
+def _main():
+    parser = argparse.ArgumentParser(description="Drive /chat and /tts and report throughput and latency")
+    parser.add_argument("--endpoint", choices=["chat", "tts", "mixed"], default="mixed")
+    parser.add_argument("--requests", type=int, default=200)
+    parser.add_argument("--concurrency", type=int, default=16)
+    parser.add_argument("--turns", type=int, default=3, help="chat turns per session")
+    parser.add_argument("--unique", type=float, default=0.5,
+                        help="0..1, share of distinct texts (lower means more cache hits)")
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("--timeout", type=float, default=60)
+    parser.add_argument("--log-level", default="WARNING")
+    parser.add_argument("--url", help="target a running server instead of the in-process app with fakes")
+    fakes = parser.add_argument_group("fakes (in-process mode)")
+    fakes.add_argument("--model-latency", type=float, default=0.3, help="seconds to first model chunk")
+    fakes.add_argument("--token-latency", type=float, default=0.01, help="seconds between streamed words")
+    fakes.add_argument("--tts-latency", type=float, default=0.2)
+    fakes.add_argument("--search-latency", type=float, default=0.1)
+    fakes.add_argument("--families", type=int, default=4000, help="rows in the fake Rfam family table")
+    fakes.add_argument("--rfam-path", default=os.path.join(tempfile.gettempdir(), "bench_rfam.sqlite"))
+    ci = parser.add_argument_group("CI")
+    ci.add_argument("--json", help="also write the report to this file")
+    ci.add_argument("--max-p99-ms", type=float, help="fail if any endpoint's p99 exceeds this")
+    ci.add_argument("--min-rps", type=float, help="fail if overall throughput is below this")
+    ci.add_argument("--max-errors", type=int, default=0, help="fail if more requests than this fail")
+    args = parser.parse_args()
+
+    if not args.url:
+        # Keep the in-process app self-contained: no disk caches or schema files
+        os.environ.setdefault("TTS_CACHE_DIR", "")
+        os.environ.setdefault("RFAM_SCHEMA_CACHE", "")
+        os.environ.setdefault("SESSION_BACKEND", "memory")
+
+    report = asyncio.run(run(args))
+    _print_report(report)
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump(report, f, indent=2)
+
+    failures = []
+    for kind, stats in report["endpoints"].items():
+        if args.max_p99_ms is not None and stats["p99_ms"] > args.max_p99_ms:
+            failures.append(f"/{kind} p99 {stats['p99_ms']} ms > {args.max_p99_ms} ms")
+    if args.min_rps is not None and report["throughput_rps"] < args.min_rps:
+        failures.append(f"throughput {report['throughput_rps']} req/s < {args.min_rps} req/s")
+    total_errors = sum(stats["errors"] for stats in report["endpoints"].values())
+    if total_errors > args.max_errors:
+        failures.append(f"{total_errors} failed requests > {args.max_errors}")
+    for failure in failures:
+        print(f"FAIL: {failure}")
+    sys.exit(1 if failures else 0)
+
+
+if __name__ == "__main__":
+    _main()
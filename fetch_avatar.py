@@ -0,0 +1,90 @@
+"""
+Download the avatar once so the app can serve it locally (see static_assets.py)::
+
+    python fetch_avatar.py
+
+Ready Player Me does the optimization server-side: only the ``mouthOpen`` and
+``jawOpen`` morph targets the page animates are kept, geometry is
+meshopt-compressed (EXT_meshopt_compression) and textures are merged into one
+1024px atlas. The skeleton is kept whole because the skinned mesh needs every
+joint. If the gltf-transform CLI is on PATH, unused nodes and accessors are
+pruned as well.
+"""
+import argparse
+import json
+import os
+import shutil
+import struct
+import subprocess
+import sys
+import tempfile
+
+import httpx
+
+from static_assets import AVATAR_PATH, AVATAR_REMOTE_URL, remote_avatar_url
+
+
+def describe_glb(data: bytes) -> dict:
+    """Size, extensions and morph target names of a binary glTF, read from its JSON chunk."""
+    magic, version, _ = struct.unpack_from("<4sII", data, 0)
+    if magic != b"glTF" or version != 2:
+        raise ValueError("Not a glTF 2.0 binary")
+    chunk_length, chunk_type = struct.unpack_from("<II", data, 12)
+    if chunk_type != 0x4E4F534A:  # "JSON"
+        raise ValueError("GLB does not start with a JSON chunk")
+    document = json.loads(data[20:20 + chunk_length])
+    morphs = set()
+    for mesh in document.get("meshes", []):
+        morphs.update((mesh.get("extras") or {}).get("targetNames", []))
+    return {
+        "bytes": len(data),
+        "extensions": document.get("extensionsUsed", []),
+        "morph_targets": sorted(morphs),
+        "nodes": len(document.get("nodes", [])),
+    }
+
+
+def fetch(url: str, path: str, prune: bool = True) -> dict:
+    with httpx.Client(timeout=60, follow_redirects=True) as client:
+        response = client.get(url)
+        response.raise_for_status()
+    data = response.content
+    describe_glb(data)
+
+    if prune and shutil.which("gltf-transform"):
+        with tempfile.TemporaryDirectory() as tmp:
+            source, target = os.path.join(tmp, "in.glb"), os.path.join(tmp, "out.glb")
+            with open(source, "wb") as f:
+                f.write(data)
+            # prune keeps morph targets and skins; meshopt re-applies compression after it
+            subprocess.run(["gltf-transform", "prune", source, target], check=True)
+            subprocess.run(["gltf-transform", "meshopt", target, target], check=True)
+            with open(target, "rb") as f:
+                data = f.read()
+
+    os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+    tmp_path = f"{path}.tmp"
+    with open(tmp_path, "wb") as f:
+        f.write(data)
+    os.replace(tmp_path, path)
+    return describe_glb(data)
+
+
+def _main():
+    parser = argparse.ArgumentParser(description="Download an optimized copy of the avatar for local serving")
+    parser.add_argument("--url", default=AVATAR_REMOTE_URL, help="Ready Player Me .glb URL")
+    parser.add_argument("--path", default=AVATAR_PATH)
+    parser.add_argument("--no-prune", action="store_true", help="skip gltf-transform even if it is installed")
+    args = parser.parse_args()
+
+    try:
+        info = fetch(remote_avatar_url(args.url), args.path, prune=not args.no_prune)
+    except (httpx.HTTPError, ValueError, subprocess.CalledProcessError) as e:
+        print(f"Could not fetch the avatar: {e}", file=sys.stderr)
+        sys.exit(1)
+    print(f"Wrote {args.path}: {info['bytes']} bytes, morph targets {info['morph_targets']}, "
+          f"extensions {info['extensions']}")
+
+
+if __name__ == "__main__":
+    _main()
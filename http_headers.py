@@ -0,0 +1,25 @@
+"""
+Parsing for Accept-style request headers, shared by audio format and
+content-encoding negotiation.
+"""
+from typing import List, Optional, Tuple
+
+
+def parse_accept(header: Optional[str]) -> List[Tuple[str, float]]:
+    """
+    Split an Accept / Accept-Encoding header into (value, q) pairs in header
+    order. Values are lowercased; a missing q is 1.0 and an unreadable one 0.0.
+    """
+    items = []
+    for item in (header or "").split(","):
+        value, _, params = item.strip().partition(";")
+        quality = 1.0
+        for param in params.split(";"):
+            key, _, text = param.strip().partition("=")
+            if key == "q":
+                try:
+                    quality = float(text)
+                except ValueError:
+                    quality = 0.0
+        items.append((value.strip().lower(), quality))
+    return items
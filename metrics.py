@@ -0,0 +1,226 @@
+"""
+Latency histograms for model calls, tools and TTS, exposed in Prometheus format.
+
+Wrap work in ``with span(TOOL_SECONDS, tool="..."):`` to time it. Each
+histogram keeps cumulative buckets (aggregate these across workers with
+histogram_quantile) and a window of recent samples from which p50/p95/p99 are
+reported directly as a ``<name>_recent`` summary.
+"""
+import bisect
+import logging
+import threading
+import time
+from collections import deque
+from contextlib import contextmanager
+from typing import Dict, List, Tuple
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+QUANTILES = (0.5, 0.95, 0.99)
+
+LabelKey = Tuple[Tuple[str, str], ...]
+
+
+def _format_labels(labels: LabelKey, extra: Tuple[Tuple[str, str], ...] = ()) -> str:
+    pairs = labels + extra
+    if not pairs:
+        return ""
+    escaped = (str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n") for _, value in pairs)
+    return "{" + ",".join(f'{name}="{value}"' for (name, _), value in zip(pairs, escaped)) + "}"
+
+
+def _format_value(value: float) -> str:
+    return "+Inf" if value == float("inf") else repr(float(value))
+
+
+def percentile(samples, q: float) -> float:
+    """Nearest-rank q-quantile (0..1) of samples; 0.0 if there are none."""
+    if not samples:
+        return 0.0
+    ordered = sorted(samples)
+    return ordered[min(len(ordered) - 1, int(q * len(ordered)))]
+
+
+class _Series:
+    def __init__(self, bucket_count: int, window: int):
+        self.buckets = [0] * bucket_count
+        self.count = 0
+        self.sum = 0.0
+        self.recent = deque(maxlen=window)
+
+
+class Histogram:
+    """A latency histogram with one series per label set. Thread-safe."""
+
+    def __init__(self, name: str, documentation: str, buckets=DEFAULT_BUCKETS, window: int = 1024):
+        self.name = name
+        self.documentation = documentation
+        self.buckets = tuple(sorted(buckets))
+        self.window = window
+        self._series: Dict[LabelKey, _Series] = {}
+        self._lock = threading.Lock()
+
+    def observe(self, seconds: float, **labels: str):
+        key = tuple(sorted(labels.items()))
+        with self._lock:
+            series = self._series.get(key)
+            if series is None:
+                series = self._series[key] = _Series(len(self.buckets), self.window)
+            index = bisect.bisect_left(self.buckets, seconds)
+            if index < len(self.buckets):
+                series.buckets[index] += 1
+            series.count += 1
+            series.sum += seconds
+            series.recent.append(seconds)
+
+    def quantiles(self, **labels: str) -> Dict[float, float]:
+        """p50/p95/p99 over the recent window for one label set (empty if nothing was observed)."""
+        with self._lock:
+            series = self._series.get(tuple(sorted(labels.items())))
+            samples = sorted(series.recent) if series else []
+        if not samples:
+            return {}
+        return {q: percentile(samples, q) for q in QUANTILES}
+
+    def render(self) -> List[str]:
+        with self._lock:
+            snapshot = [(key, list(s.buckets), s.count, s.sum, sorted(s.recent)) for key, s in self._series.items()]
+
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} histogram"]
+        for key, buckets, count, total, _ in snapshot:
+            cumulative = 0
+            for bound, hits in zip(self.buckets, buckets):
+                cumulative += hits
+                lines.append(f"{self.name}_bucket{_format_labels(key, (('le', _format_value(bound)),))} {cumulative}")
+            lines.append(f"{self.name}_bucket{_format_labels(key, (('le', '+Inf'),))} {count}")
+            lines.append(f"{self.name}_sum{_format_labels(key)} {_format_value(total)}")
+            lines.append(f"{self.name}_count{_format_labels(key)} {count}")
+
+        recent = f"{self.name}_recent"
+        lines += [f"# HELP {recent} {self.documentation} (last {self.window} samples)", f"# TYPE {recent} summary"]
+        for key, _, _, _, samples in snapshot:
+            for q in QUANTILES:
+                value = percentile(samples, q)
+                lines.append(f"{recent}{_format_labels(key, (('quantile', str(q)),))} {_format_value(value)}")
+            lines.append(f"{recent}_sum{_format_labels(key)} {_format_value(sum(samples))}")
+            lines.append(f"{recent}_count{_format_labels(key)} {len(samples)}")
+        return lines
+
+
+class Counter:
+    """A monotonically increasing count with one series per label set. Thread-safe."""
+
+    def __init__(self, name: str, documentation: str):
+        self.name = name
+        self.documentation = documentation
+        self._values: Dict[LabelKey, float] = {}
+        self._lock = threading.Lock()
+
+    def inc(self, amount: float = 1, **labels: str):
+        key = tuple(sorted(labels.items()))
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def value(self, **labels: str) -> float:
+        with self._lock:
+            return self._values.get(tuple(sorted(labels.items())), 0)
+
+    def render(self) -> List[str]:
+        with self._lock:
+            snapshot = list(self._values.items())
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} counter"]
+        lines += [f"{self.name}{_format_labels(key)} {_format_value(value)}" for key, value in snapshot]
+        return lines
+
+
+class MetricsRegistry:
+    def __init__(self):
+        self._metrics: Dict[str, object] = {}
+
+    def histogram(self, name: str, documentation: str, **kwargs) -> Histogram:
+        if name not in self._metrics:
+            self._metrics[name] = Histogram(name, documentation, **kwargs)
+        return self._metrics[name]
+
+    def counter(self, name: str, documentation: str) -> Counter:
+        if name not in self._metrics:
+            self._metrics[name] = Counter(name, documentation)
+        return self._metrics[name]
+
+    def render(self) -> str:
+        """All metrics in the Prometheus text exposition format."""
+        lines = []
+        for metric in self._metrics.values():
+            lines += metric.render()
+        return "\n".join(lines) + "\n"
+
+
+registry = MetricsRegistry()
+
+TURN_SECONDS = registry.histogram("voicebot_turn_seconds", "Agent turn duration in seconds")
+MODEL_SECONDS = registry.histogram("voicebot_model_seconds", "Model call duration in seconds")
+MODEL_TTFT_SECONDS = registry.histogram("voicebot_model_ttft_seconds", "Model time to first response chunk in seconds")
+TOOL_SECONDS = registry.histogram("voicebot_tool_seconds", "Tool invocation duration in seconds")
+TTS_SECONDS = registry.histogram("voicebot_tts_seconds", "TTS synthesis duration in seconds")
+TTS_TTFB_SECONDS = registry.histogram("voicebot_tts_ttfb_seconds", "TTS time to first audio chunk in seconds")
+
+
+@contextmanager
+def span(histogram: Histogram, **labels: str):
+    """
+    Time the enclosed block and record it in histogram.
+
+    An ``outcome`` label ("ok" or "error") is added depending on whether the
+    block raised. Every span is also logged at debug level.
+    """
+    started = time.perf_counter()
+    outcome = "error"
+    try:
+        yield
+        outcome = "ok"
+    finally:
+        elapsed = time.perf_counter() - started
+        histogram.observe(elapsed, outcome=outcome, **labels)
+        if logger.isEnabledFor(logging.DEBUG):
+            logger.debug(f"span={histogram.name} outcome={outcome} "
+                         + " ".join(f"{k}={v}" for k, v in labels.items())
+                         + f" duration_ms={elapsed * 1000:.1f}")
+
+
+class ModelCallTimer:
+    """
+    Agent before/after model callbacks recording model call duration and time
+    to first chunk (with SSE streaming the after callback sees every partial
+    response; the call ends with the first non-partial one).
+    """
+
+    def __init__(self, max_in_flight: int = 1024):
+        self._started: Dict[str, Tuple[float, bool, str]] = {}
+        self._max_in_flight = max_in_flight
+
+    def before_model(self, callback_context, llm_request):
+        if len(self._started) >= self._max_in_flight:
+            # Calls that failed never reach after_model; forget the oldest
+            self._started.pop(next(iter(self._started)))
+        self._started[callback_context.invocation_id] = (time.perf_counter(), False, llm_request.model or "")
+        return None
+
+    def after_model(self, callback_context, llm_response):
+        entry = self._started.get(callback_context.invocation_id)
+        if entry is None:
+            return None
+        started, seen_first, model = entry
+        elapsed = time.perf_counter() - started
+        if not seen_first:
+            MODEL_TTFT_SECONDS.observe(elapsed, model=model)
+            self._started[callback_context.invocation_id] = (started, True, model)
+        if not llm_response.partial:
+            del self._started[callback_context.invocation_id]
+            outcome = "error" if llm_response.error_code else "ok"
+            MODEL_SECONDS.observe(elapsed, model=model, outcome=outcome)
+            logger.debug(f"span={MODEL_SECONDS.name} outcome={outcome} model={model} duration_ms={elapsed * 1000:.1f}")
+        return None
+
+
+model_call_timer = ModelCallTimer()
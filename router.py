@@ -0,0 +1,122 @@
+"""
+Fast path for turns that don't need the model.
+
+Closers ("no", "bye", "nothing else") get the canned goodbye plus the end
+token, and direct family lookups ("what is RF00005", "tell me about 5S_rRNA")
+are answered from one indexed ``family`` query. Everything else goes to the
+agent. Each decision is counted in ``voicebot_route_total`` and the most recent
+ones are kept for tuning the patterns (GET /router).
+"""
+import logging
+import os
+import re
+import time
+from collections import deque
+from typing import NamedTuple, Optional
+
+from metrics import registry
+from tools.rfam_db import lookup_family
+
+logger = logging.getLogger(__name__)
+
+ROUTER_ENABLED = os.environ.get("ROUTER_ENABLED", "1") == "1"
+ROUTER_HISTORY = int(os.environ.get("ROUTER_HISTORY", "200"))
+
+GOODBYE = "Okay, goodbye! If you need any more help, just press the 'Start Conversation' button."
+
+ROUTE_TOTAL = registry.counter("voicebot_route_total", "Turns by routing decision")
+
+_CLOSER = re.compile(
+    r"(?:(?:no|nope|nah|no thanks|no thank you|nothing|nothing else|nothing more|that's all|that is all|"
+    r"that's it|that is it|i'm done|i am done|all done|stop|bye|bye bye|goodbye|good bye|see you|cheers)"
+    r"(?: (?:thanks|thank you|thank you very much|that's all|that's it|bye|goodbye))*)",
+    re.IGNORECASE,
+)
+_ACCESSION = re.compile(r"RF\d{5}", re.IGNORECASE)
+_LOOKUP = re.compile(
+    r"(?:(?:what is|what's|whats|what are|tell me about|look up|lookup|describe|show me|show|find|explain)"
+    r"(?: the)?(?: rfam)?(?: family)? )?(?:rfam )?(?:family )?([\w.\-]+)",
+    re.IGNORECASE,
+)
+# Rfam IDs look like 5S_rRNA, tRNA, U6, mir-21, IRES_HCV: require an underscore,
+# a digit or "rna" so ordinary words ("what is love") aren't looked up
+_ID_LIKE = re.compile(r"(?=.*(?:_|\d|rna))[a-z0-9][\w.\-]*", re.IGNORECASE)
+
+
+class Route(NamedTuple):
+    kind: str  # "closer", "lookup" or "agent"
+    reply: Optional[str] = None
+    reason: str = ""
+
+
+def _normalize(message: str) -> str:
+    text = message.strip().replace("’", "'")
+    text = re.sub(r"[^\w'\s.\-]", " ", text)
+    return " ".join(text.split()).strip(" .")
+
+
+def _family_answer(row: dict) -> str:
+    kind = "; ".join(part.strip() for part in row.get("type", "").split(";") if part.strip())
+    answer = f"{row['rfam_acc']} is {row['rfam_id']}: {row.get('description', '').rstrip('.')}."
+    if kind:
+        answer += f" It's a {kind} family"
+        if row.get("number_of_species", "NULL") != "NULL":
+            answer += f" found in {row['number_of_species']} species"
+        answer += "."
+    return answer + " Is there anything else?"
+
+
+class Router:
+    """Pattern-based classifier in front of the agent, with a log of recent decisions."""
+
+    def __init__(self, enabled: bool = ROUTER_ENABLED, history: int = ROUTER_HISTORY):
+        self.enabled = enabled
+        self.recent = deque(maxlen=history)
+
+    def classify(self, message: str) -> Route:
+        """
+        Decide how to answer a user message.
+
+        Lookups hit the database (mirror, result cache or remote), so call this
+        from a worker thread.
+
+        Returns:
+            A Route; ``reply`` is set unless the message falls through to the agent.
+        """
+        text = _normalize(message)
+        if not self.enabled or not text:
+            return Route("agent", reason="disabled" if not self.enabled else "empty")
+        if _CLOSER.fullmatch(text):
+            return Route("closer", f"{GOODBYE} [END_CONVERSATION]", "closer phrase")
+
+        match = _LOOKUP.fullmatch(text)
+        if not match:
+            return Route("agent", reason="no pattern")
+        key = match.group(1).strip(".-")
+        if _ACCESSION.fullmatch(key):
+            column, value = "rfam_acc", key.upper()
+        elif _ID_LIKE.fullmatch(key):
+            column, value = "rfam_id", key
+        else:
+            return Route("agent", reason="not an accession or ID")
+        try:
+            row = lookup_family(column, value)
+        except Exception as e:
+            logger.warning(f"Fast-path family lookup failed, using the agent: {e}")
+            return Route("agent", reason="lookup failed")
+        if row is None:
+            return Route("agent", reason=f"no family with {column} {value}")
+        return Route("lookup", _family_answer(row), f"{column} {value}")
+
+    def record(self, message: str, route: Route, seconds: float):
+        ROUTE_TOTAL.inc(route=route.kind)
+        self.recent.append({"at": time.time(), "message": message, "route": route.kind,
+                            "reason": route.reason, "ms": round(seconds * 1000, 1)})
+        logger.debug(f"Routed turn to {route.kind} ({route.reason}) in {seconds * 1000:.1f}ms")
+
+    def stats(self) -> dict:
+        counts = {kind: ROUTE_TOTAL.value(route=kind) for kind in ("closer", "lookup", "agent")}
+        return {"enabled": self.enabled, "counts": counts, "recent": list(self.recent)}
+
+
+router = Router()
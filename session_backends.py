@@ -0,0 +1,421 @@
+"""
+Session storage shared between workers.
+
+By default sessions live in process memory (sessions.BoundedSessionService),
+which ties a conversation to one worker. Set SESSION_BACKEND to ``sqlite``
+(a file on a volume every worker mounts) or ``redis`` (any server speaking the
+Redis protocol) so follow-up turns can land on any worker or container.
+
+Events are written append-only, one row/list entry each, and sessions are read
+back with only their most recent SESSION_LOAD_EVENTS events.
+"""
+import abc
+import asyncio
+import json
+import logging
+import os
+import sqlite3
+import threading
+import time
+import uuid
+from typing import Any, Dict, List, Optional, Tuple
+
+from google.adk.events import Event
+from google.adk.sessions import BaseSessionService, Session
+from google.adk.sessions.base_session_service import GetSessionConfig, ListSessionsResponse
+from google.adk.sessions.state import State
+
+from sessions import SESSION_TTL, BoundedSessionService
+
+logger = logging.getLogger(__name__)
+
+SESSION_BACKEND = os.environ.get("SESSION_BACKEND", "memory").lower()
+SESSION_SQLITE_PATH = os.environ.get("SESSION_SQLITE_PATH", "sessions.sqlite")
+SESSION_REDIS_URL = os.environ.get("SESSION_REDIS_URL", "redis://localhost:6379/0")
+# Events read back per turn; the prompt only uses recent turns anyway
+SESSION_LOAD_EVENTS = int(os.environ.get("SESSION_LOAD_EVENTS", "200"))
+# Events kept per session in Redis (older ones are trimmed)
+SESSION_REDIS_MAX_EVENTS = int(os.environ.get("SESSION_REDIS_MAX_EVENTS", "1000"))
+
+# Session state plus app:/user: state deltas, split by scope
+_StateDeltas = Tuple[Dict[str, Any], Dict[str, Any], Dict[str, Any]]
+
+
+def _split_state(state: Optional[Dict[str, Any]]) -> _StateDeltas:
+    session_state, app_state, user_state = {}, {}, {}
+    for key, value in (state or {}).items():
+        if key.startswith(State.APP_PREFIX):
+            app_state[key.removeprefix(State.APP_PREFIX)] = value
+        elif key.startswith(State.USER_PREFIX):
+            user_state[key.removeprefix(State.USER_PREFIX)] = value
+        elif not key.startswith(State.TEMP_PREFIX):
+            session_state[key] = value
+    return session_state, app_state, user_state
+
+
+def _merged_state(session_state: dict, app_state: dict, user_state: dict) -> dict:
+    state = dict(session_state)
+    state.update({State.APP_PREFIX + key: value for key, value in app_state.items()})
+    state.update({State.USER_PREFIX + key: value for key, value in user_state.items()})
+    return state
+
+
+class SharedSessionService(BaseSessionService):
+    """
+    BaseSessionService over an external store.
+
+    Subclasses implement the blocking ``_store_*`` primitives; the async ADK
+    interface runs them in a worker thread. Blocking ``*_sync`` variants are
+    provided for VoiceAgent.process_message.
+    """
+
+    backend = "shared"
+
+    def __init__(self, load_events: int = SESSION_LOAD_EVENTS):
+        self.load_events = load_events
+        self.counters = {"created": 0, "loaded": 0, "appended": 0}
+
+    # Store primitives
+
+    @abc.abstractmethod
+    def _store_create(self, app_name: str, user_id: str, session_id: str, deltas: _StateDeltas, now: float):
+        ...
+
+    @abc.abstractmethod
+    def _store_load(self, app_name: str, user_id: str, session_id: str, limit: Optional[int],
+                    after: Optional[float]) -> Optional[Tuple[dict, float, List[str]]]:
+        """Return (merged_state, last_update_time, event_json oldest first) or None."""
+
+    @abc.abstractmethod
+    def _store_append(self, app_name: str, user_id: str, session_id: str, event_json: str,
+                      deltas: _StateDeltas, timestamp: float):
+        ...
+
+    @abc.abstractmethod
+    def _store_list(self, app_name: str, user_id: str) -> List[Tuple[str, float]]:
+        ...
+
+    @abc.abstractmethod
+    def _store_delete(self, app_name: str, user_id: str, session_id: str):
+        ...
+
+    # Blocking interface
+
+    def create_session_sync(self, *, app_name: str, user_id: str, state: Optional[dict] = None,
+                            session_id: Optional[str] = None) -> Session:
+        session_id = session_id.strip() if session_id and session_id.strip() else str(uuid.uuid4())
+        now = time.time()
+        self._store_create(app_name, user_id, session_id, _split_state(state), now)
+        self.counters["created"] += 1
+        return self.get_session_sync(app_name=app_name, user_id=user_id, session_id=session_id)
+
+    def get_session_sync(self, *, app_name: str, user_id: str, session_id: str,
+                         config: Optional[GetSessionConfig] = None) -> Optional[Session]:
+        limit = self.load_events or None
+        after = None
+        if config is not None:
+            if config.num_recent_events:
+                limit = config.num_recent_events
+            after = config.after_timestamp
+        loaded = self._store_load(app_name, user_id, session_id, limit, after)
+        if loaded is None:
+            return None
+        state, last_update_time, events = loaded
+        self.counters["loaded"] += 1
+        return Session(
+            app_name=app_name,
+            user_id=user_id,
+            id=session_id,
+            state=state,
+            events=[Event.model_validate_json(event) for event in events],
+            last_update_time=last_update_time,
+        )
+
+    # ADK interface
+
+    async def create_session(self, *, app_name: str, user_id: str, state: Optional[dict] = None,
+                             session_id: Optional[str] = None) -> Session:
+        return await asyncio.to_thread(self.create_session_sync, app_name=app_name, user_id=user_id,
+                                       state=state, session_id=session_id)
+
+    async def get_session(self, *, app_name: str, user_id: str, session_id: str,
+                          config: Optional[GetSessionConfig] = None) -> Optional[Session]:
+        return await asyncio.to_thread(self.get_session_sync, app_name=app_name, user_id=user_id,
+                                       session_id=session_id, config=config)
+
+    async def list_sessions(self, *, app_name: str, user_id: str) -> ListSessionsResponse:
+        rows = await asyncio.to_thread(self._store_list, app_name, user_id)
+        return ListSessionsResponse(sessions=[
+            Session(app_name=app_name, user_id=user_id, id=session_id, state={}, last_update_time=updated)
+            for session_id, updated in rows
+        ])
+
+    async def delete_session(self, *, app_name: str, user_id: str, session_id: str) -> None:
+        await asyncio.to_thread(self._store_delete, app_name, user_id, session_id)
+
+    async def append_event(self, session: Session, event: Event) -> Event:
+        if event.partial:
+            return event
+        await super().append_event(session=session, event=event)
+        session.last_update_time = event.timestamp
+        deltas = _split_state(event.actions.state_delta if event.actions else None)
+        await asyncio.to_thread(self._store_append, session.app_name, session.user_id, session.id,
+                                event.model_dump_json(exclude_none=True), deltas, event.timestamp)
+        self.counters["appended"] += 1
+        return event
+
+    def stats(self) -> dict:
+        return {"backend": self.backend, **self.counters}
+
+
+class SqliteSessionService(SharedSessionService):
+    """
+    Sessions in a SQLite file, one connection per thread.
+
+    WAL mode lets readers and the writer of different workers proceed at once;
+    that needs all workers on the same host (e.g. containers sharing a
+    volume), not a network filesystem. Sessions idle past ``ttl`` are swept
+    on session creation.
+    """
+
+    backend = "sqlite"
+
+    def __init__(self, path: str = SESSION_SQLITE_PATH, ttl: float = SESSION_TTL,
+                 load_events: int = SESSION_LOAD_EVENTS):
+        super().__init__(load_events)
+        self.path = path
+        self.ttl = ttl
+        self.counters["expired"] = 0
+        self._local = threading.local()
+        connection = self._connection()
+        with connection:
+            connection.executescript("""
+                CREATE TABLE IF NOT EXISTS sessions (
+                    app_name TEXT, user_id TEXT, session_id TEXT, state TEXT, update_time REAL,
+                    PRIMARY KEY (app_name, user_id, session_id));
+                CREATE INDEX IF NOT EXISTS ix_sessions_update_time ON sessions (update_time);
+                CREATE TABLE IF NOT EXISTS events (
+                    id INTEGER PRIMARY KEY AUTOINCREMENT,
+                    app_name TEXT, user_id TEXT, session_id TEXT, timestamp REAL, event TEXT);
+                CREATE INDEX IF NOT EXISTS ix_events_session ON events (app_name, user_id, session_id, id);
+                CREATE TABLE IF NOT EXISTS app_states (app_name TEXT PRIMARY KEY, state TEXT);
+                CREATE TABLE IF NOT EXISTS user_states (
+                    app_name TEXT, user_id TEXT, state TEXT, PRIMARY KEY (app_name, user_id));
+            """)
+
+    def _connection(self) -> sqlite3.Connection:
+        connection = getattr(self._local, "connection", None)
+        if connection is None:
+            connection = sqlite3.connect(self.path, timeout=10, isolation_level=None)
+            connection.execute("PRAGMA journal_mode=WAL")
+            connection.execute("PRAGMA synchronous=NORMAL")
+            self._local.connection = connection
+        return connection
+
+    @staticmethod
+    def _merge_scoped(connection: sqlite3.Connection, app_name: str, user_id: str, deltas: _StateDeltas):
+        _, app_delta, user_delta = deltas
+        # json_patch merges in SQL, so concurrent workers never overwrite each other's keys
+        if app_delta:
+            connection.execute(
+                "INSERT INTO app_states VALUES (?, ?) ON CONFLICT (app_name) "
+                "DO UPDATE SET state = json_patch(state, excluded.state)",
+                (app_name, json.dumps(app_delta)))
+        if user_delta:
+            connection.execute(
+                "INSERT INTO user_states VALUES (?, ?, ?) ON CONFLICT (app_name, user_id) "
+                "DO UPDATE SET state = json_patch(state, excluded.state)",
+                (app_name, user_id, json.dumps(user_delta)))
+
+    def _sweep(self, connection: sqlite3.Connection, now: float):
+        expired = connection.execute(
+            "SELECT app_name, user_id, session_id FROM sessions WHERE update_time < ?", (now - self.ttl,)
+        ).fetchall()
+        for key in expired:
+            self._delete(connection, *key)
+        self.counters["expired"] += len(expired)
+
+    @staticmethod
+    def _delete(connection: sqlite3.Connection, app_name: str, user_id: str, session_id: str):
+        connection.execute("DELETE FROM events WHERE app_name = ? AND user_id = ? AND session_id = ?",
+                           (app_name, user_id, session_id))
+        connection.execute("DELETE FROM sessions WHERE app_name = ? AND user_id = ? AND session_id = ?",
+                           (app_name, user_id, session_id))
+
+    def _store_create(self, app_name, user_id, session_id, deltas, now):
+        connection = self._connection()
+        connection.execute("BEGIN IMMEDIATE")
+        try:
+            self._sweep(connection, now)
+            try:
+                connection.execute("INSERT INTO sessions VALUES (?, ?, ?, ?, ?)",
+                                   (app_name, user_id, session_id, json.dumps(deltas[0]), now))
+            except sqlite3.IntegrityError:
+                raise ValueError(f"Session {session_id} already exists")
+            self._merge_scoped(connection, app_name, user_id, deltas)
+            connection.execute("COMMIT")
+        except BaseException:
+            connection.execute("ROLLBACK")
+            raise
+
+    def _store_load(self, app_name, user_id, session_id, limit, after):
+        connection = self._connection()
+        row = connection.execute(
+            "SELECT state, update_time FROM sessions WHERE app_name = ? AND user_id = ? AND session_id = ?",
+            (app_name, user_id, session_id)).fetchone()
+        if row is None:
+            return None
+        app_row = connection.execute("SELECT state FROM app_states WHERE app_name = ?", (app_name,)).fetchone()
+        user_row = connection.execute("SELECT state FROM user_states WHERE app_name = ? AND user_id = ?",
+                                      (app_name, user_id)).fetchone()
+        events = connection.execute(
+            "SELECT event FROM events WHERE app_name = ? AND user_id = ? AND session_id = ? AND timestamp >= ? "
+            "ORDER BY id DESC LIMIT ?",
+            (app_name, user_id, session_id, after or 0, limit or -1)).fetchall()
+        state = _merged_state(json.loads(row[0]), json.loads(app_row[0]) if app_row else {},
+                              json.loads(user_row[0]) if user_row else {})
+        return state, row[1], [event for (event,) in reversed(events)]
+
+    def _store_append(self, app_name, user_id, session_id, event_json, deltas, timestamp):
+        connection = self._connection()
+        connection.execute("BEGIN IMMEDIATE")
+        try:
+            connection.execute("INSERT INTO events (app_name, user_id, session_id, timestamp, event) "
+                               "VALUES (?, ?, ?, ?, ?)", (app_name, user_id, session_id, timestamp, event_json))
+            connection.execute(
+                "UPDATE sessions SET update_time = ?, state = json_patch(state, ?) "
+                "WHERE app_name = ? AND user_id = ? AND session_id = ?",
+                (timestamp, json.dumps(deltas[0]), app_name, user_id, session_id))
+            self._merge_scoped(connection, app_name, user_id, deltas)
+            connection.execute("COMMIT")
+        except BaseException:
+            connection.execute("ROLLBACK")
+            raise
+
+    def _store_list(self, app_name, user_id):
+        return self._connection().execute(
+            "SELECT session_id, update_time FROM sessions WHERE app_name = ? AND user_id = ?",
+            (app_name, user_id)).fetchall()
+
+    def _store_delete(self, app_name, user_id, session_id):
+        connection = self._connection()
+        connection.execute("BEGIN IMMEDIATE")
+        try:
+            self._delete(connection, app_name, user_id, session_id)
+            connection.execute("COMMIT")
+        except BaseException:
+            connection.execute("ROLLBACK")
+            raise
+
+    def stats(self) -> dict:
+        (count,) = self._connection().execute("SELECT COUNT(*) FROM sessions").fetchone()
+        return {**super().stats(), "sessions": count, "path": self.path}
+
+
+class RedisSessionService(SharedSessionService):
+    """
+    Sessions in Redis (or any server speaking its protocol, e.g. Valkey).
+
+    Per session: a hash of state, a list of event JSON and an entry in the
+    user's sorted set of sessions. Every write refreshes the session keys'
+    expiry to ``ttl``, so idle sessions disappear on their own.
+    """
+
+    backend = "redis"
+
+    def __init__(self, url: str = SESSION_REDIS_URL, ttl: float = SESSION_TTL,
+                 load_events: int = SESSION_LOAD_EVENTS, max_events: int = SESSION_REDIS_MAX_EVENTS,
+                 prefix: str = "voicebot"):
+        super().__init__(load_events)
+        try:
+            import redis
+        except ImportError:
+            raise RuntimeError("SESSION_BACKEND=redis requires the 'redis' package (pip install redis)")
+        self.client = redis.Redis.from_url(url, decode_responses=True)
+        self.ttl = int(ttl)
+        self.max_events = max_events
+        self.prefix = prefix
+
+    def _key(self, *parts: str) -> str:
+        return ":".join((self.prefix, *parts))
+
+    def _session_keys(self, app_name, user_id, session_id):
+        base = self._key(app_name, user_id, session_id)
+        return f"{base}:meta", f"{base}:state", f"{base}:events"
+
+    def _write_deltas(self, pipe, app_name, user_id, session_id, deltas: _StateDeltas):
+        session_delta, app_delta, user_delta = deltas
+        for key, delta in ((self._session_keys(app_name, user_id, session_id)[1], session_delta),
+                           (self._key(app_name, "app_state"), app_delta),
+                           (self._key(app_name, user_id, "user_state"), user_delta)):
+            if delta:
+                pipe.hset(key, mapping={k: json.dumps(v) for k, v in delta.items()})
+
+    def _expire(self, pipe, app_name, user_id, session_id):
+        for key in self._session_keys(app_name, user_id, session_id):
+            pipe.expire(key, self.ttl)
+
+    def _store_create(self, app_name, user_id, session_id, deltas, now):
+        meta, _, _ = self._session_keys(app_name, user_id, session_id)
+        if not self.client.hsetnx(meta, "update_time", now):
+            raise ValueError(f"Session {session_id} already exists")
+        pipe = self.client.pipeline()
+        self._write_deltas(pipe, app_name, user_id, session_id, deltas)
+        pipe.zadd(self._key(app_name, user_id, "sessions"), {session_id: now})
+        # Drop index entries of sessions that expired
+        pipe.zremrangebyscore(self._key(app_name, user_id, "sessions"), "-inf", now - self.ttl)
+        self._expire(pipe, app_name, user_id, session_id)
+        pipe.execute()
+
+    def _store_load(self, app_name, user_id, session_id, limit, after):
+        meta, state_key, events_key = self._session_keys(app_name, user_id, session_id)
+        pipe = self.client.pipeline(transaction=False)
+        pipe.hget(meta, "update_time")
+        pipe.hgetall(state_key)
+        pipe.hgetall(self._key(app_name, "app_state"))
+        pipe.hgetall(self._key(app_name, user_id, "user_state"))
+        pipe.lrange(events_key, -limit if limit else 0, -1)
+        update_time, session_state, app_state, user_state, events = pipe.execute()
+        if update_time is None:
+            return None
+        if after:
+            events = [event for event in events if json.loads(event).get("timestamp", 0) >= after]
+        state = _merged_state(*({k: json.loads(v) for k, v in scope.items()}
+                                for scope in (session_state, app_state, user_state)))
+        return state, float(update_time), events
+
+    def _store_append(self, app_name, user_id, session_id, event_json, deltas, timestamp):
+        meta, _, events_key = self._session_keys(app_name, user_id, session_id)
+        pipe = self.client.pipeline()
+        pipe.rpush(events_key, event_json)
+        if self.max_events:
+            pipe.ltrim(events_key, -self.max_events, -1)
+        pipe.hset(meta, "update_time", timestamp)
+        self._write_deltas(pipe, app_name, user_id, session_id, deltas)
+        pipe.zadd(self._key(app_name, user_id, "sessions"), {session_id: timestamp})
+        self._expire(pipe, app_name, user_id, session_id)
+        pipe.execute()
+
+    def _store_list(self, app_name, user_id):
+        index = self._key(app_name, user_id, "sessions")
+        self.client.zremrangebyscore(index, "-inf", time.time() - self.ttl)
+        return [(session_id, score) for session_id, score in self.client.zrange(index, 0, -1, withscores=True)]
+
+    def _store_delete(self, app_name, user_id, session_id):
+        pipe = self.client.pipeline()
+        pipe.delete(*self._session_keys(app_name, user_id, session_id))
+        pipe.zrem(self._key(app_name, user_id, "sessions"), session_id)
+        pipe.execute()
+
+
+def session_service_from_env() -> BaseSessionService:
+    """Build the session service selected by SESSION_BACKEND (memory, sqlite or redis)."""
+    if SESSION_BACKEND == "sqlite":
+        logger.info(f"Storing sessions in SQLite at {SESSION_SQLITE_PATH}")
+        return SqliteSessionService()
+    if SESSION_BACKEND == "redis":
+        logger.info(f"Storing sessions in Redis at {SESSION_REDIS_URL}")
+        return RedisSessionService()
+    if SESSION_BACKEND != "memory":
+        raise ValueError(f"Unknown SESSION_BACKEND '{SESSION_BACKEND}' (use memory, sqlite or redis)")
+    return BoundedSessionService()
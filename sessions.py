@@ -0,0 +1,187 @@
+"""
+Bounded conversation memory.
+
+BoundedSessionService evicts idle sessions and caps how many are kept, and
+history_window_callback keeps the prompt sent to the model from growing with
+the length of the conversation.
+"""
+import logging
+import os
+import time
+from collections import OrderedDict
+from typing import List, Optional
+
+from google.adk.sessions import InMemorySessionService
+from google.genai.types import Content, FunctionResponse, Part
+
+logger = logging.getLogger(__name__)
+
+# Sessions idle longer than this are dropped
+SESSION_TTL = float(os.environ.get("SESSION_TTL", "1800"))
+SESSION_MAX = int(os.environ.get("SESSION_MAX", "1000"))
+# The last SESSION_VERBATIM_TURNS turns are sent to the model untouched; tool
+# outputs in older turns are collapsed, and turns beyond SESSION_HISTORY_TURNS
+# are not sent at all.
+SESSION_VERBATIM_TURNS = int(os.environ.get("SESSION_VERBATIM_TURNS", "4"))
+SESSION_HISTORY_TURNS = int(os.environ.get("SESSION_HISTORY_TURNS", "20"))
+SESSION_TOOL_SUMMARY_CHARS = int(os.environ.get("SESSION_TOOL_SUMMARY_CHARS", "300"))
+
+
+def _is_user_turn(content: Optional[Content]) -> bool:
+    # Function responses are also sent with role "user"; a turn starts with user text
+    return bool(content and content.role == "user" and any(part.text for part in content.parts or []))
+
+
+def _collapse_part(part: Part, max_chars: int) -> Part:
+    """Return part with a large function response replaced by a short summary."""
+    if not part.function_response:
+        return part
+    response = part.function_response.response or {}
+    if response.get("compacted"):
+        return part
+    text = str(response.get("result", response))
+    if len(text) <= max_chars:
+        return part
+    summary = f"{text[:max_chars].rstrip()}… [earlier tool output, {len(text) - max_chars} more chars elided]"
+    return Part(function_response=FunctionResponse(
+        id=part.function_response.id,
+        name=part.function_response.name,
+        response={"result": summary, "compacted": True},
+    ))
+
+
+def compact_contents(contents: List[Content], verbatim_turns: int = SESSION_VERBATIM_TURNS,
+                     history_turns: int = SESSION_HISTORY_TURNS,
+                     max_tool_chars: int = SESSION_TOOL_SUMMARY_CHARS) -> List[Content]:
+    """
+    Window a conversation to its recent turns.
+
+    A turn runs from one user message to the next, so tool calls and their
+    responses are never separated.
+
+    Args:
+        contents: Conversation history, oldest first.
+        verbatim_turns: Most recent turns kept unchanged.
+        history_turns: Turns kept at all; older ones are dropped.
+        max_tool_chars: Tool outputs in older turns are cut to this many characters.
+
+    Returns:
+        A new list; the input contents are not modified.
+    """
+    starts = [index for index, content in enumerate(contents) if _is_user_turn(content)]
+    if len(starts) <= verbatim_turns:
+        return contents
+    first = starts[-history_turns] if len(starts) > history_turns else 0
+    verbatim_from = starts[-verbatim_turns] if verbatim_turns else len(contents)
+
+    compacted = []
+    for content in contents[first:verbatim_from]:
+        if any(part.function_response for part in content.parts or []):
+            content = Content(role=content.role, parts=[_collapse_part(part, max_tool_chars) for part in content.parts])
+        compacted.append(content)
+    return compacted + contents[verbatim_from:]
+
+
+def history_window_callback(callback_context, llm_request):
+    """Agent before_model_callback applying compact_contents to every model call."""
+    llm_request.contents = compact_contents(llm_request.contents)
+    return None
+
+
+class BoundedSessionService(InMemorySessionService):
+    """
+    InMemorySessionService with idle expiry, an LRU cap and compacted storage.
+
+    Sessions untouched for ``ttl`` seconds are dropped, and once more than
+    ``max_sessions`` exist the least recently used ones go first. Tool outputs
+    in stored events older than the verbatim window are collapsed when a new
+    turn starts, so long conversations don't keep large SQL results alive.
+    """
+
+    def __init__(self, ttl: float = SESSION_TTL, max_sessions: int = SESSION_MAX,
+                 verbatim_turns: int = SESSION_VERBATIM_TURNS, max_tool_chars: int = SESSION_TOOL_SUMMARY_CHARS):
+        super().__init__()
+        self.ttl = ttl
+        self.max_sessions = max_sessions
+        self.verbatim_turns = verbatim_turns
+        self.max_tool_chars = max_tool_chars
+        # (app_name, user_id, session_id) -> last access, least recently used first
+        self._access = OrderedDict()
+        self.counters = {"expired": 0, "evicted": 0, "compacted": 0}
+
+    def _touch(self, key):
+        self._access[key] = time.monotonic()
+        self._access.move_to_end(key)
+
+    def _drop(self, key):
+        self._access.pop(key, None)
+        app_name, user_id, session_id = key
+        user_sessions = self.sessions.get(app_name, {}).get(user_id)
+        if user_sessions is None:
+            return
+        user_sessions.pop(session_id, None)
+        if not user_sessions:
+            self.sessions[app_name].pop(user_id, None)
+
+    def evict(self):
+        """Drop expired sessions and, past the cap, the least recently used ones."""
+        now = time.monotonic()
+        while self._access:
+            key, last_used = next(iter(self._access.items()))
+            if now - last_used > self.ttl:
+                self.counters["expired"] += 1
+            elif len(self._access) > self.max_sessions:
+                self.counters["evicted"] += 1
+            else:
+                break
+            logger.debug(f"Dropping session {key[2]}")
+            self._drop(key)
+
+    def _create_session_impl(self, *, app_name, user_id, state=None, session_id=None):
+        session = super()._create_session_impl(app_name=app_name, user_id=user_id, state=state, session_id=session_id)
+        self._touch((app_name, user_id, session.id))
+        self.evict()
+        return session
+
+    def _get_session_impl(self, *, app_name, user_id, session_id, config=None):
+        key = (app_name, user_id, session_id)
+        self.evict()
+        session = super()._get_session_impl(app_name=app_name, user_id=user_id, session_id=session_id, config=config)
+        if session is not None:
+            self._touch(key)
+        return session
+
+    def _delete_session_impl(self, *, app_name, user_id, session_id):
+        super()._delete_session_impl(app_name=app_name, user_id=user_id, session_id=session_id)
+        self._access.pop((app_name, user_id, session_id), None)
+
+    async def append_event(self, session, event):
+        event = await super().append_event(session, event)
+        key = (session.app_name, session.user_id, session.id)
+        if key in self._access:
+            self._touch(key)
+            if event.author == "user" and not event.partial:
+                self._compact_stored(key)
+        return event
+
+    def _compact_stored(self, key):
+        app_name, user_id, session_id = key
+        stored = self.sessions.get(app_name, {}).get(user_id, {}).get(session_id)
+        if stored is None:
+            return
+        starts = [index for index, event in enumerate(stored.events)
+                  if event.author == "user" and _is_user_turn(event.content)]
+        if len(starts) <= self.verbatim_turns:
+            return
+        verbatim_from = starts[-self.verbatim_turns] if self.verbatim_turns else len(stored.events)
+        for event in stored.events[:verbatim_from]:
+            parts = event.content.parts if event.content else None
+            if not parts or not any(part.function_response for part in parts):
+                continue
+            collapsed = [_collapse_part(part, self.max_tool_chars) for part in parts]
+            if any(new is not old for new, old in zip(collapsed, parts)):
+                event.content = Content(role=event.content.role, parts=collapsed)
+                self.counters["compacted"] += 1
+
+    def stats(self) -> dict:
+        return {"sessions": len(self._access), "max_sessions": self.max_sessions, "ttl": self.ttl, **self.counters}
@@ -0,0 +1,106 @@
+"""
+In-memory static assets served with ETags and pre-compressed bodies.
+
+Each asset is rendered/read once, then gzip- and (if the ``brotli`` package is
+installed) Brotli-compressed once; requests only pick a body. The page itself
+is revalidated on every visit (cheap 304s), while content-addressed files
+such as the avatar GLB are cached by browsers as immutable.
+"""
+import gzip
+import hashlib
+import os
+from typing import Dict, Optional
+
+from starlette.requests import Request
+from starlette.responses import Response
+
+from http_headers import parse_accept
+
+# Local copy of the avatar (see fetch_avatar.py); the remote model is used if it's missing
+AVATAR_PATH = os.environ.get("AVATAR_PATH", "static/avatar.glb")
+AVATAR_REMOTE_URL = os.environ.get("AVATAR_REMOTE_URL", "https://models.readyplayer.me/6921e87fbcfe438b18908217.glb")
+# Ready Player Me options: only the morph targets the page animates, meshopt-compressed geometry, one 1024px atlas
+AVATAR_PARAMS = "morphTargets=mouthOpen,jawOpen&useMeshOptCompression=true&textureAtlas=1024&textureSizeLimit=1024"
+
+IMMUTABLE = "public, max-age=31536000, immutable"
+REVALIDATE = "no-cache"
+
+# Bodies smaller than this aren't worth compressing
+_MIN_COMPRESS_BYTES = 1024
+
+
+def negotiate_encoding(accept_encoding: Optional[str], available) -> Optional[str]:
+    """
+    Pick the best of ``available`` encodings ("br", "gzip") allowed by an
+    Accept-Encoding header, preferring Brotli on ties. None means identity.
+    """
+    candidates = []
+    for coding, quality in parse_accept(accept_encoding):
+        for name in ([coding] if coding != "*" else ["br", "gzip"]):
+            if name in available and quality > 0:
+                candidates.append((-quality, 0 if name == "br" else 1, name))
+    return min(candidates)[2] if candidates else None
+
+
+class StaticAsset:
+    """One file's body, its compressed variants and a content-derived ETag."""
+
+    def __init__(self, body: bytes, media_type: str, cache_control: str = REVALIDATE):
+        self.body = body
+        self.media_type = media_type
+        self.cache_control = cache_control
+        self.digest = hashlib.sha256(body).hexdigest()[:16]
+        self.etag = f'"{self.digest}"'
+        self.encoded: Dict[str, bytes] = {}
+        if len(body) >= _MIN_COMPRESS_BYTES:
+            self.encoded["gzip"] = gzip.compress(body, compresslevel=9, mtime=0)
+            try:
+                import brotli
+            except ImportError:
+                brotli = None
+            if brotli is not None:
+                # Quality 11 is slow on multi-megabyte files; 9 is nearly as small
+                self.encoded["br"] = brotli.compress(body, quality=11 if len(body) < 256 * 1024 else 9)
+            # Keep only variants that actually save bytes
+            self.encoded = {name: data for name, data in self.encoded.items() if len(data) < len(body)}
+
+    @classmethod
+    def from_file(cls, path: str, media_type: str, cache_control: str = REVALIDATE) -> "StaticAsset":
+        with open(path, "rb") as f:
+            return cls(f.read(), media_type, cache_control)
+
+    def response(self, request: Request) -> Response:
+        """200 with the best encoding the client accepts, or 304 if its cached copy is current."""
+        headers = {"ETag": self.etag, "Cache-Control": self.cache_control, "Vary": "Accept-Encoding"}
+        if_none_match = request.headers.get("if-none-match", "")
+        if self.etag in (tag.strip().removeprefix("W/") for tag in if_none_match.split(",")):
+            return Response(status_code=304, headers=headers)
+        encoding = negotiate_encoding(request.headers.get("accept-encoding"), self.encoded)
+        if encoding is None:
+            return Response(self.body, media_type=self.media_type, headers=headers)
+        headers["Content-Encoding"] = encoding
+        return Response(self.encoded[encoding], media_type=self.media_type, headers=headers)
+
+    def stats(self) -> dict:
+        return {"bytes": len(self.body), "etag": self.etag,
+                **{f"{name}_bytes": len(data) for name, data in self.encoded.items()}}
+
+
+def load_avatar() -> Optional[StaticAsset]:
+    """The local avatar GLB as an immutable asset, or None if it hasn't been fetched."""
+    if not AVATAR_PATH or not os.path.exists(AVATAR_PATH):
+        return None
+    return StaticAsset.from_file(AVATAR_PATH, "model/gltf-binary", IMMUTABLE)
+
+
+def remote_avatar_url(url: str = AVATAR_REMOTE_URL) -> str:
+    """A Ready Player Me model URL with the optimization options (AVATAR_PARAMS) applied."""
+    separator = "&" if "?" in url else "?"
+    return f"{url}{separator}{AVATAR_PARAMS}"
+
+
+def avatar_url(avatar: Optional[StaticAsset]) -> str:
+    """URL the page loads the avatar from: the content-addressed local copy, else the optimized remote model."""
+    if avatar is not None:
+        return f"/assets/avatar.{avatar.digest}.glb"
+    return remote_avatar_url()
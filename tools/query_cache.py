@@ -0,0 +1,185 @@
+import logging
+import os
+import re
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from typing import Callable, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+# String literals and quoted identifiers are kept verbatim; everything else is
+# case- and whitespace-normalized.
+_QUOTED = re.compile(r"('(?:[^'\\]|\\.|'')*'|\"(?:[^\"\\]|\\.)*\"|`[^`]*`)")
+_WHITESPACE = re.compile(r'\s+')
+
+
+def canonicalize_sql(query: str) -> str:
+    """Normalize whitespace, keyword/identifier case and trailing semicolons so equivalent queries share a key."""
+    parts = []
+    for index, segment in enumerate(_QUOTED.split(query)):
+        if index % 2:
+            parts.append(segment)
+        else:
+            parts.append(_WHITESPACE.sub(" ", segment.lower()))
+    return "".join(parts).strip().rstrip(";").strip()
+
+
+class _Flight:
+    def __init__(self):
+        self.done = threading.Event()
+        self.result = None
+        self.error = None
+        self.followers = 0
+
+
+class QueryResultCache:
+    """
+    Thread-safe TTL cache for rendered query results with single-flight misses.
+
+    Entries are evicted least-recently-used once either ``max_rows`` (summed
+    over entries) or ``max_bytes`` is exceeded. With ``path`` set, entries are
+    also written to a SQLite file and survive restarts until they expire.
+    """
+
+    def __init__(self, ttl: float, max_rows: int, max_bytes: int, path: Optional[str] = None):
+        self.ttl = ttl
+        self.max_rows = max_rows
+        self.max_bytes = max_bytes
+        self._entries: "OrderedDict[str, Tuple[float, int, str, float]]" = OrderedDict()
+        self._rows = 0
+        self._bytes = 0
+        self._lock = threading.Lock()
+        self._in_flight = {}
+        self.counters = {
+            "hits": 0,
+            "misses": 0,
+            "coalesced": 0,
+            "expired": 0,
+            "evictions": 0,
+            "db_seconds": 0.0,
+            "db_seconds_saved": 0.0,
+        }
+        self._db = None
+        if path:
+            self._db = sqlite3.connect(path, check_same_thread=False)
+            self._db.execute(
+                "CREATE TABLE IF NOT EXISTS query_cache "
+                "(key TEXT PRIMARY KEY, expires_at REAL, rows INTEGER, result TEXT, elapsed REAL)"
+            )
+            self._db.execute("DELETE FROM query_cache WHERE expires_at < ?", (time.time(),))
+            self._db.commit()
+            for key, expires_at, rows, result, elapsed in self._db.execute(
+                "SELECT key, expires_at, rows, result, elapsed FROM query_cache ORDER BY expires_at"
+            ):
+                self._store(key, (expires_at, rows, result, elapsed), persist=False)
+
+    def _store(self, key: str, entry: Tuple[float, int, str, float], persist: bool = True):
+        _, rows, result, _ = entry
+        if rows > self.max_rows or len(result) > self.max_bytes:
+            return
+        self._discard(key)
+        self._entries[key] = entry
+        self._rows += rows
+        self._bytes += len(result)
+        while self._rows > self.max_rows or self._bytes > self.max_bytes:
+            self._discard(next(iter(self._entries)))
+            self.counters["evictions"] += 1
+        if persist and self._db is not None and key in self._entries:
+            self._db.execute("INSERT OR REPLACE INTO query_cache VALUES (?, ?, ?, ?, ?)", (key, *entry))
+            self._db.commit()
+
+    def _discard(self, key: str):
+        entry = self._entries.pop(key, None)
+        if entry is None:
+            return
+        self._rows -= entry[1]
+        self._bytes -= len(entry[2])
+        if self._db is not None:
+            self._db.execute("DELETE FROM query_cache WHERE key = ?", (key,))
+            self._db.commit()
+
+    def _get_fresh(self, key: str) -> Optional[Tuple[float, int, str, float]]:
+        entry = self._entries.get(key)
+        if entry is None:
+            return None
+        if entry[0] < time.time():
+            self._discard(key)
+            self.counters["expired"] += 1
+            return None
+        self._entries.move_to_end(key)
+        return entry
+
+    def get_or_compute(self, key: str, compute: Callable[[], Tuple[str, int]]) -> str:
+        """
+        Return the cached result for key, or run compute() once for all
+        concurrent callers. compute returns (result_text, row_count); if it
+        raises, every waiter gets the exception and nothing is cached.
+        """
+        with self._lock:
+            entry = self._get_fresh(key)
+            if entry is not None:
+                self.counters["hits"] += 1
+                self.counters["db_seconds_saved"] += entry[3]
+                return entry[2]
+            flight = self._in_flight.get(key)
+            leader = flight is None
+            if leader:
+                flight = self._in_flight[key] = _Flight()
+                self.counters["misses"] += 1
+            else:
+                flight.followers += 1
+                self.counters["coalesced"] += 1
+
+        if not leader:
+            flight.done.wait()
+            if flight.error is not None:
+                raise flight.error
+            with self._lock:
+                self.counters["db_seconds_saved"] += flight.result[1]
+            return flight.result[0]
+
+        started = time.monotonic()
+        try:
+            result, rows = compute()
+            elapsed = time.monotonic() - started
+            flight.result = (result, elapsed)
+            with self._lock:
+                self.counters["db_seconds"] += elapsed
+                self._store(key, (time.time() + self.ttl, rows, result, elapsed))
+            return result
+        except Exception as e:
+            flight.error = e
+            raise
+        finally:
+            with self._lock:
+                del self._in_flight[key]
+            flight.done.set()
+
+    def followers(self, key: str) -> int:
+        """Number of callers waiting on another caller's in-flight computation of key."""
+        with self._lock:
+            flight = self._in_flight.get(key)
+            return flight.followers if flight else 0
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                **self.counters,
+                "entries": len(self._entries),
+                "rows": self._rows,
+                "bytes": self._bytes,
+                "max_rows": self.max_rows,
+                "max_bytes": self.max_bytes,
+                "ttl": self.ttl,
+            }
+
+    @classmethod
+    def from_env(cls) -> "QueryResultCache":
+        return cls(
+            ttl=float(os.environ.get("RFAM_CACHE_TTL", "86400")),
+            max_rows=int(os.environ.get("RFAM_CACHE_MAX_ROWS", "50000")),
+            max_bytes=int(os.environ.get("RFAM_CACHE_MAX_BYTES", str(16 * 1024 * 1024))),
+            path=os.environ.get("RFAM_CACHE_PATH") or None,
+        )
@@ -1,43 +1,404 @@
+import asyncio
+import contextvars
+import logging
+import os
+import threading
+import time
+from contextlib import contextmanager
+from typing import List, Optional, Tuple
+
 import mysql.connector
+from mysql.connector import errorcode, pooling
+
+from metrics import TOOL_SECONDS, span
+from tools.query_cache import QueryResultCache, canonicalize_sql
+from tools.rfam_mirror import RfamMirror
+from tools.rfam_schema import DB_CONFIG, SchemaCatalog
+from tools.sql_gate import QueryRejected, check_cost, needs_cost_check, prepare_query, to_sqlite
+
+logger = logging.getLogger(__name__)
+
+POOL_SIZE = int(os.environ.get("RFAM_POOL_SIZE", "5"))
+CONNECT_TIMEOUT = int(os.environ.get("RFAM_CONNECT_TIMEOUT", "10"))
+# Server-side limit per query, applied with a MAX_EXECUTION_TIME optimizer hint
+QUERY_TIMEOUT_MS = int(os.environ.get("RFAM_QUERY_TIMEOUT_MS", "10000"))
+# Pooled connections idle longer than this are pinged (and reconnected) before use
+PING_IDLE_SECONDS = float(os.environ.get("RFAM_POOL_PING_IDLE", "30"))
+# Budget for the result text fed back to the model
+RESULT_MAX_ROWS = int(os.environ.get("RFAM_RESULT_MAX_ROWS", "50"))
+RESULT_MAX_CHARS = int(os.environ.get("RFAM_RESULT_MAX_CHARS", "4000"))
+RESULT_MAX_CELL_CHARS = int(os.environ.get("RFAM_RESULT_MAX_CELL_CHARS", "200"))
+# Rows past the budget are counted (not kept) up to this many; beyond that the
+# connection is dropped rather than transferring the rest.
+RESULT_DRAIN_ROWS = int(os.environ.get("RFAM_RESULT_DRAIN_ROWS", "1000"))
+# LIMIT added to queries without one, and the cap applied to larger LIMITs
+DEFAULT_LIMIT = int(os.environ.get("RFAM_DEFAULT_LIMIT", "10"))
+MAX_LIMIT = int(os.environ.get("RFAM_MAX_LIMIT", "100"))
+# Remote queries touching tables at least this big are EXPLAINed first and
+# rejected if the plan examines more than RFAM_MAX_SCAN_ROWS rows
+EXPLAIN_MIN_TABLE_ROWS = int(os.environ.get("RFAM_EXPLAIN_MIN_TABLE_ROWS", "100000"))
+MAX_SCAN_ROWS = int(os.environ.get("RFAM_MAX_SCAN_ROWS", "1000000"))
+SCHEMA_CACHE_PATH = os.environ.get("RFAM_SCHEMA_CACHE", ".rfam_schema.json")
+CATALOG_RETRY_SECONDS = 60
+
+# Client errors meaning the connection itself is gone and the query can be retried
+_CONNECTION_LOST = {
+    errorcode.CR_SERVER_GONE_ERROR,
+    errorcode.CR_SERVER_LOST,
+    errorcode.CR_SERVER_LOST_EXTENDED,
+    errorcode.CR_CONN_HOST_ERROR,
+}
+
+_pool = None
+_pool_lock = threading.Lock()
+# mysql.connector raises instead of waiting when the pool is exhausted, so
+# callers queue on this semaphore first.
+_pool_slots = threading.BoundedSemaphore(POOL_SIZE)
+_async_slots = asyncio.Semaphore(POOL_SIZE)
+_last_used = {}
+_catalog = None
+_catalog_attempted = None
+_catalog_lock = threading.Lock()
+
+# Set by execute_sql_query_async; visible in its worker thread (to_thread copies context)
+_query_handle = contextvars.ContextVar("rfam_query_handle", default=None)
+
+# Rfam is release-versioned and read-only, so identical queries can share results
+result_cache = QueryResultCache.from_env()
+
+# Optional local snapshot (see tools/rfam_mirror.py) tried before the remote server
+mirror = RfamMirror(os.environ.get("RFAM_MIRROR_PATH"))
+
+
+class _QueryHandle:
+    """Lets an async caller stop the remote query its worker thread is running."""
+
+    def __init__(self):
+        self.cache_key = None
+        self.connection_id = None
+        self.cancelled = False
+        self._lock = threading.Lock()
+
+    def start(self, connection_id: int) -> bool:
+        """Record the connection about to run the query; False if the caller already gave up."""
+        with self._lock:
+            if self.cancelled and not self._shared():
+                return False
+            self.connection_id = connection_id
+            return True
+
+    def finish(self):
+        with self._lock:
+            self.connection_id = None
+
+    def cancel(self):
+        with self._lock:
+            self.cancelled = True
+            connection_id = self.connection_id
+        # Keep going if other callers are waiting for the same result
+        if connection_id is not None and not self._shared():
+            threading.Thread(target=_kill_query, args=(connection_id,), daemon=True).start()
+
+    def _shared(self) -> bool:
+        return self.cache_key is not None and result_cache.followers(self.cache_key) > 0
+
+
+def _kill_query(connection_id: int):
+    try:
+        connection = mysql.connector.connect(connection_timeout=CONNECT_TIMEOUT, **DB_CONFIG)
+        try:
+            cursor = connection.cursor()
+            cursor.execute(f"KILL QUERY {int(connection_id)}")
+            cursor.close()
+        finally:
+            connection.close()
+        logger.info(f"Cancelled Rfam query on connection {connection_id}")
+    except mysql.connector.Error as e:
+        logger.warning(f"Could not cancel Rfam query on connection {connection_id}: {e}")
+
+
+def get_pool() -> pooling.MySQLConnectionPool:
+    """Return the process-wide Rfam connection pool, creating it on first use."""
+    global _pool
+    with _pool_lock:
+        if _pool is None:
+            _pool = pooling.MySQLConnectionPool(
+                pool_name="rfam",
+                pool_size=POOL_SIZE,
+                pool_reset_session=False,
+                connection_timeout=CONNECT_TIMEOUT,
+                **DB_CONFIG
+            )
+    return _pool
+
+
+@contextmanager
+def get_connection():
+    """
+    Borrow a connection from the pool, health-checking it if it has been idle.
+
+    The connection goes back to the pool on exit. If the caller fails, the
+    connection is pinged before its next use.
+    """
+    if not _pool_slots.acquire(timeout=CONNECT_TIMEOUT):
+        raise TimeoutError("Timed out waiting for a Rfam database connection")
+    try:
+        connection = get_pool().get_connection()
+        try:
+            if time.monotonic() - _last_used.get(connection.connection_id, 0) > PING_IDLE_SECONDS:
+                connection.ping(reconnect=True, attempts=2, delay=0)
+            key = connection.connection_id
+            try:
+                yield connection
+            except Exception:
+                _last_used.pop(key, None)
+                raise
+            _last_used[key] = time.monotonic()
+        finally:
+            connection.close()
+    finally:
+        _pool_slots.release()
+
+
+def get_catalog() -> Optional[SchemaCatalog]:
+    """
+    Return the schema catalog used to validate queries, loading it on first use
+    from the JSON cache, the remote database or the local mirror (in that order).
+    Returns None (no name validation) if none is available; loading is retried
+    after CATALOG_RETRY_SECONDS.
+    """
+    global _catalog, _catalog_attempted
+    with _catalog_lock:
+        if _catalog is None and (_catalog_attempted is None or time.monotonic() - _catalog_attempted > CATALOG_RETRY_SECONDS):
+            _catalog_attempted = time.monotonic()
+            _catalog = _load_catalog()
+    return _catalog
+
+
+def warm_up():
+    """
+    Load the schema catalog and open the connection pool ahead of the first
+    query (blocking; call from a worker thread).
+    """
+    get_catalog()
+    with get_connection():
+        pass
+
+
+def _load_catalog() -> Optional[SchemaCatalog]:
+    if SCHEMA_CACHE_PATH and os.path.exists(SCHEMA_CACHE_PATH):
+        try:
+            return SchemaCatalog.load(SCHEMA_CACHE_PATH)
+        except (OSError, ValueError, KeyError) as e:
+            logger.warning(f"Ignoring unreadable Rfam schema cache: {e}")
+    try:
+        with get_connection() as connection:
+            cursor = connection.cursor()
+            try:
+                catalog = SchemaCatalog.from_cursor(cursor)
+            finally:
+                cursor.close()
+        if SCHEMA_CACHE_PATH:
+            try:
+                catalog.save(SCHEMA_CACHE_PATH)
+            except OSError as e:
+                logger.warning(f"Could not write Rfam schema cache: {e}")
+        return catalog
+    except Exception as e:
+        logger.warning(f"Could not introspect Rfam schema: {e}")
+    if mirror.enabled:
+        return mirror.catalog()
+    return None
+
+
+def _is_connection_lost(error: Exception) -> bool:
+    return isinstance(error, mysql.connector.errors.InterfaceError) or getattr(error, "errno", None) in _CONNECTION_LOST
+
+
+def _cell(value) -> str:
+    if value is None:
+        return "NULL"
+    if isinstance(value, (bytes, bytearray)):
+        value = value.decode("utf-8", errors="replace")
+    text = " ".join(str(value).split())
+    if len(text) > RESULT_MAX_CELL_CHARS:
+        text = text[:RESULT_MAX_CELL_CHARS - 1] + "…"
+    return text
+
+
+def format_results(cursor, max_rows: int = RESULT_MAX_ROWS, max_chars: int = RESULT_MAX_CHARS,
+                   drain_rows: int = RESULT_DRAIN_ROWS) -> Tuple[str, int, bool]:
+    """
+    Render a cursor's rows as a header line plus tab-separated rows within a budget.
+
+    Rows are pulled with fetchmany and rendering stops at ``max_rows`` rows or
+    ``max_chars`` characters, followed by a "N more rows truncated" footer.
+    Rows past the budget are only counted, and at most ``drain_rows`` of them.
+
+    Args:
+        cursor: A DB-API cursor with a pending result set (tuple rows).
+
+    Returns:
+        (text, rows_shown, exhausted); exhausted is False if unread rows are
+        left on the cursor.
+    """
+    columns = [column[0] for column in cursor.description]
+    lines = ["\t".join(columns)]
+    used = len(lines[0])
+    shown = 0
+    skipped = 0
+
+    batch = cursor.fetchmany(max_rows + 1)
+    while batch:
+        for index, row in enumerate(batch):
+            line = "\t".join(_cell(value) for value in row)
+            if shown >= max_rows or used + len(line) + 1 > max_chars:
+                skipped = len(batch) - index
+                break
+            lines.append(line)
+            used += len(line) + 1
+            shown += 1
+        if skipped:
+            break
+        batch = cursor.fetchmany(max_rows)
+
+    if not shown and not skipped:
+        return "No results found.", 0, True
+
+    exhausted = True
+    if skipped:
+        while skipped < drain_rows:
+            batch = cursor.fetchmany(min(1000, drain_rows - skipped))
+            if not batch:
+                break
+            skipped += len(batch)
+        else:
+            exhausted = False
+        lines.append(f"... {'at least ' if not exhausted else ''}{skipped} more rows truncated")
+
+    return "\n".join(lines), shown, exhausted
+
 
 def execute_sql_query(query: str) -> str:
     """
     Execute a SQL query against the Rfam public database.
-    
+
     Args:
         query: The SQL query to execute.
-        
+
     Returns:
         A string summary of the results or an error message.
     """
     try:
-        # Basic safety check to prevent modification queries
-        if not query.strip().lower().startswith("select"):
-            return "Error: Only SELECT queries are allowed."
-            
-        connection = mysql.connector.connect(
-            host='mysql-rfam-public.ebi.ac.uk',
-            user='rfamro',
-            port=4497,
-            database='Rfam'
-        )
-        
-        cursor = connection.cursor(dictionary=True)
-        
-        # Limit results to prevent overwhelming the context
-        if "limit" not in query.lower():
-            query += " LIMIT 10"
-            
-        cursor.execute(query)
-        results = cursor.fetchall()
-        
-        cursor.close()
-        connection.close()
-        
-        if not results:
-            return "No results found."
-            
-        return str(results)
-        
+        with span(TOOL_SECONDS, tool="execute_sql_query"):
+            # Parse and validate locally; also injects or clamps LIMIT and adds the timeout hint
+            query, tables = prepare_query(query, get_catalog(), DEFAULT_LIMIT, MAX_LIMIT, QUERY_TIMEOUT_MS)
+
+            key = canonicalize_sql(query)
+            handle = _query_handle.get()
+            if handle is not None:
+                handle.cache_key = key
+            return result_cache.get_or_compute(key, lambda: _run_query(query, tables))
+
+    except QueryRejected as e:
+        return f"Error: {str(e)}"
     except Exception as e:
         return f"Error executing query: {str(e)}"
+
+
+def lookup_family(column: str, value: str) -> Optional[dict]:
+    """
+    Fetch one family row by an indexed key, through the same cache, mirror and pool as execute_sql_query.
+
+    Args:
+        column: ``rfam_acc`` or ``rfam_id``.
+        value: The accession or ID to match exactly.
+
+    Returns:
+        The row as a dict of column -> text, or None if there is no such family.
+    """
+    if column not in ("rfam_acc", "rfam_id"):
+        raise ValueError(f"Can't look up families by {column}")
+    literal = value.replace("\\", "\\\\").replace("'", "''")
+    query = (f"SELECT /*+ MAX_EXECUTION_TIME({QUERY_TIMEOUT_MS}) */ rfam_acc, rfam_id, description, type, "
+             f"number_of_species FROM family WHERE {column} = '{literal}' LIMIT 1")
+    text = result_cache.get_or_compute(canonicalize_sql(query), lambda: _run_query(query, ["family"]))
+    lines = text.split("\n")
+    if len(lines) < 2:
+        return None
+    return dict(zip(lines[0].split("\t"), lines[1].split("\t")))
+
+
+def _run_query(query: str, tables: List[str]) -> Tuple[str, int]:
+    """Run query on the local mirror or the remote database and return (result_text, rows_shown)."""
+    cursor = mirror.try_execute(to_sqlite(query), tables) if mirror.enabled else None
+    if cursor is None:
+        return _run_remote_query(query, tables)
+    try:
+        text, shown, _ = format_results(cursor)
+    finally:
+        cursor.close()
+    return text, shown
+
+
+def _run_remote_query(query: str, tables: List[str]) -> Tuple[str, int]:
+    """Run query on a pooled connection to the remote Rfam server."""
+    cost_check = needs_cost_check(tables, get_catalog(), EXPLAIN_MIN_TABLE_ROWS)
+
+    # Retry once on a fresh connection if the pooled one was dropped
+    for attempt in range(2):
+        try:
+            with get_connection() as connection:
+                if cost_check:
+                    cursor = connection.cursor(dictionary=True)
+                    try:
+                        check_cost(cursor, query, MAX_SCAN_ROWS)
+                    finally:
+                        cursor.close()
+                handle = _query_handle.get()
+                if handle is not None and not handle.start(connection.connection_id):
+                    raise QueryRejected("Query cancelled.")
+                try:
+                    cursor = connection.cursor(buffered=False)
+                    cursor.execute(query)
+                    text, shown, exhausted = format_results(cursor)
+                finally:
+                    if handle is not None:
+                        handle.finish()
+                if exhausted:
+                    cursor.close()
+                else:
+                    # Too many unread rows to drain: drop the connection instead
+                    # of transferring them. It reconnects on next checkout.
+                    _last_used.pop(connection.connection_id, None)
+                    connection.disconnect()
+            return text, shown
+        except mysql.connector.Error as e:
+            if attempt or not _is_connection_lost(e):
+                raise
+            logger.warning(f"Rfam connection lost, retrying: {e}")
+
+
+async def execute_sql_query_async(query: str) -> str:
+    """
+    Execute a SQL query against the Rfam public database.
+
+    Args:
+        query: The SQL query to execute.
+
+    Returns:
+        A string summary of the results or an error message.
+    """
+    # Runs in a worker thread so other conversations keep going while the
+    # remote query is in flight. If the turn is cancelled the thread can't be
+    # stopped, so the query is killed on the server instead.
+    handle = _QueryHandle()
+    token = _query_handle.set(handle)
+    try:
+        async with _async_slots:
+            return await asyncio.to_thread(execute_sql_query, query)
+    except asyncio.CancelledError:
+        handle.cancel()
+        raise
+    finally:
+        _query_handle.reset(token)
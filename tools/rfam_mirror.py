@@ -0,0 +1,252 @@
+"""
+Local SQLite mirror of the Rfam tables the agent queries.
+
+Build a snapshot with::
+
+    python -m tools.rfam_mirror --path rfam_mirror.sqlite
+
+and point RFAM_MIRROR_PATH at it. execute_sql_query then answers queries that
+only touch mirrored tables locally and falls back to the remote MySQL server
+for anything else (other tables, missing columns, MySQL-only syntax).
+"""
+import argparse
+import logging
+import os
+import re
+import sqlite3
+import threading
+import time
+from datetime import datetime, timezone
+from typing import Dict, List, Optional
+
+import mysql.connector
+
+from tools.rfam_schema import DB_CONFIG, IMPORTANT_TABLES, SchemaCatalog, describe_tables
+
+logger = logging.getLogger(__name__)
+
+# Table -> mirrored columns (None = all). rfamseq is large, so by default only
+# the columns the agent's instruction advertises are copied.
+DEFAULT_MIRROR_TABLES: Dict[str, Optional[List[str]]] = {
+    "family": None,
+    "clan": None,
+    "taxonomy": None,
+    "rfamseq": ["rfamseq_acc", "ncbi_id", "description", "mol_type"],
+}
+
+_TABLE_REF = re.compile(r'\b(?:from|join)\s+`?(\w+)`?(?:\s*\.\s*`?(\w+)`?)?', re.IGNORECASE)
+
+
+def parse_tables_spec(spec: str) -> Dict[str, Optional[List[str]]]:
+    """
+    Parse a mirror spec such as ``family,clan,rfamseq:rfamseq_acc|description``
+    (table names, each optionally followed by ``:`` and ``|``-separated columns).
+    """
+    tables = {}
+    for item in filter(None, (part.strip() for part in spec.split(","))):
+        name, _, columns = item.partition(":")
+        tables[name.strip()] = [c.strip() for c in columns.split("|") if c.strip()] or None
+    return tables
+
+
+def referenced_tables(query: str) -> List[str]:
+    """Best-effort list of table names appearing after FROM/JOIN."""
+    return [(second or first).lower() for first, second in _TABLE_REF.findall(query)]
+
+
+def _sqlite_type(mysql_type: str) -> str:
+    mysql_type = mysql_type.lower()
+    if "int" in mysql_type:
+        return "INTEGER"
+    if any(t in mysql_type for t in ("double", "float", "decimal", "real")):
+        return "REAL"
+    # Rfam's MySQL collation compares strings case-insensitively; match it
+    return "TEXT COLLATE NOCASE"
+
+
+def _sqlite_value(value):
+    if isinstance(value, (bytes, bytearray)):
+        return value.decode("utf-8", errors="replace")
+    if isinstance(value, (int, float, str)) or value is None:
+        return value
+    return str(value)
+
+
+def build_mirror(path: str, tables: Dict[str, Optional[List[str]]] = DEFAULT_MIRROR_TABLES,
+                 batch_size: int = 5000):
+    """
+    Snapshot tables from the remote Rfam database into a SQLite file.
+
+    Rows are streamed with an unbuffered cursor and written in batches, so
+    memory use is bounded by ``batch_size`` regardless of table size. The new
+    file replaces ``path`` atomically once complete.
+
+    Args:
+        path: Destination SQLite file.
+        tables: Table -> columns to copy (None for all columns).
+        batch_size: Rows fetched and inserted per batch.
+    """
+    tmp_path = f"{path}.building"
+    if os.path.exists(tmp_path):
+        os.remove(tmp_path)
+
+    remote = mysql.connector.connect(**DB_CONFIG)
+    local = sqlite3.connect(tmp_path)
+    try:
+        cursor = remote.cursor()
+        schema = describe_tables(cursor, list(tables))
+        cursor.close()
+
+        local.execute("CREATE TABLE _mirror_meta (key TEXT PRIMARY KEY, value TEXT)")
+        partial = []
+        for table_name, wanted in tables.items():
+            if table_name not in schema:
+                logger.warning(f"Table {table_name} not found in Rfam, skipping")
+                continue
+            # Field, Type, Null, Key, Default, Extra
+            columns = [col for col in schema[table_name] if wanted is None or col[0] in wanted]
+            names = [col[0] for col in columns]
+            if len(columns) < len(schema[table_name]):
+                partial.append(table_name)
+            column_defs = ", ".join(f'"{col[0]}" {_sqlite_type(col[1])}' for col in columns)
+            local.execute(f'CREATE TABLE "{table_name}" ({column_defs})')
+
+            started = time.monotonic()
+            copied = 0
+            cursor = remote.cursor(buffered=False)
+            cursor.execute(f"SELECT {', '.join(f'`{n}`' for n in names)} FROM `{table_name}`")
+            placeholders = ", ".join("?" for _ in names)
+            while True:
+                rows = cursor.fetchmany(batch_size)
+                if not rows:
+                    break
+                local.executemany(
+                    f'INSERT INTO "{table_name}" VALUES ({placeholders})',
+                    ([_sqlite_value(v) for v in row] for row in rows)
+                )
+                copied += len(rows)
+            cursor.close()
+            local.commit()
+
+            # Index the columns MySQL indexes (PRI/UNI/MUL)
+            for col in columns:
+                if col[3]:
+                    collate = " COLLATE NOCASE" if _sqlite_type(col[1]).startswith("TEXT") else ""
+                    local.execute(f'CREATE INDEX "ix_{table_name}_{col[0]}" ON "{table_name}" ("{col[0]}"{collate})')
+            local.commit()
+            logger.info(f"Mirrored {copied} rows of {table_name} in {time.monotonic() - started:.1f}s")
+
+        release = None
+        try:
+            cursor = remote.cursor()
+            cursor.execute("SELECT rfam_release FROM version LIMIT 1")
+            row = cursor.fetchone()
+            cursor.close()
+            release = str(row[0]) if row else None
+        except mysql.connector.Error as e:
+            logger.warning(f"Could not read Rfam release: {e}")
+
+        local.executemany("INSERT INTO _mirror_meta VALUES (?, ?)", [
+            ("rfam_release", release),
+            ("snapshot_at", datetime.now(timezone.utc).isoformat()),
+            ("tables", ",".join(t for t in tables if t in schema)),
+            ("partial_tables", ",".join(partial)),
+        ])
+        local.commit()
+    finally:
+        local.close()
+        remote.close()
+
+    os.replace(tmp_path, path)
+
+
+class RfamMirror:
+    """Read-only access to a mirror built by build_mirror, one SQLite connection per thread."""
+
+    def __init__(self, path: Optional[str]):
+        self.path = path if path and os.path.exists(path) else None
+        self._local = threading.local()
+        self.meta: Dict[str, str] = {}
+        self.tables = set()
+        self.counters = {"local": 0, "remote": 0, "fallbacks": 0}
+        if self.path:
+            connection = self._connection()
+            self.meta = dict(connection.execute("SELECT key, value FROM _mirror_meta"))
+            self.tables = {t for t in self.meta.get("tables", "").split(",") if t}
+            logger.info(f"Using Rfam mirror {self.path} (release {self.meta.get('rfam_release')}, "
+                        f"snapshot {self.meta.get('snapshot_at')})")
+
+    @property
+    def enabled(self) -> bool:
+        return self.path is not None
+
+    def _connection(self) -> sqlite3.Connection:
+        connection = getattr(self._local, "connection", None)
+        if connection is None:
+            connection = sqlite3.connect(f"file:{self.path}?mode=ro", uri=True)
+            self._local.connection = connection
+        return connection
+
+    def covers(self, query: str, tables: Optional[List[str]] = None) -> bool:
+        """True if every table the query references is mirrored."""
+        if tables is None:
+            tables = referenced_tables(query)
+        return self.enabled and bool(tables) and all(t in self.tables for t in tables)
+
+    def catalog(self) -> SchemaCatalog:
+        """
+        Schema catalog of the mirrored tables and columns. Tables copied with
+        only some columns are marked partial, so queries on their other
+        columns still pass validation and go to the remote server.
+        """
+        if "partial_tables" in self.meta:
+            partial = [t for t in self.meta["partial_tables"].split(",") if t]
+        else:
+            # Built before partial tables were recorded; assume any table may be partial
+            partial = self.tables
+        return SchemaCatalog.from_sqlite(self._connection(), sorted(self.tables), partial)
+
+    def try_execute(self, query: str, tables: Optional[List[str]] = None) -> Optional[sqlite3.Cursor]:
+        """
+        Execute query locally if the mirror holds its tables.
+
+        Args:
+            query: SQL in SQLite dialect.
+            tables: Tables the query references, if already known from parsing.
+
+        Returns:
+            A cursor positioned on the results, or None if the caller should use the remote database.
+        """
+        if not self.covers(query, tables):
+            self.counters["remote"] += 1
+            return None
+        try:
+            cursor = self._connection().execute(query)
+        except sqlite3.Error as e:
+            # Unmirrored column or MySQL-only syntax
+            logger.info(f"Rfam mirror can't answer query, using remote: {e}")
+            self.counters["fallbacks"] += 1
+            return None
+        self.counters["local"] += 1
+        return cursor
+
+    def stats(self) -> dict:
+        return {**self.counters, **self.meta, "enabled": self.enabled}
+
+
+def _main():
+    parser = argparse.ArgumentParser(description="Snapshot Rfam tables into a local SQLite mirror")
+    parser.add_argument("--path", default=os.environ.get("RFAM_MIRROR_PATH", "rfam_mirror.sqlite"))
+    parser.add_argument("--tables", default=None,
+                        help="e.g. 'family,clan,rfamseq:rfamseq_acc|description' (default: %s)"
+                             % ",".join(IMPORTANT_TABLES))
+    parser.add_argument("--batch-size", type=int, default=5000)
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO)
+    tables = parse_tables_spec(args.tables) if args.tables else DEFAULT_MIRROR_TABLES
+    build_mirror(args.path, tables, args.batch_size)
+
+
+if __name__ == "__main__":
+    _main()
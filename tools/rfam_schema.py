@@ -0,0 +1,92 @@
+import json
+import os
+from typing import Dict, Iterable, List, Optional, Tuple
+
+DB_CONFIG = {
+    "host": os.environ.get("RFAM_DB_HOST", "mysql-rfam-public.ebi.ac.uk"),
+    "user": os.environ.get("RFAM_DB_USER", "rfamro"),
+    "port": int(os.environ.get("RFAM_DB_PORT", "4497")),
+    "database": os.environ.get("RFAM_DB_NAME", "Rfam"),
+}
+
+# The tables the agent's instruction advertises
+IMPORTANT_TABLES = ['family', 'clan', 'taxonomy', 'rfamseq']
+
+
+def describe_tables(cursor, tables: Iterable[str] = IMPORTANT_TABLES) -> Dict[str, List[Tuple]]:
+    """
+    Introspect the given tables with DESCRIBE.
+
+    Args:
+        cursor: A (non-dictionary) cursor on the Rfam database.
+        tables: Table names to describe; names missing from the database are skipped.
+
+    Returns:
+        Table name -> list of (Field, Type, Null, Key, Default, Extra) rows.
+    """
+    cursor.execute("SHOW TABLES")
+    existing = {row[0] for row in cursor.fetchall()}
+    schema = {}
+    for table_name in tables:
+        if table_name in existing:
+            cursor.execute(f"DESCRIBE `{table_name}`")
+            schema[table_name] = cursor.fetchall()
+    return schema
+
+
+def table_row_estimates(cursor, tables: Iterable[str] = IMPORTANT_TABLES) -> Dict[str, int]:
+    """Approximate row counts from information_schema (no table scans)."""
+    tables = list(tables)
+    placeholders = ", ".join(["%s"] * len(tables))
+    cursor.execute(
+        f"SELECT TABLE_NAME, TABLE_ROWS FROM information_schema.TABLES "
+        f"WHERE TABLE_SCHEMA = DATABASE() AND TABLE_NAME IN ({placeholders})",
+        tables
+    )
+    return {name: int(rows or 0) for name, rows in cursor.fetchall()}
+
+
+class SchemaCatalog:
+    """
+    Table/column names (and approximate sizes) the agent is allowed to query.
+
+    Built once from the live database with from_cursor, or from the local
+    mirror, and cached as JSON so restarts don't need the remote server.
+    Tables in ``partial`` only list some of their columns (a mirror that
+    copied a subset), so their column names aren't validated.
+    """
+
+    def __init__(self, columns: Dict[str, List[str]], row_estimates: Optional[Dict[str, int]] = None,
+                 partial: Iterable[str] = ()):
+        self.columns = {table.lower(): [c.lower() for c in cols] for table, cols in columns.items()}
+        self.row_estimates = {table.lower(): rows for table, rows in (row_estimates or {}).items()}
+        self.partial = {table.lower() for table in partial}
+
+    @classmethod
+    def from_cursor(cls, cursor, tables: Iterable[str] = IMPORTANT_TABLES) -> "SchemaCatalog":
+        tables = list(tables)
+        schema = describe_tables(cursor, tables)
+        # Field, Type, Null, Key, Default, Extra
+        columns = {table: [col[0] for col in cols] for table, cols in schema.items()}
+        return cls(columns, table_row_estimates(cursor, schema))
+
+    @classmethod
+    def from_sqlite(cls, connection, tables: Iterable[str], partial: Iterable[str] = ()) -> "SchemaCatalog":
+        columns = {}
+        for table in tables:
+            rows = connection.execute(f'PRAGMA table_info("{table}")').fetchall()
+            if rows:
+                columns[table] = [row[1] for row in rows]
+        return cls(columns, partial=partial)
+
+    @classmethod
+    def load(cls, path: str) -> "SchemaCatalog":
+        with open(path) as f:
+            data = json.load(f)
+        return cls(data["columns"], data.get("row_estimates"))
+
+    def save(self, path: str):
+        tmp_path = f"{path}.tmp"
+        with open(tmp_path, "w") as f:
+            json.dump({"columns": self.columns, "row_estimates": self.row_estimates}, f, indent=1)
+        os.replace(tmp_path, path)
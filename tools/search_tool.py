@@ -1,26 +1,112 @@
+import asyncio
+import os
+import threading
+from typing import List
+
 from duckduckgo_search import DDGS
 
+from metrics import TOOL_SECONDS, span
+from tools.query_cache import QueryResultCache
+
+# Hard deadline for one agent-facing search call (or a whole batch)
+SEARCH_TIMEOUT = float(os.environ.get("SEARCH_TIMEOUT", "5"))
+SEARCH_MAX_BATCH = int(os.environ.get("SEARCH_MAX_BATCH", "5"))
+
+# Voice users ask many near-identical questions; results are shared for an hour
+search_cache = QueryResultCache(
+    ttl=float(os.environ.get("SEARCH_CACHE_TTL", "3600")),
+    max_rows=int(os.environ.get("SEARCH_CACHE_MAX_RESULTS", "5000")),
+    max_bytes=int(os.environ.get("SEARCH_CACHE_MAX_BYTES", str(4 * 1024 * 1024))),
+)
+
+_local = threading.local()
+
+
+def normalize_query(query: str) -> str:
+    """Case-, whitespace- and trailing-punctuation-insensitive cache key for a search."""
+    return " ".join(query.lower().split()).rstrip("?!. ")
+
+
+def _ddgs() -> DDGS:
+    # One long-lived client per worker thread
+    ddgs = getattr(_local, "ddgs", None)
+    if ddgs is None:
+        ddgs = _local.ddgs = DDGS(timeout=max(1, int(SEARCH_TIMEOUT)))
+    return ddgs
+
+
+def _search(query: str):
+    results = []
+    # Fetch top 5 results using DuckDuckGo
+    for result in _ddgs().text(query, max_results=5):
+        results.append(f"- {result['title']}: {result['body']} ({result['href']})")
+
+    if not results:
+        return "No search results found.", 0
+
+    return "Top Web Search Results:\n" + "\n".join(results), len(results)
+
+
 def perform_google_search(query: str) -> str:
     """
     Perform a web search (via DuckDuckGo) and return the top results.
-    
+
     Args:
         query: The search query.
-        
+
     Returns:
         A string summary of the top 5 search results.
     """
     try:
-        results = []
-        # Fetch top 5 results using DuckDuckGo
-        with DDGS() as ddgs:
-            for result in ddgs.text(query, max_results=5):
-                results.append(f"- {result['title']}: {result['body']} ({result['href']})")
-            
-        if not results:
-            return "No search results found."
-            
-        return "Top Web Search Results:\n" + "\n".join(results)
-        
+        with span(TOOL_SECONDS, tool="perform_google_search"):
+            return search_cache.get_or_compute(normalize_query(query), lambda: _search(query))
+
     except Exception as e:
         return f"Error performing Web Search: {str(e)}"
+
+
+async def perform_google_search_async(query: str) -> str:
+    """
+    Perform a web search (via DuckDuckGo) and return the top results.
+
+    Args:
+        query: The search query.
+
+    Returns:
+        A string summary of the top 5 search results.
+    """
+    try:
+        return await asyncio.wait_for(asyncio.to_thread(perform_google_search, query), SEARCH_TIMEOUT)
+    except asyncio.TimeoutError:
+        # The worker thread still finishes and fills the cache for next time
+        return f"Web search timed out after {SEARCH_TIMEOUT:g}s."
+
+
+async def perform_google_searches(queries: List[str]) -> str:
+    """
+    Perform several web searches in parallel and return the top results for each.
+
+    Use this instead of repeated single searches when a question needs more than one lookup.
+
+    Args:
+        queries: The search queries (up to 5).
+
+    Returns:
+        The top results for each query. Queries that miss the deadline are reported as timed out,
+        so the results may be partial.
+    """
+    unique = {}
+    for query in queries[:SEARCH_MAX_BATCH]:
+        unique.setdefault(normalize_query(query), query)
+    if not unique:
+        return "No search queries given."
+    tasks = {query: asyncio.create_task(asyncio.to_thread(perform_google_search, query)) for query in unique.values()}
+    done, _ = await asyncio.wait(tasks.values(), timeout=SEARCH_TIMEOUT)
+
+    sections = []
+    for query, task in tasks.items():
+        if task in done:
+            sections.append(f"Results for '{query}':\n{task.result()}")
+        else:
+            sections.append(f"Results for '{query}': timed out after {SEARCH_TIMEOUT:g}s.")
+    return "\n\n".join(sections)
@@ -0,0 +1,186 @@
+"""
+Local validation and cost control for model-written SQL.
+
+prepare_query parses the query, checks table and column names against the
+SchemaCatalog and injects/clamps LIMIT and the server-side timeout hint in the
+syntax tree, so bad queries fail instantly without a remote round trip.
+check_cost runs EXPLAIN for queries on large tables and rejects plans that
+would scan too many rows.
+"""
+import math
+from typing import List, Optional, Set, Tuple
+
+import sqlglot
+from sqlglot import exp
+from sqlglot.errors import ParseError, SqlglotError
+
+from tools.rfam_schema import SchemaCatalog
+
+
+class QueryRejected(Exception):
+    """The query was refused before reaching the database; the message tells the model how to fix it."""
+
+
+def _limit_value(statement: exp.Expression) -> Optional[int]:
+    limit = statement.args.get("limit")
+    if limit is None:
+        return None
+    value = limit.expression if isinstance(limit, exp.Limit) else limit
+    try:
+        return int(value.name)
+    except (AttributeError, ValueError):
+        return None
+
+
+def _first_select(statement: exp.Expression) -> Optional[exp.Select]:
+    # The leftmost SELECT of the outer query, through UNION branches and parentheses
+    while isinstance(statement, (exp.Union, exp.Subquery)):
+        statement = statement.this
+    return statement if isinstance(statement, exp.Select) else None
+
+
+def _set_timeout_hint(statement: exp.Expression, timeout_ms: int):
+    # MySQL applies MAX_EXECUTION_TIME to the whole statement when it follows
+    # the first SELECT; one the model wrote itself is replaced.
+    select = _first_select(statement)
+    if select is None:
+        return
+    hint = select.args.get("hint")
+    others = [h for h in (hint.expressions if hint else []) if h.name.upper() != "MAX_EXECUTION_TIME"]
+    timeout = exp.Anonymous(this="MAX_EXECUTION_TIME", expressions=[exp.Literal.number(timeout_ms)])
+    select.set("hint", exp.Hint(expressions=[timeout] + others))
+
+
+def prepare_query(query: str, catalog: Optional[SchemaCatalog], default_limit: int,
+                  max_limit: int, timeout_ms: Optional[int] = None) -> Tuple[str, List[str]]:
+    """
+    Validate a model-written query and return it with a safe LIMIT.
+
+    Args:
+        query: SQL from the model (MySQL dialect).
+        catalog: Allowed tables/columns; None skips name validation.
+        default_limit: LIMIT added when the query has none.
+        max_limit: Larger LIMITs are clamped to this.
+        timeout_ms: If set, a MAX_EXECUTION_TIME optimizer hint with this
+            server-side limit is added (WITH and UNION queries included).
+
+    Returns:
+        (rewritten_sql, referenced_tables)
+
+    Raises:
+        QueryRejected: With an explanation the model can act on.
+    """
+    try:
+        statements = [s for s in sqlglot.parse(query, read="mysql") if s is not None]
+    except ParseError as e:
+        raise QueryRejected(f"Could not parse SQL: {str(e).splitlines()[0]}")
+    if len(statements) != 1:
+        raise QueryRejected("Send exactly one SQL statement.")
+    statement = statements[0]
+    if not isinstance(statement, (exp.Select, exp.Union)):
+        raise QueryRejected("Only SELECT queries are allowed.")
+
+    cte_names = {cte.alias_or_name.lower() for cte in statement.find_all(exp.CTE)}
+    aliases = {}
+    tables: List[str] = []
+    for table in statement.find_all(exp.Table):
+        name = table.name.lower()
+        if name in cte_names:
+            continue
+        if catalog is not None and name not in catalog.columns:
+            raise QueryRejected(
+                f"Unknown table '{table.name}'. Available tables: {', '.join(sorted(catalog.columns))}."
+            )
+        aliases[table.alias_or_name.lower()] = name
+        if name not in tables:
+            tables.append(name)
+
+    if catalog is not None:
+        _check_columns(statement, catalog, aliases, tables, cte_names)
+
+    limit = _limit_value(statement)
+    if limit is None or limit > max_limit:
+        statement = statement.limit(min(limit or default_limit, max_limit))
+    if timeout_ms is not None:
+        _set_timeout_hint(statement, timeout_ms)
+
+    return statement.sql(dialect="mysql"), tables
+
+
+def _check_columns(statement: exp.Expression, catalog: SchemaCatalog, aliases: dict,
+                   tables: List[str], cte_names: Set[str]):
+    # Names introduced by the query itself (select aliases, derived tables)
+    # can be referenced too.
+    derived = {alias.alias.lower() for alias in statement.find_all(exp.Alias)}
+    derived |= {sub.alias.lower() for sub in statement.find_all(exp.Subquery) if sub.alias}
+    derived |= cte_names
+
+    for column in statement.find_all(exp.Column):
+        name = column.name.lower()
+        if not name or isinstance(column.this, exp.Star):
+            continue
+        qualifier = column.table.lower()
+        if qualifier:
+            if qualifier in derived or qualifier not in aliases:
+                continue
+            table = aliases[qualifier]
+            if table not in catalog.partial and name not in catalog.columns[table]:
+                raise QueryRejected(
+                    f"Unknown column '{column.name}' in table '{table}'. "
+                    f"Columns: {', '.join(catalog.columns[table])}."
+                )
+        elif name not in derived and tables and not any(t in catalog.partial or name in catalog.columns[t]
+                                                        for t in tables):
+            known = "; ".join(f"{t}: {', '.join(catalog.columns[t])}" for t in tables)
+            raise QueryRejected(f"Unknown column '{column.name}'. Known columns: {known}.")
+
+
+def to_sqlite(query: str) -> str:
+    """Translate a (validated) MySQL query for the SQLite mirror; returns it unchanged if that fails."""
+    try:
+        statement = sqlglot.parse_one(query, read="mysql")
+    except SqlglotError:
+        return query
+    # SQLite has no optimizer hints (and nothing to time out remotely)
+    for select in statement.find_all(exp.Select):
+        select.set("hint", None)
+    try:
+        return statement.sql(dialect="sqlite")
+    except SqlglotError:
+        return query
+
+
+def needs_cost_check(tables: List[str], catalog: Optional[SchemaCatalog], min_table_rows: int) -> bool:
+    """EXPLAIN only queries touching tables large enough to hurt (or of unknown size)."""
+    if catalog is None:
+        return True
+    return any(catalog.row_estimates.get(table, min_table_rows) >= min_table_rows for table in tables)
+
+
+def check_cost(cursor, query: str, max_rows: int):
+    """
+    Run EXPLAIN and reject the query if the estimated rows examined exceed max_rows.
+
+    Rows are multiplied within a SELECT (nested-loop joins) and summed across
+    SELECTs. ``cursor`` must be a dictionary cursor on the target server.
+
+    Raises:
+        QueryRejected: If the estimate is over budget.
+    """
+    cursor.execute(f"EXPLAIN {query}")
+    plan = cursor.fetchall()
+
+    per_select = {}
+    for row in plan:
+        per_select.setdefault(row.get("id"), []).append(max(1, int(row.get("rows") or 1)))
+    estimate = sum(math.prod(rows) for rows in per_select.values())
+    if estimate <= max_rows:
+        return
+
+    scans = [row["table"] for row in plan if row.get("type") == "ALL" and row.get("table")]
+    hint = f" It needs a full scan of {', '.join(scans)}." if scans else ""
+    raise QueryRejected(
+        f"Query too expensive: the database estimates ~{estimate:,} rows examined (limit {max_rows:,}).{hint} "
+        "Filter on an indexed column (e.g. an accession or ID with '='), avoid leading-wildcard "
+        "LIKE '%...%' on large tables, or query a smaller table."
+    )
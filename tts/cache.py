@@ -0,0 +1,268 @@
+import asyncio
+import hashlib
+import json
+import logging
+import os
+import re
+import threading
+import unicodedata
+from collections import OrderedDict
+from typing import Awaitable, Callable, Dict, Optional
+
+logger = logging.getLogger(__name__)
+
+_WHITESPACE = re.compile(r'\s+')
+
+
+def normalize_text(text: str) -> str:
+    """Normalize text so trivially different spellings of a phrase share a cache entry."""
+    return _WHITESPACE.sub(" ", unicodedata.normalize("NFC", text)).strip()
+
+
+def make_key(provider: str, voice_name: str, language_code: str, model: str, text: str,
+             audio_format: str = "mp3", bitrate: Optional[int] = None) -> str:
+    """Content address for a synthesized clip."""
+    payload = json.dumps([provider, voice_name, language_code, model, normalize_text(text), audio_format, bitrate])
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+
+class _Flight:
+    """A producer task shared by every request waiting on the same key."""
+
+    def __init__(self):
+        self.task: Optional[asyncio.Task] = None
+        self.waiters = 0
+
+
+class TTSCache:
+    """
+    Two-tier cache for synthesized audio with in-flight request coalescing.
+
+    The memory tier is an LRU bounded by ``memory_bytes``. The optional disk
+    tier stores one file per clip under ``disk_dir`` and evicts the least
+    recently used files once ``disk_bytes`` is exceeded. Concurrent misses for
+    the same key share a single upstream call, which is cancelled once no
+    request is waiting for it any more.
+    """
+
+    def __init__(self, memory_bytes: int, disk_dir: Optional[str] = None, disk_bytes: int = 0):
+        self.memory_bytes = memory_bytes
+        self.disk_dir = disk_dir
+        self.disk_bytes = disk_bytes
+        self._memory: "OrderedDict[str, bytes]" = OrderedDict()
+        self._memory_used = 0
+        self._disk_used = 0
+        # Disk writes run in worker threads; guards _disk_used and eviction
+        self._disk_lock = threading.Lock()
+        self._in_flight: Dict[str, _Flight] = {}
+        # Clips being relayed from a provider stream; resolved with the audio, or None if the relay stopped early
+        self._filling: Dict[str, asyncio.Future] = {}
+        self.counters = {
+            "memory_hits": 0,
+            "disk_hits": 0,
+            "misses": 0,
+            "coalesced": 0,
+            "hit_bytes": 0,
+            "miss_bytes": 0,
+            "memory_evictions": 0,
+            "disk_evictions": 0,
+        }
+        if self.disk_dir and self.disk_bytes > 0:
+            os.makedirs(self.disk_dir, exist_ok=True)
+            self._disk_used = sum(entry.stat().st_size for entry in os.scandir(self.disk_dir) if entry.is_file())
+        else:
+            self.disk_dir = None
+
+    # Memory tier
+
+    def _memory_get(self, key: str) -> Optional[bytes]:
+        audio = self._memory.get(key)
+        if audio is not None:
+            self._memory.move_to_end(key)
+        return audio
+
+    def _memory_put(self, key: str, audio: bytes):
+        if len(audio) > self.memory_bytes:
+            return
+        if key in self._memory:
+            self._memory_used -= len(self._memory.pop(key))
+        self._memory[key] = audio
+        self._memory_used += len(audio)
+        while self._memory_used > self.memory_bytes:
+            _, evicted = self._memory.popitem(last=False)
+            self._memory_used -= len(evicted)
+            self.counters["memory_evictions"] += 1
+
+    # Disk tier (blocking; called through asyncio.to_thread)
+
+    def _path(self, key: str) -> str:
+        return os.path.join(self.disk_dir, key)
+
+    def _disk_get(self, key: str) -> Optional[bytes]:
+        path = self._path(key)
+        try:
+            with open(path, "rb") as f:
+                audio = f.read()
+        except FileNotFoundError:
+            return None
+        # Refresh mtime so eviction approximates LRU.
+        os.utime(path)
+        return audio
+
+    def _disk_put(self, key: str, audio: bytes):
+        path = self._path(key)
+        tmp_path = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+        with open(tmp_path, "wb") as f:
+            f.write(audio)
+        with self._disk_lock:
+            try:
+                # Overwriting a clip replaces its bytes rather than adding to them
+                replaced = os.stat(path).st_size
+            except FileNotFoundError:
+                replaced = 0
+            os.replace(tmp_path, path)
+            self._disk_used += len(audio) - replaced
+            if self._disk_used > self.disk_bytes:
+                self._disk_evict()
+
+    def _disk_evict(self):
+        # Called with _disk_lock held
+        entries = sorted(
+            (entry for entry in os.scandir(self.disk_dir) if entry.is_file() and not entry.name.endswith(".tmp")),
+            key=lambda entry: entry.stat().st_mtime,
+        )
+        self._disk_used = sum(entry.stat().st_size for entry in entries)
+        # Evict down to 90% of the budget so we don't rescan on every write.
+        target = int(self.disk_bytes * 0.9)
+        for entry in entries:
+            if self._disk_used <= target:
+                break
+            try:
+                size = entry.stat().st_size
+                os.remove(entry.path)
+            except FileNotFoundError:
+                continue
+            self._disk_used -= size
+            self.counters["disk_evictions"] += 1
+
+    # Public API
+
+    async def get(self, key: str) -> Optional[bytes]:
+        audio = self._memory_get(key)
+        if audio is not None:
+            self.counters["memory_hits"] += 1
+            self.counters["hit_bytes"] += len(audio)
+            return audio
+        if self.disk_dir:
+            audio = await asyncio.to_thread(self._disk_get, key)
+            if audio is not None:
+                self.counters["disk_hits"] += 1
+                self.counters["hit_bytes"] += len(audio)
+                self._memory_put(key, audio)
+                return audio
+        return None
+
+    async def put(self, key: str, audio: bytes):
+        self._memory_put(key, audio)
+        if self.disk_dir:
+            try:
+                await asyncio.to_thread(self._disk_put, key, audio)
+            except OSError as e:
+                logger.warning(f"TTS disk cache write failed: {e}")
+
+    def contains(self, key: str) -> bool:
+        """True if key is stored in either tier (without counting a hit)."""
+        return key in self._memory or (self.disk_dir is not None and os.path.exists(self._path(key)))
+
+    def is_pending(self, key: str) -> bool:
+        """True if a producer or a streamed fill for key is currently running."""
+        return key in self._in_flight or key in self._filling
+
+    def begin_fill(self, key: str):
+        """
+        Mark key as being produced outside get_or_create (e.g. relayed from a
+        provider stream). Until end_fill, get_or_create waits for that audio
+        instead of making a second upstream call.
+        """
+        self._filling[key] = asyncio.get_running_loop().create_future()
+
+    def end_fill(self, key: str, audio: Optional[bytes]):
+        """Finish a fill started with begin_fill; audio is None if it didn't complete. Idempotent."""
+        future = self._filling.pop(key, None)
+        if future is not None and not future.done():
+            future.set_result(audio)
+
+    async def get_or_create(self, key: str, producer: Callable[[], Awaitable[bytes]],
+                            cacheable: Optional[Callable[[bytes], bool]] = None) -> bytes:
+        """
+        Return the cached audio for key, calling producer at most once per
+        concurrent miss. Failures are propagated to every waiter and not cached.
+        If every waiter is cancelled (e.g. their clients went away), so is the
+        producer. If cacheable returns False the result is shared with the
+        current waiters but not stored.
+        """
+        audio = await self.get(key)
+        if audio is not None:
+            return audio
+
+        filling = self._filling.get(key)
+        if filling is not None:
+            audio = await asyncio.shield(filling)
+            if audio is not None:
+                self.counters["coalesced"] += 1
+                return audio
+
+        flight = self._in_flight.get(key)
+        if flight is not None:
+            self.counters["coalesced"] += 1
+        else:
+            self.counters["misses"] += 1
+            flight = self._in_flight[key] = _Flight()
+            flight.task = asyncio.create_task(self._produce(key, flight, producer, cacheable))
+
+        flight.waiters += 1
+        try:
+            return await asyncio.shield(flight.task)
+        finally:
+            flight.waiters -= 1
+            if not flight.waiters and not flight.task.done():
+                flight.task.cancel()
+                # Later requests start afresh rather than joining a cancelled call
+                if self._in_flight.get(key) is flight:
+                    del self._in_flight[key]
+
+    async def _produce(self, key: str, flight: _Flight, producer: Callable[[], Awaitable[bytes]],
+                       cacheable: Optional[Callable[[bytes], bool]]) -> bytes:
+        try:
+            audio = await producer()
+        finally:
+            if self._in_flight.get(key) is flight:
+                del self._in_flight[key]
+        self.counters["miss_bytes"] += len(audio)
+        if cacheable is None or cacheable(audio):
+            await self.put(key, audio)
+        return audio
+
+    def record_miss(self, nbytes: int):
+        """Count a miss whose audio was produced outside get_or_create (e.g. streamed)."""
+        self.counters["misses"] += 1
+        self.counters["miss_bytes"] += nbytes
+
+    def stats(self) -> dict:
+        return {
+            **self.counters,
+            "memory_entries": len(self._memory),
+            "memory_bytes": self._memory_used,
+            "memory_budget": self.memory_bytes,
+            "disk_bytes": self._disk_used,
+            "disk_budget": self.disk_bytes if self.disk_dir else 0,
+            "in_flight": len(self._in_flight),
+        }
+
+    @classmethod
+    def from_env(cls) -> "TTSCache":
+        return cls(
+            memory_bytes=int(os.environ.get("TTS_CACHE_MEMORY_BYTES", str(32 * 1024 * 1024))),
+            disk_dir=os.environ.get("TTS_CACHE_DIR", ".tts_cache") or None,
+            disk_bytes=int(os.environ.get("TTS_CACHE_DISK_BYTES", str(512 * 1024 * 1024))),
+        )
@@ -0,0 +1,85 @@
+import struct
+from typing import Optional, Tuple
+
+from http_headers import parse_accept
+
+# Output formats clients can ask for, with their MIME types. "opus" is Opus in
+# an Ogg container; "wav" is 16-bit mono PCM with a WAV header.
+AUDIO_FORMATS = {
+    "mp3": "audio/mpeg",
+    "opus": "audio/ogg",
+    "wav": "audio/wav",
+}
+
+_ACCEPT_ALIASES = {
+    "audio/mpeg": "mp3",
+    "audio/mp3": "mp3",
+    "audio/ogg": "opus",
+    "audio/opus": "opus",
+    "audio/webm": "opus",
+    "audio/wav": "wav",
+    "audio/wave": "wav",
+    "audio/x-wav": "wav",
+    "audio/l16": "wav",
+}
+
+DEFAULT_FORMAT = "mp3"
+
+
+def negotiate_format(requested: Optional[str], accept: Optional[str]) -> str:
+    """
+    Pick the output format: an explicit request wins, then the first supported
+    type in the Accept header (in q-value order), then MP3.
+
+    Raises:
+        ValueError: If an explicitly requested format is not supported.
+    """
+    if requested:
+        if requested not in AUDIO_FORMATS:
+            raise ValueError(f"Unsupported audio format '{requested}'. Use one of: {', '.join(AUDIO_FORMATS)}")
+        return requested
+
+    candidates = []
+    for position, (media_type, quality) in enumerate(parse_accept(accept)):
+        audio_format = _ACCEPT_ALIASES.get(media_type)
+        if audio_format and quality > 0:
+            candidates.append((-quality, position, audio_format))
+    return min(candidates)[2] if candidates else DEFAULT_FORMAT
+
+
+def parse_range(header: Optional[str], size: int) -> Optional[Tuple[int, int]]:
+    """
+    Parse a single-range ``Range: bytes=...`` header against a body of ``size`` bytes.
+
+    Returns:
+        Inclusive (start, end) offsets, or None if there is no usable range header.
+
+    Raises:
+        ValueError: If the range cannot be satisfied (answer 416).
+    """
+    if not header or not header.startswith("bytes=") or "," in header:
+        return None
+    start_text, _, end_text = header[len("bytes="):].strip().partition("-")
+    try:
+        if start_text:
+            start = int(start_text)
+            end = int(end_text) if end_text else size - 1
+        else:
+            # Suffix range: the last N bytes
+            start = max(0, size - int(end_text))
+            end = size - 1
+    except ValueError:
+        return None
+    end = min(end, size - 1)
+    if start > end or start >= size:
+        raise ValueError(f"Range not satisfiable for {size} bytes")
+    return start, end
+
+
+def pcm_to_wav(pcm: bytes, sample_rate: int, channels: int = 1, sample_width: int = 2) -> bytes:
+    """Wrap raw little-endian PCM samples in a WAV header."""
+    byte_rate = sample_rate * channels * sample_width
+    header = b"RIFF" + struct.pack("<I", 36 + len(pcm)) + b"WAVE"
+    header += b"fmt " + struct.pack("<IHHIIHH", 16, 1, channels, sample_rate, byte_rate, channels * sample_width, sample_width * 8)
+    header += b"data" + struct.pack("<I", len(pcm))
+    return header + pcm
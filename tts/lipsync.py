@@ -0,0 +1,109 @@
+"""
+Mouth-openness envelopes for driving the avatar's lip sync.
+
+An envelope is one uint8 per 1/ENVELOPE_RATE seconds of audio (0 = closed,
+255 = fully open), computed once per clip from its decoded PCM and cached
+next to the audio, so the client just indexes it by playback time instead of
+running an FFT analyser every frame.
+
+WAV is decoded with the standard library; MP3 and Ogg/Opus need PyAV.
+"""
+import io
+import os
+import wave
+from typing import Tuple
+
+ENVELOPE_RATE = int(os.environ.get("TTS_ENVELOPE_RATE", "60"))
+# Frames this far below the clip's loud level (95th percentile) count as closed
+ENVELOPE_RANGE_DB = float(os.environ.get("TTS_ENVELOPE_RANGE_DB", "40"))
+# A clip whose loud level is below this is treated as silence rather than normalized up
+SILENCE_DB = -60.0
+# Compressed audio is decoded at this rate; plenty for a loudness envelope
+DECODE_SAMPLE_RATE = 16000
+
+
+class EnvelopeUnavailable(Exception):
+    """The clip can't be decoded here (unsupported format or missing NumPy/PyAV)."""
+
+
+def envelope_key(audio_key: str, rate: int = ENVELOPE_RATE) -> str:
+    """Cache key for the envelope of the clip cached under audio_key."""
+    return f"{audio_key}.env{rate}"
+
+
+def decode_pcm(audio: bytes, audio_format: str) -> Tuple["np.ndarray", int]:
+    """
+    Decode a clip to mono float samples in [-1, 1].
+
+    Returns:
+        (samples, sample_rate)
+
+    Raises:
+        EnvelopeUnavailable: If the format can't be decoded in this environment.
+    """
+    try:
+        import numpy as np
+    except ImportError:
+        raise EnvelopeUnavailable("NumPy is not installed")
+
+    if audio_format == "wav":
+        try:
+            with wave.open(io.BytesIO(audio)) as clip:
+                if clip.getsampwidth() != 2:
+                    raise EnvelopeUnavailable(f"Unsupported WAV sample width {clip.getsampwidth()}")
+                frames = clip.readframes(clip.getnframes())
+                channels, sample_rate = clip.getnchannels(), clip.getframerate()
+        except (wave.Error, EOFError) as e:
+            raise EnvelopeUnavailable(f"Unreadable WAV: {e}")
+        samples = np.frombuffer(frames, dtype="<i2").astype(np.float32) / 32768.0
+        if channels > 1:
+            samples = samples[:len(samples) - len(samples) % channels].reshape(-1, channels).mean(axis=1)
+        return samples, sample_rate
+
+    try:
+        import av
+    except ImportError:
+        raise EnvelopeUnavailable(f"PyAV is not installed; can't decode {audio_format}")
+    try:
+        with av.open(io.BytesIO(audio)) as container:
+            resampler = av.AudioResampler(format="s16", layout="mono", rate=DECODE_SAMPLE_RATE)
+            chunks = []
+            for frame in container.decode(audio=0):
+                chunks += [resampled.to_ndarray().reshape(-1) for resampled in resampler.resample(frame)]
+            chunks += [resampled.to_ndarray().reshape(-1) for resampled in resampler.resample(None)]
+    except (av.error.FFmpegError, ValueError) as e:
+        raise EnvelopeUnavailable(f"Unreadable {audio_format}: {e}")
+    if not chunks:
+        return np.zeros(0, dtype=np.float32), DECODE_SAMPLE_RATE
+    return np.concatenate(chunks).astype(np.float32) / 32768.0, DECODE_SAMPLE_RATE
+
+
+def compute_envelope(samples: "np.ndarray", sample_rate: int, rate: int = ENVELOPE_RATE,
+                     range_db: float = ENVELOPE_RANGE_DB) -> bytes:
+    """
+    Mouth openness per 1/rate seconds: frame RMS in dB, scaled so the clip's
+    95th percentile is fully open and anything ``range_db`` quieter is closed,
+    then lightly smoothed so the mouth doesn't flicker.
+    """
+    import numpy as np
+
+    frames = int(np.ceil(len(samples) * rate / sample_rate))
+    if not frames:
+        return b""
+    # Frame boundaries needn't be whole samples apart (e.g. 16 kHz / 60 Hz)
+    starts = (np.arange(frames) * (sample_rate / rate)).astype(np.int64)
+    energy = np.add.reduceat(np.square(samples, dtype=np.float64), starts)
+    counts = np.diff(np.append(starts, len(samples)))
+    rms = np.sqrt(energy / np.maximum(counts, 1))
+
+    db = 20 * np.log10(rms + 1e-9)
+    loud = max(np.percentile(db, 95), SILENCE_DB)
+    level = np.clip((db - (loud - range_db)) / range_db, 0.0, 1.0)
+    level = np.convolve(level, np.array([0.25, 0.5, 0.25]), mode="same")
+    return np.round(level * 255).astype(np.uint8).tobytes()
+
+
+def envelope_for(audio: bytes, audio_format: str, rate: int = ENVELOPE_RATE) -> bytes:
+    """Decode audio and compute its envelope (CPU-bound; call through asyncio.to_thread)."""
+    samples, sample_rate = decode_pcm(audio, audio_format)
+    return compute_envelope(samples, sample_rate, rate)
@@ -0,0 +1,96 @@
+import asyncio
+import os
+import re
+from typing import AsyncIterator, Awaitable, Callable, List, Tuple
+
+# Sentence boundaries: terminal punctuation (optionally followed by closing
+# quotes/brackets) and whitespace.
+_SENTENCE_END = re.compile(r'(?<=[.!?…])["\')\]]*\s+')
+# Clause boundaries used to split sentences that are still too long.
+_CLAUSE_END = re.compile(r'(?<=[,;:—])\s+')
+
+DEFAULT_MAX_CHUNK_CHARS = int(os.environ.get("TTS_MAX_CHUNK_CHARS", "200"))
+DEFAULT_MAX_IN_FLIGHT = int(os.environ.get("TTS_PIPELINE_CONCURRENCY", "3"))
+
+
+def _split_long(text: str, max_chars: int) -> List[str]:
+    """Split an over-long sentence at clause boundaries, then at word boundaries."""
+    chunks = []
+    current = ""
+    for clause in _CLAUSE_END.split(text):
+        candidate = f"{current} {clause}".strip()
+        if len(candidate) <= max_chars:
+            current = candidate
+            continue
+        if current:
+            chunks.append(current)
+        current = ""
+        for word in clause.split():
+            candidate = f"{current} {word}".strip()
+            if len(candidate) > max_chars and current:
+                chunks.append(current)
+                current = word
+            else:
+                current = candidate
+    if current:
+        chunks.append(current)
+    return chunks
+
+
+def split_text(text: str, max_chars: int = DEFAULT_MAX_CHUNK_CHARS) -> List[str]:
+    """
+    Split reply text into sentence-sized chunks for incremental synthesis.
+
+    Args:
+        text: The text to speak.
+        max_chars: Upper bound on chunk length; longer sentences are split at clauses.
+
+    Returns:
+        Non-empty chunks in reading order.
+    """
+    chunks = []
+    for sentence in _SENTENCE_END.split(text.strip()):
+        sentence = sentence.strip()
+        if not sentence:
+            continue
+        if len(sentence) <= max_chars:
+            chunks.append(sentence)
+        else:
+            chunks.extend(_split_long(sentence, max_chars))
+    return chunks
+
+
+async def synthesize_chunks(
+    chunks: List[str],
+    synthesize: Callable[[str], Awaitable[bytes]],
+    max_in_flight: int = DEFAULT_MAX_IN_FLIGHT,
+) -> AsyncIterator[Tuple[int, str, bytes]]:
+    """
+    Synthesize chunks concurrently and yield them in order as they become ready.
+
+    At most ``max_in_flight`` provider calls run at once. Chunk ``i`` is
+    yielded as soon as it and every chunk before it have finished, so the
+    caller can start playback after the first sentence. Pending calls are
+    cancelled if the consumer stops iterating.
+
+    Args:
+        chunks: Text chunks, e.g. from split_text.
+        synthesize: Coroutine function returning the audio bytes for one chunk.
+        max_in_flight: Maximum concurrent provider calls.
+
+    Yields:
+        (index, chunk_text, audio_bytes) tuples in chunk order.
+    """
+    semaphore = asyncio.Semaphore(max(1, max_in_flight))
+
+    async def run(chunk: str) -> bytes:
+        async with semaphore:
+            return await synthesize(chunk)
+
+    tasks = [asyncio.create_task(run(chunk)) for chunk in chunks]
+    try:
+        for index, (chunk, task) in enumerate(zip(chunks, tasks)):
+            yield index, chunk, await task
+    finally:
+        for task in tasks:
+            task.cancel()
@@ -0,0 +1,329 @@
+import abc
+import asyncio
+import importlib
+import logging
+import os
+import time
+from typing import AsyncIterator, Dict, Optional, Tuple
+
+import httpx
+
+from metrics import TTS_SECONDS, TTS_TTFB_SECONDS, span
+from tts.formats import pcm_to_wav
+
+logger = logging.getLogger(__name__)
+
+
+class TTSProviderError(Exception):
+    """A provider rejected or failed a synthesis request."""
+
+    def __init__(self, message: str, status_code: int = 500):
+        super().__init__(message)
+        self.status_code = status_code
+
+
+class TTSProvider(abc.ABC):
+    """
+    Base class for speech providers.
+
+    Each provider owns one long-lived client, created on start() (or on first
+    use) and shared by every request, plus a semaphore capping its in-flight
+    calls at ``max_connections``. Provider SDKs (``sdk_modules``) are only
+    imported once the provider is started or used. Subclasses must implement
+    _create_client and _synthesize.
+    """
+
+    name = ""
+    model = ""
+    sdk_modules: Tuple[str, ...] = ()
+
+    def __init__(self, timeout: Optional[float] = None, max_connections: Optional[int] = None):
+        prefix = f"TTS_{self.name.upper()}"
+        self.timeout = timeout or float(os.environ.get(f"{prefix}_TIMEOUT", "15"))
+        self.max_connections = max_connections or int(os.environ.get(f"{prefix}_MAX_CONNECTIONS", "20"))
+        self._semaphore = asyncio.Semaphore(self.max_connections)
+        self._client = None
+
+    @abc.abstractmethod
+    def _create_client(self):
+        ...
+
+    async def _close_client(self, client):
+        pass
+
+    def configured(self) -> bool:
+        """False if the provider obviously can't be used here (e.g. its API key isn't set)."""
+        return True
+
+    def client(self):
+        if self._client is None:
+            self._client = self._create_client()
+        return self._client
+
+    async def start(self):
+        """
+        Import the SDK (off the event loop) and create the shared client up
+        front so the first request doesn't pay for either.
+        """
+        if not self.configured():
+            return
+        try:
+            for module in self.sdk_modules:
+                await asyncio.to_thread(importlib.import_module, module)
+            self.client()
+        except Exception as e:
+            logger.warning(f"TTS provider '{self.name}' not started: {e}")
+
+    async def aclose(self):
+        if self._client is not None:
+            client, self._client = self._client, None
+            await self._close_client(client)
+
+    @abc.abstractmethod
+    async def _synthesize(self, text: str, voice_name: str, language_code: str,
+                          audio_format: str, bitrate: Optional[int]) -> bytes:
+        ...
+
+    async def synthesize(self, text: str, voice_name: str, language_code: str,
+                         audio_format: str = "mp3", bitrate: Optional[int] = None) -> bytes:
+        """
+        Return the complete audio for text.
+
+        Args:
+            audio_format: One of tts.formats.AUDIO_FORMATS.
+            bitrate: Preferred bitrate in kbps; honoured as closely as the provider allows.
+        """
+        async with self._semaphore:
+            with span(TTS_SECONDS, provider=self.name, mode="synthesize"):
+                return await self._synthesize(text, voice_name, language_code, audio_format, bitrate)
+
+    async def _stream(self, text: str, voice_name: str, language_code: str,
+                      audio_format: str, bitrate: Optional[int]) -> AsyncIterator[bytes]:
+        # Providers without a streaming API deliver the whole clip as one chunk.
+        yield await self._synthesize(text, voice_name, language_code, audio_format, bitrate)
+
+    async def stream(self, text: str, voice_name: str, language_code: str,
+                     audio_format: str = "mp3", bitrate: Optional[int] = None) -> AsyncIterator[bytes]:
+        """Yield audio for text in chunks as the provider produces it."""
+        async with self._semaphore:
+            started = time.perf_counter()
+            first = True
+            with span(TTS_SECONDS, provider=self.name, mode="stream"):
+                async for chunk in self._stream(text, voice_name, language_code, audio_format, bitrate):
+                    if first:
+                        TTS_TTFB_SECONDS.observe(time.perf_counter() - started, provider=self.name)
+                        first = False
+                    yield chunk
+
+
+class GoogleTTSProvider(TTSProvider):
+    name = "google"
+    sdk_modules = ("google.cloud.texttospeech",)
+
+    def _create_client(self):
+        from google.cloud import texttospeech
+        return texttospeech.TextToSpeechAsyncClient()
+
+    async def _close_client(self, client):
+        await client.transport.close()
+
+    # texttospeech.AudioEncoding names; LINEAR16 responses already carry a WAV header.
+    encodings = {
+        "mp3": "MP3",
+        "opus": "OGG_OPUS",
+        "wav": "LINEAR16",
+    }
+
+    async def _synthesize(self, text: str, voice_name: str, language_code: str,
+                          audio_format: str, bitrate: Optional[int]) -> bytes:
+        from google.api_core.exceptions import GoogleAPICallError
+        from google.cloud import texttospeech
+        # Bitrate isn't configurable; a lower sample rate is the closest knob.
+        audio_config = texttospeech.AudioConfig(audio_encoding=texttospeech.AudioEncoding[self.encodings[audio_format]])
+        if bitrate and bitrate <= 32:
+            audio_config.sample_rate_hertz = 16000
+        try:
+            response = await self.client().synthesize_speech(
+                input=texttospeech.SynthesisInput(text=text),
+                voice=texttospeech.VoiceSelectionParams(language_code=language_code, name=voice_name),
+                audio_config=audio_config,
+                timeout=self.timeout,
+            )
+        except GoogleAPICallError as e:
+            raise TTSProviderError(f"Google TTS Error: {e.message}", status_code=e.code or 500) from e
+        return response.audio_content
+
+
+class OpenAITTSProvider(TTSProvider):
+    name = "openai"
+    model = "tts-1-hd"
+    sdk_modules = ("openai",)
+
+    # Google voice names are not valid here; anything unknown maps to 'alloy'.
+    voices = {"alloy", "echo", "fable", "onyx", "nova", "shimmer"}
+
+    def configured(self) -> bool:
+        return bool(os.environ.get("OPENAI_API_KEY"))
+
+    def _create_client(self):
+        api_key = os.environ.get("OPENAI_API_KEY")
+        if not api_key:
+            raise TTSProviderError("OPENAI_API_KEY not set")
+        from openai import AsyncOpenAI
+        return AsyncOpenAI(
+            api_key=api_key,
+            timeout=self.timeout,
+            http_client=httpx.AsyncClient(
+                timeout=self.timeout,
+                limits=httpx.Limits(max_connections=self.max_connections, max_keepalive_connections=self.max_connections),
+            ),
+        )
+
+    async def _close_client(self, client):
+        await client.close()
+
+    # Bitrate isn't configurable; OpenAI's "opus" output is Ogg/Opus.
+    response_formats = {"mp3": "mp3", "opus": "opus", "wav": "wav"}
+
+    def _request(self, text: str, voice_name: str, audio_format: str) -> dict:
+        return dict(
+            model=self.model,
+            voice=voice_name if voice_name in self.voices else "alloy",
+            input=text,
+            response_format=self.response_formats[audio_format],
+        )
+
+    async def _synthesize(self, text: str, voice_name: str, language_code: str,
+                          audio_format: str, bitrate: Optional[int]) -> bytes:
+        from openai import APIStatusError
+        try:
+            response = await self.client().audio.speech.create(**self._request(text, voice_name, audio_format))
+        except APIStatusError as e:
+            raise TTSProviderError(f"OpenAI Error: {e.message}", status_code=e.status_code) from e
+        return response.content
+
+    async def _stream(self, text: str, voice_name: str, language_code: str,
+                      audio_format: str, bitrate: Optional[int]) -> AsyncIterator[bytes]:
+        from openai import APIStatusError
+        speech = self.client().audio.speech.with_streaming_response
+        try:
+            async with speech.create(**self._request(text, voice_name, audio_format)) as response:
+                async for chunk in response.iter_bytes():
+                    yield chunk
+        except APIStatusError as e:
+            raise TTSProviderError(f"OpenAI Error: {e.message}", status_code=e.status_code) from e
+
+
+class ElevenLabsTTSProvider(TTSProvider):
+    name = "elevenlabs"
+    model = "eleven_multilingual_v2"
+
+    # Custom voice ID used regardless of the requested voice name
+    voice_id = "8fcyCHOzlKDlxh1InJSf"
+
+    def configured(self) -> bool:
+        return bool(os.environ.get("ELEVENLABS_API_KEY"))
+
+    def _create_client(self):
+        api_key = os.environ.get("ELEVENLABS_API_KEY")
+        if not api_key:
+            raise TTSProviderError("ELEVENLABS_API_KEY not set")
+        return httpx.AsyncClient(
+            base_url="https://api.elevenlabs.io/v1",
+            headers={"xi-api-key": api_key},
+            timeout=self.timeout,
+            limits=httpx.Limits(max_connections=self.max_connections, max_keepalive_connections=self.max_connections),
+        )
+
+    async def _close_client(self, client):
+        await client.aclose()
+
+    pcm_sample_rate = 24000
+    bitrates = (32, 64, 96, 128, 192)
+
+    def _output_format(self, audio_format: str, bitrate: Optional[int]) -> str:
+        if audio_format == "wav":
+            return f"pcm_{self.pcm_sample_rate}"
+        if audio_format == "opus":
+            rate = min(self.bitrates, key=lambda r: abs(r - (bitrate or 64)))
+            return f"opus_48000_{rate}"
+        if bitrate and bitrate <= 32:
+            return "mp3_22050_32"
+        rate = min(self.bitrates, key=lambda r: abs(r - (bitrate or 128)))
+        return f"mp3_44100_{rate}"
+
+    def _body(self, text: str) -> dict:
+        return {
+            "text": text,
+            "model_id": self.model,
+            "voice_settings": {
+                "stability": 0.5,
+                "similarity_boost": 0.5
+            }
+        }
+
+    async def _synthesize(self, text: str, voice_name: str, language_code: str,
+                          audio_format: str, bitrate: Optional[int]) -> bytes:
+        response = await self.client().post(
+            f"/text-to-speech/{self.voice_id}",
+            params={"output_format": self._output_format(audio_format, bitrate)},
+            json=self._body(text),
+        )
+        if response.status_code != 200:
+            raise TTSProviderError(f"ElevenLabs Error: {response.text}", status_code=response.status_code)
+        if audio_format == "wav":
+            return pcm_to_wav(response.content, self.pcm_sample_rate)
+        return response.content
+
+    async def _stream(self, text: str, voice_name: str, language_code: str,
+                      audio_format: str, bitrate: Optional[int]) -> AsyncIterator[bytes]:
+        # Raw PCM needs a WAV header sized to the whole clip, so it isn't streamed.
+        if audio_format == "wav":
+            yield await self._synthesize(text, voice_name, language_code, audio_format, bitrate)
+            return
+        request = self.client().build_request(
+            "POST",
+            f"/text-to-speech/{self.voice_id}/stream",
+            params={"output_format": self._output_format(audio_format, bitrate)},
+            json=self._body(text),
+        )
+        response = await self.client().send(request, stream=True)
+        try:
+            if response.status_code != 200:
+                await response.aread()
+                raise TTSProviderError(f"ElevenLabs Error: {response.text}", status_code=response.status_code)
+            async for chunk in response.aiter_bytes():
+                yield chunk
+        finally:
+            await response.aclose()
+
+
+class ProviderRegistry:
+    """Name -> provider lookup. Unknown names fall back to the default provider."""
+
+    def __init__(self, default: str = "google"):
+        self.default = default
+        self._providers: Dict[str, TTSProvider] = {}
+
+    def register(self, provider: TTSProvider):
+        self._providers[provider.name] = provider
+
+    def get(self, name: str) -> TTSProvider:
+        return self._providers.get(name) or self._providers[self.default]
+
+    def names(self):
+        return list(self._providers)
+
+    async def start(self):
+        for provider in self._providers.values():
+            await provider.start()
+
+    async def aclose(self):
+        for provider in self._providers.values():
+            await provider.aclose()
+
+
+providers = ProviderRegistry()
+providers.register(GoogleTTSProvider())
+providers.register(OpenAITTSProvider())
+providers.register(ElevenLabsTTSProvider())
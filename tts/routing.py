@@ -0,0 +1,278 @@
+"""
+Latency-aware routing across TTS providers.
+
+Requests still name a primary provider. Depending on TTS_ROUTING:
+
+*   ``off``: only the primary is called, as before.
+*   ``failover`` (default): if the primary fails, the next provider in
+    TTS_FALLBACK_ORDER is tried. Requests the provider rejects (4xx other
+    than 429) are not retried elsewhere.
+*   ``hedge``: as failover, and if the primary hasn't answered within its
+    recent TTS_HEDGE_QUANTILE latency, the next provider is called as well and
+    whichever answers first wins (the other call is cancelled). Opt-in, since
+    a hedge is a second paid request and may answer in another voice.
+
+Each provider has a circuit breaker: after TTS_BREAKER_FAILURES consecutive
+failures (rejected requests don't count) it is skipped for TTS_BREAKER_RESET seconds, then a single trial
+call decides whether it is used again.
+"""
+import asyncio
+import logging
+import os
+import time
+from collections import deque
+from typing import AsyncIterator, Awaitable, Callable, Dict, List, Optional, Tuple, TypeVar
+
+from metrics import percentile, registry
+from tts.providers import ProviderRegistry, TTSProvider, TTSProviderError
+
+logger = logging.getLogger(__name__)
+
+ROUTING_MODE = os.environ.get("TTS_ROUTING", "failover")
+FALLBACK_ORDER = [name.strip() for name in os.environ.get("TTS_FALLBACK_ORDER", "google,openai,elevenlabs").split(",") if name.strip()]
+HEDGE_QUANTILE = float(os.environ.get("TTS_HEDGE_QUANTILE", "0.95"))
+# Until a provider has this many latency samples, hedge after TTS_HEDGE_DELAY seconds
+HEDGE_MIN_SAMPLES = int(os.environ.get("TTS_HEDGE_MIN_SAMPLES", "20"))
+HEDGE_DELAY = float(os.environ.get("TTS_HEDGE_DELAY", "2.0"))
+HEDGE_MIN_DELAY = float(os.environ.get("TTS_HEDGE_MIN_DELAY", "0.25"))
+BREAKER_FAILURES = int(os.environ.get("TTS_BREAKER_FAILURES", "5"))
+BREAKER_RESET_SECONDS = float(os.environ.get("TTS_BREAKER_RESET", "30"))
+
+HEDGES = registry.counter("voicebot_tts_hedges_total", "Hedged TTS calls started, by the provider that was too slow")
+FAILOVERS = registry.counter("voicebot_tts_failovers_total", "TTS requests answered by a provider other than the one requested")
+BREAKER_TRIPS = registry.counter("voicebot_tts_breaker_trips_total", "TTS circuit breaker openings by provider")
+
+T = TypeVar("T")
+
+
+class CircuitBreaker:
+    """Consecutive-failure breaker: closed -> open -> half-open (one trial call) -> closed or open."""
+
+    def __init__(self, failures: int = BREAKER_FAILURES, reset_after: float = BREAKER_RESET_SECONDS):
+        self.failures = failures
+        self.reset_after = reset_after
+        self.consecutive_failures = 0
+        self.opened_at: Optional[float] = None
+        self._trial_running = False
+
+    @property
+    def state(self) -> str:
+        if self.opened_at is None:
+            return "closed"
+        return "half_open" if time.monotonic() - self.opened_at >= self.reset_after else "open"
+
+    def allow(self) -> bool:
+        """True if a call may go ahead; claims the trial slot when half-open."""
+        state = self.state
+        if state == "closed":
+            return True
+        if state == "half_open" and not self._trial_running:
+            self._trial_running = True
+            return True
+        return False
+
+    def record_success(self):
+        self.consecutive_failures = 0
+        self.opened_at = None
+        self._trial_running = False
+
+    def record_failure(self) -> bool:
+        """Count a failure; True if it opened the breaker."""
+        self.consecutive_failures += 1
+        was_trial, self._trial_running = self._trial_running, False
+        if was_trial or (self.opened_at is None and self.consecutive_failures >= self.failures):
+            self.opened_at = time.monotonic()
+            return True
+        return False
+
+    def release(self):
+        """Give back a trial slot whose call was cancelled without an outcome."""
+        self._trial_running = False
+
+
+class _ProviderHealth:
+    def __init__(self, window: int = 256):
+        self.breaker = CircuitBreaker()
+        # Seconds to complete audio ("synthesize") or to first chunk ("stream")
+        self.latency: Dict[str, deque] = {"synthesize": deque(maxlen=window), "stream": deque(maxlen=window)}
+
+    def hedge_delay(self, mode: str) -> float:
+        samples = self.latency[mode]
+        if len(samples) < HEDGE_MIN_SAMPLES:
+            return HEDGE_DELAY
+        return max(HEDGE_MIN_DELAY, percentile(samples, HEDGE_QUANTILE))
+
+
+def _rejected_request(error: BaseException) -> bool:
+    """
+    True for 4xx errors other than 429: the request itself (text, voice, ...)
+    was rejected, which says nothing about the provider's health, and another
+    provider answering it would only hide the mistake behind a different voice.
+    """
+    return isinstance(error, TTSProviderError) and 400 <= error.status_code < 500 and error.status_code != 429
+
+
+class ProviderRouter:
+    """Routes synthesis across the providers in a registry with hedging, failover and circuit breakers."""
+
+    def __init__(self, providers: ProviderRegistry, mode: str = ROUTING_MODE, order: List[str] = FALLBACK_ORDER):
+        if mode not in ("off", "failover", "hedge"):
+            raise ValueError(f"Unknown TTS_ROUTING mode '{mode}'. Use off, failover or hedge")
+        self.providers = providers
+        self.mode = mode
+        self.order = order
+        self._health: Dict[str, _ProviderHealth] = {}
+
+    def health(self, name: str) -> _ProviderHealth:
+        if name not in self._health:
+            self._health[name] = _ProviderHealth()
+        return self._health[name]
+
+    def candidates(self, primary: str) -> List[TTSProvider]:
+        """The primary provider followed by its configured fallbacks, in the order they would be tried."""
+        first = self.providers.get(primary)
+        if self.mode == "off":
+            return [first]
+        fallbacks = [self.providers.get(name) for name in self.order
+                     if name != first.name and name in self.providers.names()]
+        return [first] + [provider for provider in fallbacks if provider.configured()]
+
+    async def synthesize(self, primary: str, text: str, voice_name: str, language_code: str,
+                         audio_format: str, bitrate: Optional[int]) -> Tuple[bytes, str]:
+        """
+        Complete audio for text from the primary provider or a fallback.
+
+        Returns:
+            (audio, name of the provider that produced it)
+        """
+        async def call(provider: TTSProvider) -> bytes:
+            return await provider.synthesize(text, voice_name, language_code, audio_format, bitrate)
+
+        return await self._route(primary, "synthesize", call)
+
+    async def stream(self, primary: str, text: str, voice_name: str, language_code: str,
+                     audio_format: str, bitrate: Optional[int]) -> Tuple[AsyncIterator[bytes], str]:
+        """
+        Audio chunks for text from whichever provider delivers a first chunk
+        first (hedging and failover apply to the first chunk only).
+
+        Returns:
+            (chunk iterator, name of the provider streaming it)
+        """
+        async def open_stream(provider: TTSProvider) -> Tuple[bytes, AsyncIterator[bytes]]:
+            chunks = provider.stream(text, voice_name, language_code, audio_format, bitrate)
+            try:
+                return await chunks.__anext__(), chunks
+            except StopAsyncIteration:
+                return b"", chunks
+            except BaseException:
+                await chunks.aclose()
+                raise
+
+        async def discard(opened: Tuple[bytes, AsyncIterator[bytes]]):
+            await opened[1].aclose()
+
+        (first_chunk, chunks), name = await self._route(primary, "stream", open_stream, discard)
+
+        async def relay():
+            try:
+                yield first_chunk
+                async for chunk in chunks:
+                    yield chunk
+            finally:
+                await chunks.aclose()
+
+        return relay(), name
+
+    async def _route(self, primary: str, mode: str, call: Callable[[TTSProvider], Awaitable[T]],
+                     discard: Optional[Callable[[T], Awaitable[None]]] = None) -> Tuple[T, str]:
+        candidates = self.candidates(primary)
+        remaining = [provider for provider in candidates if self.health(provider.name).breaker.state != "open"]
+        if not remaining:
+            # Everything is tripped; trying the primary beats failing outright
+            remaining = candidates[:1]
+        pending: Dict[asyncio.Task, Tuple[TTSProvider, float]] = {}
+        error: Optional[BaseException] = None
+
+        def launch():
+            provider = remaining.pop(0)
+            pending[asyncio.create_task(self._attempt(provider, mode, call))] = (provider, time.perf_counter())
+
+        launch()
+        try:
+            while pending:
+                timeout = None
+                if self.mode == "hedge" and remaining and len(pending) == 1:
+                    provider, started = next(iter(pending.values()))
+                    timeout = max(0.0, self.health(provider.name).hedge_delay(mode) - (time.perf_counter() - started))
+                done, _ = await asyncio.wait(pending, timeout=timeout, return_when=asyncio.FIRST_COMPLETED)
+                if not done:
+                    provider, _ = next(iter(pending.values()))
+                    HEDGES.inc(provider=provider.name)
+                    logger.info(f"TTS provider '{provider.name}' is slow, hedging with '{remaining[0].name}'")
+                    launch()
+                    continue
+
+                for task in done:
+                    provider, started = pending.pop(task)
+                    if task.exception() is None:
+                        if provider.name != candidates[0].name:
+                            FAILOVERS.inc(requested=candidates[0].name, provider=provider.name)
+                        for other, other_started in pending.values():
+                            # A cancelled loser took at least this long; keeps slow providers from looking fast
+                            self.health(other.name).latency[mode].append(time.perf_counter() - other_started)
+                        return task.result(), provider.name
+                    error = task.exception()
+                    if _rejected_request(error):
+                        raise error
+                    logger.warning(f"TTS provider '{provider.name}' failed: {error}")
+                if not pending and remaining and self.mode != "off":
+                    launch()
+            raise error
+        finally:
+            for task in pending:
+                task.cancel()
+                if discard is not None:
+                    task.add_done_callback(lambda task: _discard_result(task, discard))
+
+    async def _attempt(self, provider: TTSProvider, mode: str, call: Callable[[TTSProvider], Awaitable[T]]) -> T:
+        health = self.health(provider.name)
+        if not health.breaker.allow():
+            raise TTSProviderError(f"TTS provider '{provider.name}' is temporarily disabled after repeated failures", 503)
+        started = time.perf_counter()
+        try:
+            result = await call(provider)
+        except asyncio.CancelledError:
+            health.breaker.release()
+            raise
+        except Exception as e:
+            if _rejected_request(e):
+                health.breaker.release()
+            elif health.breaker.record_failure():
+                BREAKER_TRIPS.inc(provider=provider.name)
+                logger.warning(f"TTS provider '{provider.name}' disabled for {health.breaker.reset_after:.0f}s "
+                               f"after {health.breaker.consecutive_failures} consecutive failures")
+            raise
+        health.breaker.record_success()
+        health.latency[mode].append(time.perf_counter() - started)
+        return result
+
+    def stats(self) -> dict:
+        providers = {}
+        for name in self.providers.names():
+            health = self.health(name)
+            providers[name] = {
+                "breaker": health.breaker.state,
+                "consecutive_failures": health.breaker.consecutive_failures,
+                "hedge_after_seconds": {mode: round(health.hedge_delay(mode), 3) for mode in health.latency},
+                "samples": {mode: len(samples) for mode, samples in health.latency.items()},
+                "hedges": HEDGES.value(provider=name),
+                "breaker_trips": BREAKER_TRIPS.value(provider=name),
+            }
+        return {"mode": self.mode, "order": self.order, "providers": providers}
+
+
+def _discard_result(task: asyncio.Task, discard: Callable[[T], Awaitable[None]]):
+    # A loser that finished before it could be cancelled still holds resources (e.g. an open stream)
+    if not task.cancelled() and task.exception() is None:
+        asyncio.ensure_future(discard(task.result()))
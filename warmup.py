@@ -0,0 +1,80 @@
+"""
+Background warmup at startup and the readiness it gates.
+
+With APP_WARMUP=1 (default) the server accepts connections straight away and
+warms up in the background: agent.py (and google.adk) is imported and the
+model client built, TTS SDKs are imported and their clients created, the Rfam
+pool is opened and common phrases are synthesized into the TTS cache. GET
+/ready answers 503 until every step has finished, successfully or not, so
+traffic is only routed to a warm instance.
+"""
+import asyncio
+import logging
+import os
+import time
+from typing import Awaitable, Callable, Dict, List, Tuple
+
+from router import GOODBYE
+
+logger = logging.getLogger(__name__)
+
+WARMUP_ENABLED = os.environ.get("APP_WARMUP", "1") == "1"
+WARMUP_STEP_TIMEOUT = float(os.environ.get("APP_WARMUP_STEP_TIMEOUT", "60"))
+# Replies spoken often enough to be worth having in the TTS cache, separated by "|"
+WARMUP_PHRASES = [phrase.strip() for phrase in os.environ.get(
+    "APP_WARMUP_PHRASES", f"{GOODBYE}|Is there anything else?|Can I help you with anything else?"
+).split("|") if phrase.strip()]
+# Formats the page asks for: Ogg/Opus where the browser plays it, MP3 otherwise
+WARMUP_FORMATS = [name.strip() for name in os.environ.get("APP_WARMUP_TTS_FORMATS", "opus,mp3").split(",") if name.strip()]
+
+Step = Tuple[str, Callable[[], Awaitable[None]]]
+
+
+class Warmup:
+    """Runs named warmup steps concurrently and records how each one went."""
+
+    def __init__(self, enabled: bool = WARMUP_ENABLED, step_timeout: float = WARMUP_STEP_TIMEOUT):
+        self.enabled = enabled
+        self.step_timeout = step_timeout
+        self.steps: Dict[str, dict] = {}
+        self.started_at = time.monotonic()
+        self.finished_at = None
+
+    @property
+    def ready(self) -> bool:
+        return self.finished_at is not None
+
+    async def run(self, steps: List[Step]):
+        """Run every step; failures and timeouts are logged and reported by stats(), never raised."""
+        self.started_at = time.monotonic()
+        if self.enabled:
+            self.steps = {name: {"status": "running"} for name, _ in steps}
+            await asyncio.gather(*(self._run_step(name, step) for name, step in steps))
+        else:
+            self.steps = {name: {"status": "skipped"} for name, _ in steps}
+        self.finished_at = time.monotonic()
+        logger.info(f"Warmup finished in {self.finished_at - self.started_at:.2f}s: "
+                    + ", ".join(f"{name}={result['status']}" for name, result in self.steps.items()))
+
+    async def _run_step(self, name: str, step: Callable[[], Awaitable[None]]):
+        started = time.perf_counter()
+        result = {"status": "ok"}
+        try:
+            await asyncio.wait_for(step(), self.step_timeout)
+        except asyncio.TimeoutError:
+            result = {"status": "timeout"}
+            logger.warning(f"Warmup step '{name}' timed out after {self.step_timeout:.0f}s")
+        except Exception as e:
+            result = {"status": "failed", "error": str(e)}
+            logger.warning(f"Warmup step '{name}' failed: {e}")
+        result["seconds"] = round(time.perf_counter() - started, 3)
+        self.steps[name] = result
+
+    def stats(self) -> dict:
+        end = self.finished_at if self.finished_at is not None else time.monotonic()
+        return {
+            "ready": self.ready,
+            "warmup": self.enabled,
+            "seconds": round(end - self.started_at, 3),
+            "steps": self.steps,
+        }